@@ -1,9 +1,13 @@
 """Mesop app component"""
+# pylint: disable=import-outside-toplevel,invalid-name
+import os
+import threading
 from enum import Enum
 import mesop as me
 from mesop_components.mesop_chat import chat
-from backend.core.chat import RAGApp
+from backend.core.conversation_store import InMemoryConversationStore, SQLiteConversationStore
 from backend.config import GEMINI_API_KEY
+from backend.ml_config import STARTUP_CONFIGS, INGESTION_CONFIGS, DEDUP_CONFIGS
 
 class ModelOptions(Enum):
     """Options for model picker"""
@@ -17,11 +21,65 @@ model_mapping = {
     ModelOptions.GEMINI_1_5_FLASH: "Gemini 1.5 Flash",
 }
 
-# Can pass model key and params to this
-rag_instance = RAGApp({
-   "model": "gemini-2.0-flash",
-   "gemini_api_key": GEMINI_API_KEY
-})
+# Multi worker serving (gunicorn.conf.py) shares sessions between workers using sqlite
+if os.environ.get("RAG_SESSION_DB"):
+    conversation_store = SQLiteConversationStore(db_path=os.environ["RAG_SESSION_DB"])
+else:
+    conversation_store = InMemoryConversationStore()
+
+rag_instance = None
+rag_instance_lock = threading.Lock()
+
+def get_rag_instance():
+    """Get rag app, backend is imported and built on first use"""
+    global rag_instance # pylint: disable=global-statement
+    with rag_instance_lock:
+        if rag_instance is None:
+            from backend.core.chat import RAGApp
+            # Can pass model key and params to this
+            rag_instance = RAGApp({
+               "model": "gemini-2.0-flash",
+               "gemini_api_key": GEMINI_API_KEY,
+               "conversation_store": conversation_store
+            })
+
+    return rag_instance
+
+def warm_up():
+    """Build rag app and its clients ahead of the first request"""
+    get_rag_instance().warm_up()
+
+def generate_rag_response(user_input: str, session_id: str):
+    """Generates responses using the rag app"""
+    return get_rag_instance().generate_rag_response(user_input, session_id)
+
+ingestion_service = None
+if INGESTION_CONFIGS["enabled"]:
+    from backend.core.ingestion import IngestionService, is_multi_worker
+    from backend.core.dedup import NearDuplicateDetector
+    if is_multi_worker():
+        # Every gunicorn worker imports the app, milvus lite db cannot be written by all of them
+        print("Ingestion is disabled with multiple workers, serve with RAG_WORKERS=1 to "
+              "ingest documents.")
+    else:
+        deduplicator = None
+        if DEDUP_CONFIGS["enabled"]:
+            deduplicator = NearDuplicateDetector(threshold=DEDUP_CONFIGS["threshold"],
+                                                 num_perm=DEDUP_CONFIGS["num_perm"],
+                                                 bands=DEDUP_CONFIGS["bands"],
+                                                 shingle_size=DEDUP_CONFIGS["shingle_size"])
+        ingestion_service = IngestionService(watch_dir=INGESTION_CONFIGS["watch_dir"],
+                                             poll_interval=INGESTION_CONFIGS["poll_interval"],
+                                             queue_size=INGESTION_CONFIGS["queue_size"],
+                                             embed_workers=INGESTION_CONFIGS["embed_workers"],
+                                             deduplicator=deduplicator,
+                                             dedup_index_path=DEDUP_CONFIGS["index_path"])
+        threading.Thread(target=ingestion_service.start, daemon=True).start()
+
+if not STARTUP_CONFIGS["lazy_startup"]:
+    warm_up()
+elif STARTUP_CONFIGS["warm_up_on_start"]:
+    threading.Thread(target=warm_up, daemon=True).start()
 
 CHAT_CONTAINER_STYLE = me.Style(
    background=me.theme_var("surface"),
@@ -142,7 +200,8 @@ def chat_container():
     """Display chat container"""
     state = me.state(State)
     with me.box(style=CHAT_CONTAINER_STYLE):
-        chat(rag_instance.generate_rag_response,
+        chat(generate_rag_response,
+             store=conversation_store,
              title="Good Morning, Ruths",
              bot_user="Assistant",
              reset=state.is_new_conversation)
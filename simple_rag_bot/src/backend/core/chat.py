@@ -1,18 +1,25 @@
 """Main logic for chat with rag bot"""
+# pylint: disable=import-outside-toplevel
 import json
+import time
 import logging
 from typing import List, Annotated, Sequence
 from typing_extensions import TypedDict
 from backend.core.prompts import router_prompt,rag_prompt, query_rewrite_prompt, chitchat_prompt
-from backend.core.tools import get_relevant_docs_tool
-from backend.ml_config import LLM_CONFIGS
-from backend.utils.utility import format_sources, format_citations, format_chat_messages
-from langchain_google_genai import ChatGoogleGenerativeAI
+from backend.core.prompts import multi_query_prompt
+from backend.core.tools import get_relevant_docs_tool, warm_up_clients
+from backend.core.tools import get_relevant_docs_multi_query, expand_relevant_docs
+from backend.core.tools import get_citation_store
+from backend.core.multi_query import parse_queries
+from backend.core.conversation_store import InMemoryConversationStore
+from backend.core.compression import SourceCompressor
+from backend.ml_config import LLM_CONFIGS, LLM_CACHE_CONFIGS
+from backend.ml_config import COMPRESSION_CONFIGS, MULTI_QUERY_CONFIGS
+from backend.utils.utility import format_sources, format_citations
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, ToolMessage
 from langgraph.graph.message import add_messages
 from langgraph.graph import END, StateGraph, START
-from langgraph.prebuilt import ToolNode
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(
@@ -45,16 +52,48 @@ class RAGApp():
         logger.info("Initializing rag app...")
         self.gemini_api_key = params.get("gemini_api_key")
         self.model_key = params.get("model")
-        self.chat_model = ChatGoogleGenerativeAI(**LLM_CONFIGS[self.model_key],
-                                                 google_api_key=self.gemini_api_key)
+        self.conversation_store = params.get("conversation_store") or InMemoryConversationStore()
+        # Chat model can be passed in params, e.g. a fake model for benchmarks
+        self.chat_model = params.get("chat_model") or self._create_chat_model()
+        self.source_compressor = None
+        if COMPRESSION_CONFIGS["enabled"]:
+            token_budget = COMPRESSION_CONFIGS["token_budget"]
+            self.source_compressor = SourceCompressor(token_budget=token_budget)
 
         self.rag_chain = rag_prompt | self.chat_model | StrOutputParser()
         self.rewrite_chain = query_rewrite_prompt | self.chat_model | StrOutputParser()
         self.chitchat_chain = chitchat_prompt | self.chat_model | StrOutputParser()
         self.router_chain = router_prompt | self.chat_model.bind_tools(tools)
+        self.multi_query_chain = multi_query_prompt | self.chat_model | StrOutputParser()
+        self.multi_query = params.get("multi_query", MULTI_QUERY_CONFIGS["enabled"])
 
         self.graph = self._build_workflow_graph()
 
+    def _create_chat_model(self):
+        """Create gemini chat model, imported here as it is slow to import"""
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        return ChatGoogleGenerativeAI(**LLM_CONFIGS[self.model_key],
+                                      google_api_key=self.gemini_api_key,
+                                      cache=self._create_llm_cache(LLM_CONFIGS[self.model_key]))
+
+    def _create_llm_cache(self, llm_configs: dict):
+        """Create response cache for deterministic models, None for non zero temperature"""
+        if not LLM_CACHE_CONFIGS["enabled"] or llm_configs.get("temperature") != 0:
+            return None
+        from backend.core.llm_cache import SQLiteLLMCache
+        logger.info("Using llm response cache.")
+
+        return SQLiteLLMCache(db_path=LLM_CACHE_CONFIGS["db_path"],
+                              max_entries=LLM_CACHE_CONFIGS["max_entries"],
+                              ttl_seconds=LLM_CACHE_CONFIGS["ttl_seconds"])
+
+    def warm_up(self):
+        """Create tool clients and open the vector db ahead of the first request"""
+        logger.info("Warming up rag app...")
+        warm_up_clients()
+        logger.info("Warm up complete.")
+
     def rewrite(self, state):
         """Rewrite query based on chat history"""
 
@@ -167,6 +206,47 @@ class RAGApp():
                     return "other_tool"
         return "chit_chat"
 
+    def multi_query_retrieve(self, state):
+        """Retrieve docs using variations of the query generated in a single llm call"""
+
+        logger.info("---CALL MULTI QUERY RETRIEVER---")
+        tool_call = next(tool_call for tool_call in state["tool_call"]
+                         if tool_call.get("name") == "get_relevant_docs_tool")
+        question = tool_call["args"]["query"]
+        num_queries = MULTI_QUERY_CONFIGS["num_queries"]
+
+        variations = self.multi_query_chain.invoke({
+            "question": question,
+            "num_queries": num_queries
+        })
+        queries = parse_queries(variations, question, num_queries=num_queries)
+        logger.info(f"---QUERIES---\n{queries}")
+
+        relevant_docs = get_relevant_docs_multi_query(
+            queries,
+            top_n=MULTI_QUERY_CONFIGS["top_n"],
+            rrf_k=MULTI_QUERY_CONFIGS["rrf_k"],
+            max_workers=MULTI_QUERY_CONFIGS["max_workers"]
+        )
+        relevant_docs = expand_relevant_docs(relevant_docs)
+
+        step_trace = {
+            "NODE": "MULTI QUERY RETRIEVER",
+            "STEP 1": {
+                "input": multi_query_prompt.format(question=question, num_queries=num_queries),
+                "output": variations
+            },
+            "queries": queries
+        }
+
+        # Same message as the tool node, so generate works with either retriever
+        return {
+            "messages": [ToolMessage(content=json.dumps(relevant_docs),
+                                     name=tool_call["name"],
+                                     tool_call_id=tool_call["id"])],
+            "steps": step_trace
+        }
+
     def chit_chat(self, state):
         """Handle chit chat"""
 
@@ -235,10 +315,18 @@ class RAGApp():
             logger.info(f"---USING REWRITTEN QUERY---\n{rewritten_query}")
             user_query = rewritten_query
 
-        sources = format_sources(tool_response)
         step_trace.update({
             "Retriever Results": tool_response
         })
+        compressed_response = tool_response
+        if self.source_compressor:
+            compressed_response, compression_report = self.source_compressor.compress(tool_response,
+                                                                                      user_query)
+            logger.info(f"---SOURCE COMPRESSION---\n{compression_report}")
+            step_trace.update({
+                "Source Compression": compression_report
+            })
+        sources = format_sources(compressed_response)
 
         response = self.rag_chain.invoke({
             "sources": sources,
@@ -260,7 +348,7 @@ class RAGApp():
         return {
             "messages": [AIMessage(content=response)],
             "chat_messages": [AIMessage(content=response)],
-            "relevant_docs": format_citations(tool_response),
+            "relevant_docs": format_citations(tool_response, citation_store=get_citation_store()),
             "bot_response": response,
             "rewritten_query": rewritten_query,
             "steps": step_trace
@@ -268,11 +356,15 @@ class RAGApp():
 
     def _build_workflow_graph(self):
         """Build graph"""
+        from langgraph.prebuilt import ToolNode
+
         workflow = StateGraph(AgentState)
 
         workflow.add_node("router", self.router)
-        retriever = ToolNode([get_relevant_docs_tool])
-        workflow.add_node("retriever", retriever)
+        if self.multi_query:
+            workflow.add_node("retriever", self.multi_query_retrieve)
+        else:
+            workflow.add_node("retriever", ToolNode([get_relevant_docs_tool]))
         workflow.add_node("rewrite", self.rewrite)
         workflow.add_node("generate", self.generate)
         workflow.add_node("chit_chat", self.chit_chat)
@@ -296,27 +388,46 @@ class RAGApp():
 
         return graph
 
-    def chat_session(self, query, chat_history):
-        """Create session to chat with the graph"""
+    def chat_session(self, query, chat_history, node_timings: dict=None):
+        """Create session to chat with the graph.
+        If node_timings dict is passed, seconds taken by every node are added to it"""
         user_input = {
             "messages": [HumanMessage(content=query)],
             "chat_history": chat_history,
             "steps": []
         }
 
-        graph_response = self.graph.invoke(user_input)
+        if node_timings is None:
+            graph_response = self.graph.invoke(user_input)
+        else:
+            graph_response = self._timed_invoke(user_input, node_timings)
 
         return graph_response.get("bot_response"), graph_response.get("relevant_docs"), graph_response.get("steps") # pylint: disable=line-too-long
 
-    def generate_rag_response(self, user_input: str, history: list):
-        """Generates responses using input and history"""
-
-        # mesop_chat adds user message to the history for 1st message.
-        # Chat history should be added after completion of turn, so ignoring first addition.
-        if len(history) == 1:
-            history = []
-        formatted_messages = format_chat_messages(history)
-        bot_response, citations, diagnostic_info = self.chat_session(user_input, formatted_messages)
+    def _timed_invoke(self, user_input: dict, node_timings: dict):
+        """Invoke graph by streaming node updates, nodes run one after another so the time
+        between updates is the time taken by the node"""
+        graph_response = None
+        last_time = time.perf_counter()
+        for mode, chunk in self.graph.stream(user_input, stream_mode=["updates", "values"]):
+            if mode == "updates":
+                current_time = time.perf_counter()
+                for node in chunk:
+                    node_timings[node] = current_time - last_time
+                last_time = current_time
+            else:
+                graph_response = chunk
+
+        return graph_response
+
+    def generate_rag_response(self, user_input: str, session_id: str, node_timings: dict=None):
+        """Generates responses using input and history of the session"""
+
+        # Chat history is added to the store after completion of turn, already in llm format
+        chat_history = self.conversation_store.get_chat_history(session_id)
+        bot_response, citations, diagnostic_info = self.chat_session(user_input, chat_history,
+                                                                     node_timings=node_timings)
+        self.conversation_store.add_turn(session_id, user_input, bot_response)
 
         if citations:
             response = {
@@ -334,7 +445,7 @@ class RAGApp():
             }
         return response
 
-def generate_response(user_input: str, history: list):
+def generate_response(user_input: str, session_id: str):
     """Testing function"""
     if "citations" in user_input:
         response = {
@@ -0,0 +1,139 @@
+"""Modules for expanding retrieved chunks with their neighbouring chunks"""
+import json
+
+def chunk_position(chunk_id: str):
+    """Position of the chunk in its document, chunk ids are of format {doc_id}/chunks/c{i}"""
+    return int(chunk_id.rsplit("/c", 1)[1])
+
+class ChunkIndex:
+    """Key value index of chunks by (doc_id, position) in the document.
+    Used to expand a retrieved chunk to its neighbours without another vector search."""
+    def __init__(self, chunks_data: list):
+        """Initialize index with chunks created during setup"""
+        self.chunks = {}
+        self.add_chunks(chunks_data)
+
+    def add_chunks(self, chunks_data: list):
+        """Add chunks to the index, older chunks of the same documents are replaced"""
+        doc_ids = {chunk["doc_id"] for chunk in chunks_data}
+        for key in [key for key in self.chunks if key[0] in doc_ids]:
+            del self.chunks[key]
+        for chunk in chunks_data:
+            self.chunks[(chunk["doc_id"], chunk_position(chunk["chunk_id"]))] = chunk
+
+    @classmethod
+    def from_file(cls, chunks_path: str):
+        """Load index from the chunks jsonl file saved during setup.
+        Ingested documents are appended to the file, the latest chunks of a document are kept"""
+        chunks_by_doc = {}
+        previous_doc_id = None
+        with open(chunks_path, "r") as chunks_file:
+            for line in chunks_file:
+                chunk = json.loads(line)
+                if chunk["doc_id"] != previous_doc_id:
+                    # Chunks of a document are written together, a new run is a new version
+                    chunks_by_doc[chunk["doc_id"]] = []
+                    previous_doc_id = chunk["doc_id"]
+                chunks_by_doc[chunk["doc_id"]].append(chunk)
+
+        return cls([chunk for chunks in chunks_by_doc.values() for chunk in chunks])
+
+    def get_chunk(self, chunk_id: str):
+        """Get chunk by its id, None if missing"""
+        return self.chunks.get((chunk_id.rsplit("/chunks/", 1)[0], chunk_position(chunk_id)))
+
+    def hydrate_hits(self, relevant_docs: list, output_fields: list):
+        """Fill the entity of hits retrieved with ids and scores only.
+        Hits not found in the index are dropped."""
+        hits = []
+        for hit in relevant_docs[0]:
+            chunk = self.get_chunk(hit["id"])
+            if chunk is None:
+                print(f"Chunk {hit['id']} not found in chunk index, skipping it.")
+                continue
+            hits.append({**hit, "entity": {field: chunk[field] for field in output_fields}})
+
+        return [hits]
+
+    def get_neighbours(self, doc_id: str, position: int, window: int=1):
+        """Get the chunk and up to `window` chunks on either side, in document order.
+        Stops at a missing position, so the chunks are contiguous with the given chunk"""
+        start = position
+        while start > position - window and (doc_id, start - 1) in self.chunks:
+            start -= 1
+        end = position
+        while end < position + window and (doc_id, end + 1) in self.chunks:
+            end += 1
+
+        return [self.chunks[(doc_id, neighbour)] for neighbour in range(start, end + 1)]
+
+    def _stitch(self, chunks: list):
+        """Join consecutive chunks of a document into one passage, overlapping text is kept once"""
+        content = chunks[0]["content"]
+        end = chunks[0]["chunk_metadata"]["end_char_idx"]
+        page_span = set(chunks[0]["page_span"])
+        for chunk in chunks[1:]:
+            start = chunk["chunk_metadata"]["start_char_idx"]
+            if start <= end:
+                content += chunk["content"][end - start:]
+            else:
+                content += "\n" + chunk["content"]
+            end = max(end, chunk["chunk_metadata"]["end_char_idx"])
+            page_span.update(chunk["page_span"])
+
+        return {
+            "doc_id": chunks[0]["doc_id"],
+            "content": content,
+            "page_span": sorted(page_span),
+            "chunk_metadata": {
+                "start_char_idx": chunks[0]["chunk_metadata"]["start_char_idx"],
+                "end_char_idx": end
+            },
+            "document_metadata": chunks[0]["document_metadata"]
+        }
+
+    def expand_hits(self, relevant_docs: list, window: int=1):
+        """Expand every hit with its neighbouring chunks and return contiguous passages.
+        Hits whose neighbourhoods touch are joined, passage gets the id and score of its best hit.
+        Hits not found in the index are returned as is."""
+        passages = []
+        positions = {}
+        best_hits = {}
+        for hit in relevant_docs[0]:
+            doc_id = hit["entity"].get("doc_id")
+            if (doc_id, chunk_position(hit["id"])) not in self.chunks:
+                passages.append(hit)
+                continue
+            position = chunk_position(hit["id"])
+            positions.setdefault(doc_id, set()).update(
+                chunk_position(chunk["chunk_id"])
+                for chunk in self.get_neighbours(doc_id, position, window)
+            )
+            best_hits.setdefault(doc_id, {})[position] = hit
+
+        for doc_id, doc_positions in positions.items():
+            # Consecutive positions form one passage
+            run = []
+            for position in sorted(doc_positions):
+                if run and position != run[-1] + 1:
+                    passages.append(self._build_passage(doc_id, run, best_hits[doc_id]))
+                    run = []
+                run.append(position)
+            passages.append(self._build_passage(doc_id, run, best_hits[doc_id]))
+
+        return [sorted(passages, key=lambda passage: passage["distance"], reverse=True)]
+
+    def _build_passage(self, doc_id: str, run: list, doc_hits: dict):
+        """Create hit for a run of consecutive chunk positions"""
+        best_hit = max((doc_hits[position] for position in run if position in doc_hits),
+                       key=lambda hit: hit["distance"])
+
+        return {
+            "id": best_hit["id"],
+            "distance": best_hit["distance"],
+            "entity": {
+                **best_hit["entity"],
+                **self._stitch([self.chunks[(doc_id, position)] for position in run])
+            },
+            "expanded_ids": [self.chunks[(doc_id, position)]["chunk_id"] for position in run]
+        }
@@ -1,9 +1,19 @@
 """Modules for chunking local files"""
+import os
 import uuid
+from urllib.parse import unquote
 from tqdm import tqdm
 import fitz
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+def document_id(document_url: str):
+    """Id of a document from its url or file path, the same document always gets the same id,
+    so chunks of a document ingested again replace the ones created during setup"""
+    if "://" not in document_url:
+        document_url = os.path.abspath(document_url)
+
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, document_url))
+
 class PDFTextSplitter:
     """Document splitter class for pdf text"""
 
@@ -25,9 +35,10 @@ class PDFTextSplitter:
 
         return cleaned_text
 
-    def get_page_info(self, pdf_path: str):
-        """Get full text content of pdf and page info"""
-        doc_id = str(uuid.uuid4())
+    def get_page_info(self, pdf_path: str, document_url: str=None):
+        """Get full text content of pdf and page info.
+        Document url is used for the doc id of files downloaded from remote sources"""
+        doc_id = document_id(document_url or pdf_path)
         full_text = ""
         page_info = []
 
@@ -91,7 +102,8 @@ class PDFTextSplitter:
                 "document_metadata": {
                     "url": pdf_uri,
                     # Since windows uses \ paths instead of /, the logic below is modified
-                    "title": pdf_uri.split("/")[-1]
+                    # Remote urls are percent encoded
+                    "title": unquote(pdf_uri.split("/")[-1])
                     # "title": pdf_uri.split("\\")[-1]
                 }
             }
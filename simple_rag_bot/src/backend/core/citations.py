@@ -0,0 +1,52 @@
+"""Modules for citation records precomputed during ingestion"""
+import os
+import json
+from backend.utils.utility import build_citation
+
+def relative_url(url: str, documents_dir: str):
+    """Url of a local file relative to the documents dir, other urls are returned as is"""
+    path, separator, fragment = url.partition("#")
+    documents_dir = os.path.abspath(documents_dir)
+    if "://" in path or not os.path.abspath(path).startswith(documents_dir + os.sep):
+        return url
+
+    return os.path.relpath(os.path.abspath(path), documents_dir).replace(os.sep, "/") + \
+        separator + fragment
+
+def build_citations(chunks_data: list, preview_length: int=150, documents_dir: str=None):
+    """Create citation records for the chunks.
+    Urls of files in the documents dir are saved relative to it, so the records do not
+    depend on the folder the corpus was set up in"""
+    citations = [build_citation(chunk["chunk_id"], chunk, preview_length=preview_length)
+                 for chunk in chunks_data]
+    if documents_dir:
+        for citation in citations:
+            citation["url"] = relative_url(citation["url"], documents_dir)
+
+    return citations
+
+class CitationStore:
+    """Key value store of citation records by chunk id"""
+    def __init__(self, citations: list):
+        """Initialize store with citation records"""
+        self.citations = {}
+        self.add_citations(citations)
+
+    @classmethod
+    def from_file(cls, citations_path: str):
+        """Load store from the citations jsonl file saved during setup"""
+        with open(citations_path, "r") as citations_file:
+            citations = [json.loads(line) for line in citations_file]
+
+        return cls(citations)
+
+    def add_citations(self, citations: list):
+        """Add or replace citation records"""
+        for citation in citations:
+            self.citations[citation["id"]] = citation
+
+    def get(self, chunk_id: str):
+        """Get copy of the citation record of a chunk, None if missing"""
+        citation = self.citations.get(chunk_id)
+
+        return dict(citation) if citation else None
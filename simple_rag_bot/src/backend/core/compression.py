@@ -0,0 +1,137 @@
+"""Modules for compressing retrieved sources before generation"""
+import re
+import math
+
+SENTENCE_SPLIT_PATTERN = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how",
+    "i", "in", "is", "it", "me", "of", "on", "or", "should", "that", "the", "this", "to", "what",
+    "when", "where", "which", "who", "why", "with", "you", "your"
+}
+
+def estimate_tokens(text: str):
+    """Approximate number of llm tokens in the text, ~4 characters per token"""
+    return math.ceil(len(text) / 4)
+
+def _terms(text: str):
+    """Lower case words of the text without stop words"""
+    return {word for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in STOP_WORDS}
+
+class SourceCompressor:
+    """Compresses retrieved chunks into fewer tokens before they are sent to the llm.
+    1. Merges chunks of the same document that overlap or are contiguous, using char offsets.
+    2. If the merged sources are over the token budget, keeps the sentences most relevant to
+    the query in their original order."""
+    def __init__(self, token_budget: int=1500):
+        """Initialize compressor with maximum tokens of all sources"""
+        self.token_budget = token_budget
+
+    def merge_chunks(self, hits: list):
+        """Merge overlapping and contiguous chunks of the same document into passages.
+        Returns passages in the same format as retrieved hits, best scoring passage first."""
+        passages = []
+        groups = {}
+        for hit in hits:
+            entity = hit["entity"]
+            chunk_metadata = entity.get("chunk_metadata")
+            if not entity.get("doc_id") or not chunk_metadata:
+                # Offsets are not available, chunk is used as is
+                passages.append(hit)
+                continue
+            groups.setdefault(entity["doc_id"], []).append(hit)
+
+        for doc_hits in groups.values():
+            doc_hits = sorted(doc_hits, key=lambda hit: hit["entity"]["chunk_metadata"]["start_char_idx"]) # pylint: disable=line-too-long
+            passage = {}
+            for hit in doc_hits:
+                start = hit["entity"]["chunk_metadata"]["start_char_idx"]
+                end = hit["entity"]["chunk_metadata"]["end_char_idx"]
+                if passage and start <= passage["end"]:
+                    # Only the part after the end of the passage is new content
+                    passage["entity"]["content"] += hit["entity"]["content"][passage["end"] - start:] # pylint: disable=line-too-long
+                    passage["end"] = max(passage["end"], end)
+                    passage["distance"] = max(passage["distance"], hit["distance"])
+                    passage["merged_ids"].append(hit["id"])
+                else:
+                    passage = {
+                        "id": hit["id"],
+                        "distance": hit["distance"],
+                        "entity": dict(hit["entity"]),
+                        "end": end,
+                        "merged_ids": [hit["id"]]
+                    }
+                    passages.append(passage)
+
+        return sorted(passages, key=lambda passage: passage["distance"], reverse=True)
+
+    def trim_to_budget(self, passages: list, query: str):
+        """Keep the sentences most relevant to the query within the token budget.
+        The most relevant sentence is always kept, cut to the budget if it is longer"""
+        if sum(estimate_tokens(p["entity"]["content"]) for p in passages) <= self.token_budget:
+            return passages
+
+        selected = []
+        used_tokens = 0
+        for sentence in sorted(self._score_sentences(passages, query),
+                               key=lambda sentence: sentence["score"], reverse=True):
+            sentence_tokens = estimate_tokens(sentence["text"])
+            if not selected and sentence_tokens > self.token_budget:
+                # Generation is never run without sources
+                sentence["text"] = sentence["text"][:self.token_budget * 4]
+                sentence_tokens = self.token_budget
+            if used_tokens + sentence_tokens <= self.token_budget:
+                selected.append(sentence)
+                used_tokens += sentence_tokens
+
+        trimmed_passages = []
+        for passage_rank, passage in enumerate(passages):
+            passage_sentences = sorted((sentence for sentence in selected
+                                        if sentence["passage_rank"] == passage_rank),
+                                       key=lambda sentence: sentence["position"])
+            if passage_sentences:
+                trimmed_passage = dict(passage)
+                trimmed_passage["entity"] = dict(passage["entity"])
+                trimmed_passage["entity"]["content"] = " ".join(sentence["text"]
+                                                                for sentence in passage_sentences)
+                trimmed_passages.append(trimmed_passage)
+
+        return trimmed_passages
+
+    def _score_sentences(self, passages: list, query: str):
+        """Split passages into sentences and score them by overlap with the query terms"""
+        query_terms = _terms(query)
+        sentences = []
+        for passage_rank, passage in enumerate(passages):
+            for position, sentence in enumerate(SENTENCE_SPLIT_PATTERN.split(passage["entity"]["content"])): # pylint: disable=line-too-long
+                if not sentence.strip():
+                    continue
+                overlap = len(query_terms & _terms(sentence)) / max(len(query_terms), 1)
+                # Ties are broken in favour of better ranked passages and earlier sentences
+                sentences.append({
+                    "passage_rank": passage_rank,
+                    "position": position,
+                    "text": sentence.strip(),
+                    "score": overlap - 0.01 * passage_rank,
+                })
+
+        return sentences
+
+    def compress(self, relevant_docs: list, query: str):
+        """Compress retrieved docs for the query.
+        Returns compressed docs in the same format as retrieved docs and a report of tokens saved"""
+        hits = relevant_docs[0]
+        original_tokens = sum(estimate_tokens(hit["entity"]["content"]) for hit in hits)
+
+        passages = self.trim_to_budget(self.merge_chunks(hits), query)
+        compressed_tokens = sum(estimate_tokens(passage["entity"]["content"])
+                                for passage in passages)
+
+        report = {
+            "num_chunks": len(hits),
+            "num_passages": len(passages),
+            "original_tokens": original_tokens,
+            "compressed_tokens": compressed_tokens,
+            "tokens_saved": original_tokens - compressed_tokens
+        }
+
+        return [passages], report
@@ -0,0 +1,287 @@
+"""Modules for server side conversation store"""
+import os
+import json
+import time
+import uuid
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+from langchain_core.messages import HumanMessage, AIMessage
+
+def summarize_turn(user_message: str, bot_message: str, preview_length: int=150):
+    """Short summary of a turn dropped from the chat history"""
+    def preview(text: str):
+        """First characters of the text on one line"""
+        text = " ".join(text.split())
+        return text if len(text) <= preview_length else text[:preview_length] + "..."
+
+    return f"User asked: {preview(user_message)} Assistant answered: {preview(bot_message)}"
+
+def with_summary(summary: list, chat_history: list):
+    """Chat history preceded by the summary of older turns.
+    Summary is added as a question and answer, so user and assistant messages alternate"""
+    if not summary:
+        return chat_history
+
+    return [HumanMessage(content="What did we talk about earlier?"),
+            AIMessage(content="Summary of our earlier conversation:\n" + "\n".join(summary))
+           ] + chat_history
+
+class InMemoryConversationStore:
+    """In memory conversation store keyed by session id, least recently used sessions are
+    evicted first.
+    Each session keeps the messages displayed in UI and the chat history already converted to
+    llm consumable messages, so UI state only needs to carry the session id.
+    Chat history keeps the latest `max_history_messages`, older turns are replaced by a
+    summary of the latest `max_summary_turns` of them."""
+    def __init__(self, max_sessions: int=1000, max_history_messages: int=20,
+                 max_summary_turns: int=10):
+        """Initialize store with maximum sessions to keep and history length sent to llm"""
+        self.max_sessions = max_sessions
+        self.max_history_messages = max_history_messages
+        self.max_summary_turns = max_summary_turns
+        self._sessions = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _get_session(self, session_id: str):
+        """Get session data, creates an empty session if missing or evicted"""
+        with self._lock:
+            if session_id not in self._sessions:
+                self._sessions[session_id] = {
+                    "messages": [],
+                    "chat_history": [],
+                    "summary": []
+                }
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            self._sessions.move_to_end(session_id)
+
+            return self._sessions[session_id]
+
+    def create_session(self):
+        """Create new session and return its id"""
+        session_id = uuid.uuid4().hex
+        self._get_session(session_id)
+
+        return session_id
+
+    def delete_session(self, session_id: str):
+        """Remove session from store"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def add_message(self, session_id: str, message):
+        """Add message displayed in UI to the session"""
+        with self._lock:
+            self._get_session(session_id)["messages"].append(message)
+
+    def count_messages(self, session_id: str):
+        """Get number of messages displayed in UI for the session"""
+        with self._lock:
+            return len(self._get_session(session_id)["messages"])
+
+    def get_messages(self, session_id: str, limit: int=None, offset: int=0):
+        """Get latest `limit` messages displayed in UI for the session (all if None),
+        skipping the `offset` latest ones"""
+        with self._lock:
+            messages = self._get_session(session_id)["messages"]
+            end = len(messages) - offset
+            start = 0 if limit is None else max(0, end - limit)
+            return messages[start:max(0, end)]
+
+    def add_turn(self, session_id: str, user_message: str, bot_message: str):
+        """Add completed user and bot turn to the chat history of the session.
+        Turns older than the history window are summarized and dropped"""
+        with self._lock:
+            session = self._get_session(session_id)
+            session["chat_history"].extend([HumanMessage(content=user_message),
+                                            AIMessage(content=bot_message)])
+            while len(session["chat_history"]) > self.max_history_messages:
+                old_user_message, old_bot_message = session["chat_history"][:2]
+                del session["chat_history"][:2]
+                session["summary"].append(summarize_turn(old_user_message.content,
+                                                         old_bot_message.content))
+            session["summary"] = session["summary"][-self.max_summary_turns:]
+
+    def get_chat_history(self, session_id: str):
+        """Get summary of older turns and latest chat history of the session in llm
+        consumable format"""
+        with self._lock:
+            session = self._get_session(session_id)
+            return with_summary(session["summary"], list(session["chat_history"]))
+
+class SQLiteConversationStore:
+    """SQLite backed conversation store with the same interface as InMemoryConversationStore.
+    Sessions are shared between worker processes, so any worker can serve any session.
+    Least recently used sessions are evicted when a new session is created.
+    Only the history window is stored, older turns are kept as a summary."""
+    def __init__(self, db_path: str, max_sessions: int=1000, max_history_messages: int=20,
+                 max_summary_turns: int=10):
+        """Initialize store with the database file and limits"""
+        self.db_path = db_path
+        self.max_sessions = max_sessions
+        self.max_history_messages = max_history_messages
+        self.max_summary_turns = max_summary_turns
+        self._connection = None
+        self._connection_pid = None
+        self._lock = threading.Lock()
+
+    def _get_connection(self):
+        """Get connection of the current process, connections are not shared across forks"""
+        if self._connection is None or self._connection_pid != os.getpid():
+            self._connection = sqlite3.connect(self.db_path, timeout=30,
+                                               check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    last_access REAL
+                );
+                CREATE TABLE IF NOT EXISTS session_messages (
+                    session_id TEXT,
+                    kind TEXT,
+                    position INTEGER,
+                    message BLOB
+                );
+                CREATE INDEX IF NOT EXISTS idx_session_messages
+                    ON session_messages (session_id, kind, position);
+                CREATE TABLE IF NOT EXISTS session_summaries (
+                    session_id TEXT PRIMARY KEY,
+                    summary TEXT
+                );
+            """)
+            self._connection_pid = os.getpid()
+
+        return self._connection
+
+    def _touch(self, connection, session_id: str):
+        """Update last access time of the session"""
+        connection.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?)",
+                           (session_id, time.time()))
+
+    def _append(self, connection, session_id: str, kind: str, messages: list):
+        """Append messages of a kind (ui/history) to the session"""
+        self._touch(connection, session_id)
+        # Oldest history messages are deleted, so positions continue from the last one
+        position = connection.execute(
+            "SELECT COALESCE(MAX(position) + 1, 0) FROM session_messages "
+            "WHERE session_id = ? AND kind = ?",
+            (session_id, kind)
+        ).fetchone()[0]
+        connection.executemany(
+            "INSERT INTO session_messages VALUES (?, ?, ?, ?)",
+            [(session_id, kind, position + offset, pickle.dumps(message))
+             for offset, message in enumerate(messages)]
+        )
+
+    def _load(self, connection, session_id: str, kind: str, limit: int=-1, offset: int=0):
+        """Load latest messages of a kind (ui/history) of the session in order"""
+        self._touch(connection, session_id)
+        rows = connection.execute(
+            "SELECT message FROM session_messages WHERE session_id = ? AND kind = ? "
+            "ORDER BY position DESC LIMIT ? OFFSET ?",
+            (session_id, kind, limit, offset)
+        ).fetchall()
+
+        return [pickle.loads(row[0]) for row in reversed(rows)]
+
+    def _get_summary(self, connection, session_id: str):
+        """Get summaries of turns dropped from the chat history"""
+        row = connection.execute("SELECT summary FROM session_summaries WHERE session_id = ?",
+                                 (session_id,)).fetchone()
+
+        return json.loads(row[0]) if row else []
+
+    def create_session(self):
+        """Create new session and return its id"""
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                self._touch(connection, session_id)
+                evicted_sessions = connection.execute(
+                    "SELECT session_id FROM sessions ORDER BY last_access DESC LIMIT -1 OFFSET ?",
+                    (self.max_sessions,)
+                ).fetchall()
+                for (evicted_session_id,) in evicted_sessions:
+                    self._delete(connection, evicted_session_id)
+
+        return session_id
+
+    def _delete(self, connection, session_id: str):
+        """Remove session rows"""
+        connection.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        connection.execute("DELETE FROM session_messages WHERE session_id = ?", (session_id,))
+        connection.execute("DELETE FROM session_summaries WHERE session_id = ?", (session_id,))
+
+    def delete_session(self, session_id: str):
+        """Remove session from store"""
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                self._delete(connection, session_id)
+
+    def add_message(self, session_id: str, message):
+        """Add message displayed in UI to the session"""
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                self._append(connection, session_id, "ui", [message])
+
+    def count_messages(self, session_id: str):
+        """Get number of messages displayed in UI for the session"""
+        with self._lock:
+            return self._get_connection().execute(
+                "SELECT COUNT(*) FROM session_messages WHERE session_id = ? AND kind = 'ui'",
+                (session_id,)
+            ).fetchone()[0]
+
+    def get_messages(self, session_id: str, limit: int=None, offset: int=0):
+        """Get latest `limit` messages displayed in UI for the session (all if None),
+        skipping the `offset` latest ones. Only these rows are read and unpickled"""
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                return self._load(connection, session_id, "ui",
+                                  limit=-1 if limit is None else limit, offset=offset)
+
+    def add_turn(self, session_id: str, user_message: str, bot_message: str):
+        """Add completed user and bot turn to the chat history of the session.
+        Turns older than the history window are summarized and deleted"""
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                self._append(connection, session_id, "history",
+                             [HumanMessage(content=user_message), AIMessage(content=bot_message)])
+                old_rows = connection.execute(
+                    "SELECT position, message FROM session_messages "
+                    "WHERE session_id = ? AND kind = 'history' "
+                    "ORDER BY position DESC LIMIT -1 OFFSET ?",
+                    # Whole turns are kept, user and assistant messages stay paired
+                    (session_id, self.max_history_messages // 2 * 2)
+                ).fetchall()
+                if not old_rows:
+                    return
+                old_messages = [pickle.loads(row[1]) for row in reversed(old_rows)]
+                summary = self._get_summary(connection, session_id)
+                summary.extend(summarize_turn(old_user_message.content, old_bot_message.content)
+                               for old_user_message, old_bot_message
+                               in zip(old_messages[::2], old_messages[1::2]))
+                connection.execute("INSERT OR REPLACE INTO session_summaries VALUES (?, ?)",
+                                   (session_id, json.dumps(summary[-self.max_summary_turns:])))
+                connection.execute(
+                    "DELETE FROM session_messages WHERE session_id = ? AND kind = 'history' "
+                    "AND position <= ?",
+                    (session_id, old_rows[0][0])
+                )
+
+    def get_chat_history(self, session_id: str):
+        """Get summary of older turns and latest chat history of the session in llm
+        consumable format"""
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                chat_history = self._load(connection, session_id, "history",
+                                          limit=self.max_history_messages)
+                return with_summary(self._get_summary(connection, session_id), chat_history)
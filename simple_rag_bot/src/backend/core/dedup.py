@@ -0,0 +1,203 @@
+"""Modules for detecting duplicate and near duplicate chunks before embedding"""
+import os
+import re
+import zlib
+import hashlib
+import threading
+import numpy as np
+
+# Largest 32 bit prime, minhash permutations are (a * x + b) mod prime
+MERSENNE_PRIME = (1 << 31) - 1
+
+def normalize_text(text: str):
+    """Lower case words of the text joined by single spaces"""
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+def shingles(text: str, shingle_size: int=5):
+    """Set of hashed word shingles of the text"""
+    words = normalize_text(text).split()
+    if len(words) <= shingle_size:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))}
+
+    return {zlib.crc32(" ".join(words[i:i + shingle_size]).encode("utf-8"))
+            for i in range(len(words) - shingle_size + 1)}
+
+def content_hash(text: str):
+    """Hash of the normalized text, same for exact duplicates"""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+class NearDuplicateDetector:
+    """MinHash signatures with LSH banding to find near duplicate chunks, e.g. repeated
+    headers, footers and boilerplate, or the same document ingested twice.
+    Chunks sharing a band are compared by estimated jaccard similarity of their shingles and
+    the later chunk is dropped if it is above the threshold.
+    Chunks of the corpus can be kept in an index (built at setup and saved with `save_index`),
+    new chunks are then also checked against the chunks of other documents in the corpus."""
+    def __init__(self, threshold: float=0.85, num_perm: int=64, bands: int=8,
+                 shingle_size: int=5, seed: int=42):
+        """Initialize detector with similarity threshold and minhash params"""
+        if num_perm % bands != 0:
+            raise ValueError(f"num_perm ({num_perm}) should be a multiple of bands ({bands})")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        generator = np.random.default_rng(seed)
+        self._a = generator.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = generator.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        # Corpus index, chunk id -> (doc id, content hash, signature)
+        self._index = {}
+        self._index_hashes = {}
+        self._index_buckets = {}
+        self._index_lock = threading.Lock()
+
+    def signature(self, text: str):
+        """MinHash signature of the text"""
+        hashes = np.fromiter(shingles(text, self.shingle_size), dtype=np.uint64)
+        permuted = (hashes[:, None] * self._a + self._b) % MERSENNE_PRIME
+
+        return permuted.min(axis=0)
+
+    def _band_keys(self, signature):
+        """Bucket keys of the signature, one per lsh band"""
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+                for band in range(self.bands)]
+
+    def _find_duplicate(self, signature, band_keys: list, buckets: dict, signatures: list):
+        """Index of the first kept chunk similar to the signature, None if there is none.
+        Only chunks sharing at least one band are compared"""
+        candidates = {index for band_key in band_keys for index in buckets.get(band_key, [])}
+
+        return next((index for index in sorted(candidates)
+                     if np.mean(signatures[index] == signature) >= self.threshold), None)
+
+    def _find_corpus_duplicate(self, chunk_hash: str, signature, band_keys: list, doc_id: str):
+        """Id of an indexed chunk of another document similar to the chunk, None if there is
+        none. Indexed chunks of the same document are replaced by the new version"""
+        with self._index_lock:
+            candidates = set(self._index_hashes.get(chunk_hash, set()))
+            candidates.update(chunk_id for band_key in band_keys
+                              for chunk_id in self._index_buckets.get(band_key, set()))
+
+            return next((chunk_id for chunk_id in sorted(candidates)
+                         if self._index[chunk_id][0] != doc_id
+                         and (self._index[chunk_id][1] == chunk_hash
+                              or np.mean(self._index[chunk_id][2] == signature) >= self.threshold)),
+                        None)
+
+    def _remove_documents(self, doc_ids: set):
+        """Remove indexed chunks of the documents, called with the index lock held"""
+        for chunk_id in [chunk_id for chunk_id, entry in self._index.items()
+                         if entry[0] in doc_ids]:
+            _, chunk_hash, signature = self._index.pop(chunk_id)
+            self._index_hashes[chunk_hash].discard(chunk_id)
+            for band_key in self._band_keys(signature):
+                self._index_buckets[band_key].discard(chunk_id)
+
+    def _add_to_index(self, chunk_id: str, doc_id: str, chunk_hash: str, signature):
+        """Add a chunk to the index, called with the index lock held"""
+        self._index[chunk_id] = (doc_id, chunk_hash, signature)
+        self._index_hashes.setdefault(chunk_hash, set()).add(chunk_id)
+        for band_key in self._band_keys(signature):
+            self._index_buckets.setdefault(band_key, set()).add(chunk_id)
+
+    def add_to_index(self, chunks_data: list):
+        """Add chunks of the corpus to the index, older chunks of the same documents are
+        removed first"""
+        entries = [(chunk["chunk_id"], chunk["doc_id"], content_hash(chunk["content"]),
+                    self.signature(chunk["content"])) for chunk in chunks_data]
+        with self._index_lock:
+            self._remove_documents({chunk["doc_id"] for chunk in chunks_data})
+            for entry in entries:
+                self._add_to_index(*entry)
+
+    def index_size(self):
+        """Number of indexed chunks"""
+        return len(self._index)
+
+    def save_index(self, path: str):
+        """Save indexed chunks and their signatures, buckets are built again on load"""
+        with self._index_lock:
+            chunk_ids = list(self._index)
+            entries = [self._index[chunk_id] for chunk_id in chunk_ids]
+        signatures = np.asarray([entry[2] for entry in entries], dtype=np.uint64)
+        with open(f"{path}.tmp", "wb") as outfile:
+            np.savez(outfile, chunk_ids=np.asarray(chunk_ids, dtype=str),
+                     doc_ids=np.asarray([entry[0] for entry in entries], dtype=str),
+                     content_hashes=np.asarray([entry[1] for entry in entries], dtype=str),
+                     signatures=signatures.reshape(len(entries), self.num_perm))
+        os.replace(f"{path}.tmp", path)
+
+        return path
+
+    def load_index(self, path: str):
+        """Load the index saved during setup, returns False if it is missing or was created
+        with other minhash params"""
+        if not os.path.exists(path):
+            print(f"Deduplication index not found at {path}, only chunks of the same document "
+                  "are compared.")
+            return False
+        index = np.load(path)
+        if index["signatures"].shape[1:] != (self.num_perm,):
+            print(f"Deduplication index at {path} was created with other minhash params, "
+                  "create it again using the setup.")
+            return False
+        with self._index_lock:
+            for entry in zip(index["chunk_ids"].tolist(), index["doc_ids"].tolist(),
+                             index["content_hashes"].tolist(), index["signatures"]):
+                self._add_to_index(*entry)
+
+        return True
+
+    def deduplicate(self, chunks_data: list):
+        """Drop exact and near duplicate chunks, first occurrence is kept.
+        Chunks are also compared with the indexed corpus chunks of other documents.
+        Returns kept chunks and a report of duplicates and embedding calls saved"""
+        kept_chunks = []
+        exact_hashes = {}
+        signatures = []
+        buckets = {}
+        duplicates = {}
+        num_duplicates = {"exact": 0, "corpus": 0}
+
+        for chunk in chunks_data:
+            chunk_hash = content_hash(chunk["content"])
+            if chunk_hash in exact_hashes:
+                duplicates[chunk["chunk_id"]] = exact_hashes[chunk_hash]
+                num_duplicates["exact"] += 1
+                continue
+
+            signature = self.signature(chunk["content"])
+            band_keys = self._band_keys(signature)
+            duplicate_of = self._find_corpus_duplicate(chunk_hash, signature, band_keys,
+                                                       chunk["doc_id"])
+            if duplicate_of is not None:
+                duplicates[chunk["chunk_id"]] = duplicate_of
+                num_duplicates["corpus"] += 1
+                continue
+            duplicate_of = self._find_duplicate(signature, band_keys, buckets, signatures)
+            if duplicate_of is not None:
+                duplicates[chunk["chunk_id"]] = kept_chunks[duplicate_of]["chunk_id"]
+                continue
+
+            exact_hashes[chunk_hash] = chunk["chunk_id"]
+            for band_key in band_keys:
+                buckets.setdefault(band_key, []).append(len(kept_chunks))
+            signatures.append(signature)
+            kept_chunks.append(chunk)
+
+        report = {
+            "total_chunks": len(chunks_data),
+            "kept_chunks": len(kept_chunks),
+            "exact_duplicates": num_duplicates["exact"],
+            "near_duplicates": len(duplicates) - sum(num_duplicates.values()),
+            # Exact or near duplicates of chunks of other documents in the corpus
+            "corpus_duplicates": num_duplicates["corpus"],
+            # Every dropped chunk is one embedding call and one index row less
+            "embedding_calls_saved": len(duplicates),
+            "index_rows_saved": len(duplicates),
+            "duplicates": duplicates
+        }
+
+        return kept_chunks, report
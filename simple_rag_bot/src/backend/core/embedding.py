@@ -39,3 +39,10 @@ class EmbeddingClient:
         query_embedding = self.embedding_instance.embed_query(text=content)
 
         return query_embedding
+
+    def get_query_embeddings_batch(self, contents: list):
+        """Generate embeddings for several queries in a single request"""
+        query_embeddings = self.embedding_instance.embed_documents(texts=contents,
+                                                                   task_type="retrieval_query")
+
+        return query_embeddings
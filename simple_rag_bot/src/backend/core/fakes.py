@@ -0,0 +1,93 @@
+"""Offline fake llm and embedding clients with configurable latency, used for benchmarks"""
+import re
+import time
+import random
+import uuid
+import zlib
+import math
+from typing import Any, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+CHIT_CHAT_WORDS = {"hi", "hello", "hey", "thanks", "thank", "bye", "goodbye"}
+
+def _tokenize(text: str):
+    """Lower case word tokens of the text"""
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+class FakeChatModel(BaseChatModel): # pylint: disable=abstract-method
+    """Fake chat model that waits for `latency` seconds and returns a canned response.
+    When tools are bound, it calls the retriever tool for everything except chit chat."""
+    latency: float = 0.0
+    # Fraction of calls that raise an error, to test error handling under load
+    failure_rate: float = 0.0
+    tool_name: str = "get_relevant_docs_tool"
+
+    @property
+    def _llm_type(self) -> str:
+        """Type of the chat model"""
+        return "fake-chat-model"
+
+    def bind_tools(self, tools: List[Any], **kwargs: Any):
+        """Bind tools in the same format as the actual chat models"""
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        """Generate canned response for the last message"""
+        time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise RuntimeError("Fake llm failure")
+        user_query = str(messages[-1].content)
+
+        if kwargs.get("tools") and not CHIT_CHAT_WORDS & set(_tokenize(user_query)):
+            message = AIMessage(content="", tool_calls=[{
+                "name": self.tool_name,
+                "args": {"query": user_query},
+                "id": str(uuid.uuid4())
+            }])
+        else:
+            message = AIMessage(content=f"Fake response to: {user_query}")
+
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+class FakeEmbeddingClient:
+    """Fake embedding client with the same interface as EmbeddingClient.
+    Uses hashed word counts, so texts sharing words get similar embeddings."""
+    def __init__(self, embedding_dimension: int=768, latency: float=0.0):
+        """Initialize fake embedding client with embedding size and latency per call"""
+        self.embedding_dimension = embedding_dimension
+        self.latency = latency
+
+    def _embed(self, content: str):
+        """Hash every word to a dimension and sign of the embedding"""
+        embedding = [0.0] * self.embedding_dimension
+        for token in _tokenize(content):
+            token_hash = zlib.crc32(token.encode("utf-8"))
+            embedding[token_hash % self.embedding_dimension] += 1.0 if token_hash & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in embedding)) or 1.0
+
+        return [value / norm for value in embedding]
+
+    def generate_embeddings(self, chunks_data):
+        """Generate embeddings for content"""
+        embeddings_data = []
+        for chunk in chunks_data:
+            time.sleep(self.latency)
+            embeddings_data.append({**chunk, "chunk_embedding": self._embed(chunk["content"])})
+
+        return embeddings_data
+
+    def get_query_embeddings(self, content: str):
+        """Generate embeddings for query during runtime"""
+        time.sleep(self.latency)
+
+        return self._embed(content)
+
+    def get_query_embeddings_batch(self, contents: list):
+        """Generate embeddings for several queries, latency is paid once per batch"""
+        time.sleep(self.latency)
+
+        return [self._embed(content) for content in contents]
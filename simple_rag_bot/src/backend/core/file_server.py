@@ -0,0 +1,62 @@
+"""Local file server as a stand-in for remote document sources, used for fetch tests"""
+import os
+import threading
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from urllib.parse import quote
+
+class _ConditionalRequestHandler(SimpleHTTPRequestHandler):
+    """File handler that also sends ETag and handles If-None-Match.
+    Last-Modified and If-Modified-Since are handled by SimpleHTTPRequestHandler"""
+    def _etag(self):
+        """ETag of the requested file from its modified time and size, None if missing"""
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            return None
+        stat = os.stat(path)
+        return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+    def send_head(self):
+        """Send 304 if the ETag matches, else the file"""
+        etag = self._etag()
+        if etag and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return None
+        return super().send_head()
+
+    def end_headers(self):
+        """Add ETag to every file response"""
+        etag = self._etag()
+        if etag and self._headers_buffer and b"ETag" not in b"".join(self._headers_buffer):
+            self.send_header("ETag", etag)
+        super().end_headers()
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        """Do not log every request"""
+
+class LocalFileServer:
+    """Serves files of a directory over http on localhost, stand-in for remote file servers.
+    Use as a context manager, `url_for(file_name)` gives the url of a file."""
+    def __init__(self, directory: str, port: int=0):
+        """Initialize server for the directory, port 0 picks a free port"""
+        def handler(*args, **kwargs):
+            """Request handler serving the directory"""
+            return _ConditionalRequestHandler(*args, directory=directory, **kwargs)
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def url_for(self, file_name: str):
+        """Url of a file in the served directory"""
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/{quote(file_name)}"
+
+    def __enter__(self):
+        """Start serving in a background thread"""
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        """Stop serving"""
+        self.server.shutdown()
+        self.server.server_close()
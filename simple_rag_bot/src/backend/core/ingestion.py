@@ -0,0 +1,376 @@
+"""Modules for ingesting documents in the background while the app is serving"""
+# pylint: disable=too-many-instance-attributes,too-many-positional-arguments,import-outside-toplevel
+# pylint: disable=too-many-locals
+import os
+import time
+import uuid
+import queue
+import threading
+from backend.core.chunking import PDFTextSplitter
+from backend.core.sharding import split_into_shards, save_centroids, ShardStats
+from backend.utils.utility import append_embeddings
+from backend.ml_config import CITATION_CONFIGS, SHARD_CONFIGS, QUANTIZATION_CONFIGS
+from backend.ml_config import EXPANSION_CONFIGS, INGESTION_CONFIGS
+
+STAGES = ["extract", "chunk", "embed", "upsert"]
+
+def is_multi_worker():
+    """Check if the app is served by multiple gunicorn workers (see gunicorn.conf.py).
+    Every worker imports the app, ingestion would run once per worker on a read only index"""
+    return bool(os.environ.get("RAG_SHARED_INDEX")) or int(os.environ.get("RAG_WORKERS", "1")) > 1
+
+class IngestionService:
+    """Background ingestion of pdf files into the vector db.
+    Files are submitted as jobs (or picked up by watching a directory) and pass through the
+    extract -> chunk -> embed -> upsert stages. Every stage runs in its own thread(s) with a
+    bounded queue to the next stage, so a slow stage (usually embedding) holds back the
+    earlier ones instead of buffering whole documents in memory.
+    Chunks are written to the default collection and, when the app searches shards, to the
+    shard of their document, whose centroid is updated from the running sums of the shard.
+    With the quantized store, chunks are written to the milvus db and only the chunks of the
+    document are quantized into the store.
+    Single process only, milvus lite db cannot be written by multiple workers."""
+    def __init__(self, embedding_client=None, retriever_client=None,
+                 collection_name: str="local_pdf_rag", watch_dir: str=None,
+                 poll_interval: float=5.0, ingest_existing_files: bool=False,
+                 queue_size: int=4, embed_workers: int=2, chunk_size: int=1000,
+                 chunk_overlap: int=200, deduplicator=None, dedup_index_path: str=None,
+                 shard_selector=None, quantized_store=None, shard_configs: dict=None):
+        """Initialize service with clients, target collection and pipeline sizes.
+        Clients, shard selector and quantized store default to the ones used by the tools,
+        so ingested chunks are served at once."""
+        self.embedding_client = embedding_client
+        self.retriever_client = retriever_client
+        self.collection_name = collection_name
+        self.shard_selector = shard_selector
+        self.quantized_store = quantized_store
+        self.shard_configs = shard_configs or SHARD_CONFIGS
+        self.shard_stats = None
+        self.watch_dir = watch_dir
+        self.poll_interval = poll_interval
+        # Files already in the directory were ingested by the initial setup
+        self.ingest_existing_files = ingest_existing_files
+        self.embed_workers = embed_workers
+        self.splitter = PDFTextSplitter(file_uri=None, chunk_size=chunk_size,
+                                        chunk_overlap=chunk_overlap)
+        # Near duplicate chunks (repeated headers, boilerplate, documents already in the
+        # corpus) are not embedded. Corpus index is loaded on start and saved after upserts
+        self.deduplicator = deduplicator
+        self.dedup_index_path = dedup_index_path
+
+        # Submitted jobs wait in an unbounded queue, queues between stages are bounded
+        self._queues = {"extract": queue.Queue()}
+        for stage in STAGES[1:]:
+            self._queues[stage] = queue.Queue(maxsize=queue_size)
+
+        self._jobs = {}
+        self._jobs_lock = threading.Lock()
+        self._seen_files = {}
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._started_at = None
+
+    def start(self):
+        """Start stage workers and the directory watcher"""
+        if self._threads:
+            return
+        from backend.core import tools
+        self.embedding_client = self.embedding_client or tools.get_embedding_instance()
+        if self.retriever_client is None:
+            serving_client = tools.get_retriever_instance()
+            if hasattr(serving_client, "replace_document"):
+                self.retriever_client = serving_client
+            elif is_multi_worker():
+                raise ValueError("Ingestion is not supported in multi worker mode, workers "
+                                 "share a read only index.")
+            else:
+                # Quantized store is read only, it is created again from the milvus db
+                self.quantized_store = self.quantized_store or serving_client
+                self.retriever_client = tools.load_milvus_client()
+        if not hasattr(self.retriever_client, "replace_document"):
+            raise ValueError("Retriever client does not support upserts, ingest into the "
+                             "milvus db instead.")
+        self.shard_selector = self.shard_selector or tools.get_shard_selector()
+        if self.shard_selector and self.shard_stats is None:
+            self.shard_stats = ShardStats()
+            if os.path.exists(self.shard_configs["stats_path"]):
+                self.shard_stats = ShardStats.from_file(self.shard_configs["stats_path"])
+        if self.deduplicator and self.dedup_index_path and not self.deduplicator.index_size():
+            self.deduplicator.load_index(self.dedup_index_path)
+
+        self._stop_event.clear()
+        self._started_at = time.time()
+        workers = [("extract", self._extract), ("chunk", self._chunk), ("upsert", self._upsert)]
+        # Embedding is network bound, more workers keep more requests in flight
+        workers += [("embed", self._embed)] * self.embed_workers
+        for stage, handler in workers:
+            self._threads.append(threading.Thread(target=self._run_stage,
+                                                  args=(stage, handler),
+                                                  name=f"ingestion-{stage}",
+                                                  daemon=True))
+        if self.watch_dir:
+            self._threads.append(threading.Thread(target=self._watch, name="ingestion-watcher",
+                                                  daemon=True))
+        for thread in self._threads:
+            thread.start()
+        print(f"Ingestion service started with {len(self._threads)} threads.")
+
+    def stop(self, timeout: float=10.0):
+        """Stop all workers, jobs in progress are not completed and are marked as cancelled"""
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+        for stage in STAGES:
+            while True:
+                try:
+                    self._cancel(STAGES.index(stage), self._queues[stage].get_nowait())
+                except queue.Empty:
+                    break
+        print("Ingestion service stopped.")
+
+    def submit(self, file_path: str, source_url: str=None):
+        """Queue a pdf file for ingestion and return the job id.
+        Source url is used in chunk metadata for files downloaded from remote sources"""
+        job_id = uuid.uuid4().hex
+        document_url = source_url or file_path
+        with self._jobs_lock:
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "file_path": file_path,
+                "source_url": source_url,
+                "status": "queued",
+                "error": None,
+                "num_chunks": 0,
+                "duplicates_removed": 0,
+                "submitted_at": time.time(),
+                "completed_at": None,
+                "stage_seconds": {}
+            }
+        self._queues["extract"].put({"job_id": job_id, "file_path": file_path,
+                                     "document_url": document_url})
+
+        return job_id
+
+    def get_job(self, job_id: str):
+        """Get status of a job, None if job id is unknown"""
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list_jobs(self):
+        """Get status of all jobs, latest first"""
+        with self._jobs_lock:
+            jobs = [dict(job) for job in self._jobs.values()]
+
+        return sorted(jobs, key=lambda job: job["submitted_at"], reverse=True)
+
+    def wait(self, job_ids: list, timeout: float=None):
+        """Wait for the jobs to complete or fail, returns True if all finished in time"""
+        end_time = time.time() + timeout if timeout else None
+        while not end_time or time.time() < end_time:
+            jobs = [self.get_job(job_id) for job_id in job_ids]
+            if all(job and job["status"] in ("completed", "failed", "cancelled")
+                   for job in jobs):
+                return True
+            time.sleep(0.1)
+
+        return False
+
+    def get_metrics(self):
+        """Get job counts, queue depths, average seconds per stage and throughput"""
+        jobs = self.list_jobs()
+        completed = [job for job in jobs if job["status"] == "completed"]
+        status_counts = {}
+        for job in jobs:
+            status_counts[job["status"]] = status_counts.get(job["status"], 0) + 1
+        stage_seconds = {}
+        for stage in STAGES:
+            durations = [job["stage_seconds"][stage] for job in completed]
+            stage_seconds[stage] = round(sum(durations) / len(durations), 3) if durations else 0.0
+        uptime = time.time() - self._started_at if self._started_at else 0.0
+        num_chunks = sum(job["num_chunks"] for job in completed)
+        duplicates_removed = sum(job["duplicates_removed"] for job in completed)
+
+        return {
+            "jobs": status_counts,
+            "queue_depths": {stage: self._queues[stage].qsize() for stage in STAGES},
+            "avg_stage_seconds": stage_seconds,
+            "documents_ingested": len(completed),
+            "chunks_ingested": num_chunks,
+            "embedding_calls_saved": duplicates_removed,
+            "uptime_seconds": round(uptime, 2),
+            "documents_per_minute": round(len(completed) * 60 / uptime, 2) if uptime else 0.0,
+            "chunks_per_second": round(num_chunks / uptime, 2) if uptime else 0.0
+        }
+
+    def _update_job(self, job_id: str, **fields):
+        """Update fields of a job"""
+        with self._jobs_lock:
+            self._jobs[job_id].update(fields)
+
+    def _run_stage(self, stage: str, handler):
+        """Take items from the stage queue, process and pass them on until stopped"""
+        next_stage = STAGES.index(stage) + 1
+        while not self._stop_event.is_set():
+            try:
+                item = self._queues[stage].get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            self._update_job(item["job_id"], status=stage)
+            start_time = time.time()
+            try:
+                item = handler(item)
+            except Exception as e:
+                print(f"Ingestion of {item['file_path']} failed at {stage} stage: {e}")
+                self._update_job(item["job_id"], status="failed", error=f"{stage}: {e}",
+                                 completed_at=time.time())
+                continue
+            with self._jobs_lock:
+                self._jobs[item["job_id"]]["stage_seconds"][stage] = time.time() - start_time
+
+            if next_stage < len(STAGES):
+                self._put(STAGES[next_stage], item)
+            else:
+                self._update_job(item["job_id"], status="completed", completed_at=time.time())
+                print(f"Ingested {item['file_path']} with {len(item['chunks'])} chunks.")
+
+    def _put(self, stage: str, item: dict):
+        """Put item in the queue of the stage, blocks while the queue is full.
+        Item is cancelled if the service is stopped meanwhile"""
+        while not self._stop_event.is_set():
+            try:
+                self._queues[stage].put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        self._cancel(STAGES.index(stage), item)
+
+    def _cancel(self, stage_index: int, item: dict):
+        """Mark job of an item that will not reach the stage as cancelled"""
+        print(f"Ingestion service stopped, {item['file_path']} was cancelled before "
+              f"{STAGES[stage_index]} stage.")
+        self._update_job(item["job_id"], status="cancelled",
+                         error=f"cancelled before {STAGES[stage_index]} stage",
+                         completed_at=time.time())
+
+    def _extract(self, item: dict):
+        """Extract full text and page info of the pdf"""
+        # Same document always gets the same doc id, so re-ingesting replaces its chunks
+        item["doc_id"], item["text"], item["page_info"] = self.splitter.get_page_info(
+            item["file_path"], item["document_url"])
+
+        return item
+
+    def _chunk(self, item: dict):
+        """Split the text into chunks with metadata"""
+        item["chunks"] = self.splitter.get_chunks_with_info(item["document_url"],
+                                                            item.pop("text"),
+                                                            item.pop("page_info"),
+                                                            item["doc_id"])
+        if self.deduplicator:
+            item["chunks"], report = self.deduplicator.deduplicate(item["chunks"])
+            self._update_job(item["job_id"], duplicates_removed=report["embedding_calls_saved"])
+        self._update_job(item["job_id"], num_chunks=len(item["chunks"]))
+
+        return item
+
+    def _embed(self, item: dict):
+        """Generate embeddings for the chunks"""
+        item["embeddings"] = self.embedding_client.generate_embeddings(item["chunks"])
+        failed = [chunk["chunk_id"] for chunk in item["embeddings"]
+                  if chunk["chunk_embedding"] is None]
+        if failed:
+            raise ValueError(f"Embeddings could not be generated for {len(failed)} chunks")
+
+        return item
+
+    def _upsert(self, item: dict):
+        """Replace chunks of the document in the vector db, chunk index and citation store"""
+        if not item["chunks"]:
+            return item
+        embeddings = item.pop("embeddings")
+        collections = {self.collection_name: embeddings}
+        if self.shard_selector:
+            # Same shard assignment as the setup, app only searches the shard collections
+            collections.update(split_into_shards(embeddings, self.shard_configs))
+        for collection_name, collection_data in collections.items():
+            if not self.retriever_client.has_collection(collection_name):
+                self.retriever_client.create_collection(
+                    collection_name=collection_name,
+                    embedding_dimension=len(collection_data[0]["chunk_embedding"]),
+                    vector_field_name="chunk_embedding",
+                    primary_field_name="chunk_id"
+                )
+            self.retriever_client.replace_document(collection_name, item["doc_id"],
+                                                   collection_data)
+        self._refresh_collections(item["doc_id"], collections)
+        if self.deduplicator:
+            self.deduplicator.add_to_index(item["chunks"])
+            if self.dedup_index_path:
+                self.deduplicator.save_index(self.dedup_index_path)
+        from backend.core import tools
+        from backend.core.citations import build_citations
+        # Chunks and citations are appended to the setup files, so they are loaded after a
+        # restart. Retrieval only fetches ids from the vector db when the chunk index is used
+        if tools.get_chunk_index():
+            tools.get_chunk_index().add_chunks(item["chunks"])
+            append_embeddings(item["chunks"], EXPANSION_CONFIGS["chunks_path"])
+        if tools.get_citation_store():
+            citations = build_citations(item["chunks"],
+                                        preview_length=CITATION_CONFIGS["preview_length"],
+                                        documents_dir=self.watch_dir or
+                                        INGESTION_CONFIGS["watch_dir"])
+            tools.get_citation_store().add_citations(citations)
+            append_embeddings(citations, CITATION_CONFIGS["citations_path"])
+
+        return item
+
+    def _refresh_collections(self, doc_id: str, collections: dict):
+        """Update centroids of the changed shards and the quantized collections with the
+        chunks of the document, without reading the other vectors of the collections"""
+        refresh_shards = self.shard_selector is not None
+        for collection_name, collection_data in collections.items():
+            if self.quantized_store is not None:
+                self.quantized_store.upsert_document(
+                    collection_name, doc_id, collection_data,
+                    rescore_dtype=QUANTIZATION_CONFIGS["rescore_dtype"]
+                )
+            if refresh_shards and collection_name != self.collection_name:
+                if not self.shard_stats.has_shard(collection_name):
+                    # Sums of shards created before they were kept are read once
+                    self.shard_stats.set_documents(
+                        collection_name, self.retriever_client.get_collection_data(collection_name))
+                self.shard_stats.set_document(collection_name, doc_id,
+                                              [entry["chunk_embedding"]
+                                               for entry in collection_data])
+                self.shard_selector.update_centroid(collection_name,
+                                                    self.shard_stats.get_centroid(collection_name))
+        if refresh_shards:
+            save_centroids(self.shard_selector.centroids, self.shard_configs["centroids_path"])
+            self.shard_stats.save(self.shard_configs["stats_path"])
+
+    def _scan(self, submit: bool=True):
+        """Submit new and modified pdf files of the watched directory"""
+        for file_name in sorted(os.listdir(self.watch_dir)):
+            file_path = os.path.abspath(os.path.join(self.watch_dir, file_name))
+            if not file_path.endswith(".pdf") or not os.path.isfile(file_path):
+                continue
+            modified_time = os.path.getmtime(file_path)
+            if self._seen_files.get(file_path) != modified_time:
+                self._seen_files[file_path] = modified_time
+                if submit:
+                    print(f"Found new or modified file {file_path}.")
+                    self.submit(file_path)
+
+    def _watch(self):
+        """Scan the watched directory every poll interval until stopped"""
+        submit = self.ingest_existing_files
+        while not self._stop_event.is_set():
+            try:
+                self._scan(submit=submit)
+            except OSError as e:
+                print(f"Unable to scan {self.watch_dir}: {e}")
+            submit = True
+            self._stop_event.wait(self.poll_interval)
@@ -0,0 +1,109 @@
+"""Modules for caching llm responses of deterministic (temperature 0) chains"""
+import os
+import time
+import hashlib
+import warnings
+import sqlite3
+import threading
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+class SQLiteLLMCache(BaseCache):
+    """Exact match llm response cache backed by sqlite, shared between worker processes.
+    Entries are keyed on the model config (llm string, includes model, temperature and bound
+    tools) and the serialised prompt messages. Entries older than `ttl_seconds` are not used
+    and least recently used entries are evicted above `max_entries`.
+    Only attach it to models with temperature 0, other models should not return cached text."""
+    def __init__(self, db_path: str, max_entries: int=10000, ttl_seconds: float=7 * 24 * 3600):
+        """Initialize cache with the database file and limits"""
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._connection_pid = None
+        self._lock = threading.Lock()
+
+    def _get_connection(self):
+        """Get connection of the current process, connections are not shared across forks"""
+        if self._connection is None or self._connection_pid != os.getpid():
+            self._connection = sqlite3.connect(self.db_path, timeout=30,
+                                               check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    generations TEXT,
+                    created_at REAL,
+                    last_access REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access
+                    ON llm_cache (last_access);
+            """)
+            self._connection_pid = os.getpid()
+
+        return self._connection
+
+    @staticmethod
+    def _cache_key(prompt: str, llm_string: str):
+        """Hash of the model config and prompt"""
+        return hashlib.sha256(f"{llm_string}\n{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str):
+        """Get cached generations of the prompt, None if missing or expired"""
+        cache_key = self._cache_key(prompt, llm_string)
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                row = connection.execute(
+                    "SELECT generations, created_at FROM llm_cache WHERE cache_key = ?",
+                    (cache_key,)
+                ).fetchone()
+                if row and time.time() - row[1] > self.ttl_seconds:
+                    connection.execute("DELETE FROM llm_cache WHERE cache_key = ?", (cache_key,))
+                    row = None
+                if row:
+                    connection.execute("UPDATE llm_cache SET last_access = ? WHERE cache_key = ?",
+                                       (time.time(), cache_key))
+            if row:
+                self.hits += 1
+                with warnings.catch_warnings():
+                    # loads is marked as beta in langchain core
+                    warnings.simplefilter("ignore")
+                    return loads(row[0])
+            self.misses += 1
+
+        return None
+
+    def update(self, prompt: str, llm_string: str, return_val):
+        """Cache generations of the prompt, evicts least recently used entries over the limit"""
+        cache_key = self._cache_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                connection.execute("INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?)",
+                                   (cache_key, dumps(list(return_val)), now, now))
+                connection.execute(
+                    "DELETE FROM llm_cache WHERE cache_key IN (SELECT cache_key FROM llm_cache "
+                    "ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+
+    def clear(self, **kwargs):
+        """Remove all cached entries"""
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                connection.execute("DELETE FROM llm_cache")
+
+    def get_stats(self):
+        """Get hits and misses of the current process"""
+        total = self.hits + self.misses
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
@@ -0,0 +1,28 @@
+"""Modules for multi query retrieval, query variations and reciprocal rank fusion"""
+import re
+
+def parse_queries(llm_output: str, question: str, num_queries: int=3):
+    """Get the original question and up to `num_queries` unique variations from llm output"""
+    queries = [question]
+    for line in llm_output.splitlines():
+        # Remove numbering or bullets if the llm adds them anyway
+        query = re.sub(r"^\s*(\d+[.)]|[-*])\s*", "", line).strip()
+        if query and query.lower() not in {existing.lower() for existing in queries}:
+            queries.append(query)
+
+    return queries[:num_queries + 1]
+
+def reciprocal_rank_fusion(result_lists: list, k: int=60, limit: int=3):
+    """Merge ranked hit lists of several queries, a hit scores 1 / (k + rank) in every list.
+    Result follows the same format as a single milvus search, i.e. [[hit1, hit2, ...]]"""
+    fused = {}
+    for hits in result_lists:
+        for rank, hit in enumerate(hits, start=1):
+            if hit["id"] not in fused:
+                fused[hit["id"]] = {**hit, "rrf_score": 0.0}
+            fused_hit = fused[hit["id"]]
+            fused_hit["rrf_score"] += 1.0 / (k + rank)
+            # Keep the best similarity of the hit across queries
+            fused_hit["distance"] = max(fused_hit["distance"], hit["distance"])
+
+    return [sorted(fused.values(), key=lambda hit: hit["rrf_score"], reverse=True)[:limit]]
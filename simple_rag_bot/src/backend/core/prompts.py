@@ -56,3 +56,12 @@ query_rewrite_prompt = ChatPromptTemplate.from_messages([
     MessagesPlaceholder(variable_name="chat_history"),
     ("user", "Followup message: {question}. Rephrased version:"),
 ])
+
+multi_query_template = """You are an assistant that helps in searching a knowledge base about climate change, recipes and LLM agents.
+Generate {num_queries} different versions of the user question, each one using different words or looking at the question from a different perspective, to retrieve relevant documents.
+Return only the questions, one per line, without numbering or any other explanation.
+"""
+multi_query_prompt = ChatPromptTemplate.from_messages([
+    ("system", multi_query_template),
+    ("user", "{question}"),
+])
@@ -0,0 +1,342 @@
+"""Modules for quantized storage and search of chunk embeddings"""
+# pylint: disable=too-many-positional-arguments,too-many-locals
+import os
+import json
+import time
+import threading
+import numpy as np
+from backend.core.sharding import split_into_shards
+
+class ScalarQuantizer:
+    """Per dimension scalar quantizer that maps float vectors to 8 bit codes"""
+    def __init__(self, min_values=None, scales=None):
+        """Initialize quantizer with per dimension offsets and step sizes"""
+        self.min_values = min_values
+        self.scales = scales
+
+    def fit(self, vectors: np.ndarray):
+        """Learn per dimension range of the vectors"""
+        if vectors.shape[0] == 0:
+            self.min_values = np.zeros(vectors.shape[1], dtype=np.float32)
+            self.scales = np.ones(vectors.shape[1], dtype=np.float32)
+            return self
+        self.min_values = vectors.min(axis=0).astype(np.float32)
+        max_values = vectors.max(axis=0).astype(np.float32)
+        # Avoid zero step size for constant dimensions
+        self.scales = np.maximum((max_values - self.min_values) / 255.0, 1e-12).astype(np.float32)
+
+        return self
+
+    def encode(self, vectors: np.ndarray):
+        """Convert float vectors to uint8 codes"""
+        codes = np.rint((vectors - self.min_values) / self.scales)
+
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def decode(self, codes: np.ndarray):
+        """Approximately reconstruct float vectors from codes"""
+        return self.min_values + codes.astype(np.float32) * self.scales
+
+    def save(self, path: str):
+        """Save quantizer params"""
+        np.savez(path, min_values=self.min_values, scales=self.scales)
+
+    @classmethod
+    def load(cls, path: str):
+        """Load quantizer params"""
+        params = np.load(path)
+
+        return cls(min_values=params["min_values"], scales=params["scales"])
+
+def _normalize_rows(vectors: np.ndarray):
+    """Scale each row to unit length so that dot product equals cosine similarity"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+
+    return vectors / norms
+
+def _to_vectors(data: list, vector_field_name: str):
+    """Unit length float32 vectors of the entries"""
+    vectors = np.asarray([entry[vector_field_name] for entry in data], dtype=np.float32)
+    # Empty collection keeps a 2d shape, searches on it return no hits
+    return _normalize_rows(vectors.reshape(len(data), vectors.shape[-1] if data else 0))
+
+def _to_records(data: list, vector_field_name: str, primary_field_name: str):
+    """Entries without their vectors, with the primary field as id"""
+    records = []
+    for entry in data:
+        record = {key: value for key, value in entry.items() if key != vector_field_name}
+        record["id"] = entry[primary_field_name]
+        records.append(record)
+
+    return records
+
+class QuantizedVectorStore:
+    """Read only vector store keeping int8 codes in memory for search and memory mapped
+    float vectors on disk for re-scoring the top candidates.
+    Follows the same query interface as CustomMilvusClient.
+    With mmap_codes, codes are memory mapped as well, so that multiple worker processes share
+    a single read only copy of the index through the page cache."""
+    def __init__(self, store_dir: str, rescore_factor: int=4, block_size: int=4096,
+                 mmap_codes: bool=False):
+        """Initialize store with the folder containing quantized collections"""
+        self.store_dir = store_dir
+        self.rescore_factor = rescore_factor
+        self.block_size = block_size
+        self.mmap_codes = mmap_codes
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def _collection_dir(self, collection_name: str):
+        """Get folder of the collection"""
+        return os.path.join(self.store_dir, collection_name)
+
+    def has_collection(self, collection_name: str):
+        """Check if collection exists"""
+        return os.path.exists(os.path.join(self._collection_dir(collection_name), "codes.npy"))
+
+    def create_collection(self, collection_name: str, data: list,
+                          vector_field_name: str="chunk_embedding",
+                          primary_field_name: str="chunk_id",
+                          rescore_dtype: str="float16"):
+        """Quantize embeddings and save codes, re-score vectors and records of the collection.
+        Files are written next to the old ones and swapped in, so an existing collection can be
+        replaced while it is searched (memory mapped files of the old version stay valid)"""
+        collection_dir = self._collection_dir(collection_name)
+        if self.has_collection(collection_name):
+            print(f"Collection with {collection_name} already exists. \
+          Over writing existing collection.")
+        os.makedirs(collection_dir, exist_ok=True)
+
+        data = [entry for entry in data if entry.get(vector_field_name)]
+        vectors = _to_vectors(data, vector_field_name)
+        quantizer = ScalarQuantizer().fit(vectors)
+        records = _to_records(data, vector_field_name, primary_field_name)
+        self._save_collection(collection_name, quantizer.encode(vectors),
+                              vectors.astype(rescore_dtype), quantizer, records)
+        print(f"Quantized collection '{collection_name}' created with {len(data)} vectors.")
+
+        return collection_dir
+
+    def upsert_document(self, collection_name: str, doc_id: str, data: list,
+                        vector_field_name: str="chunk_embedding",
+                        primary_field_name: str="chunk_id", rescore_dtype: str="float16"):
+        """Replace the vectors of a document in the collection, e.g. after it is ingested.
+        Only the new vectors are quantized, with the value ranges of the existing collection.
+        Values outside of the ranges are clipped, re-scoring uses the float vectors."""
+        data = [entry for entry in data if entry.get(vector_field_name)]
+        if not self.has_collection(collection_name) or \
+                not self._load_collection(collection_name)["records"]:
+            return self.create_collection(collection_name, data,
+                                          vector_field_name=vector_field_name,
+                                          primary_field_name=primary_field_name,
+                                          rescore_dtype=rescore_dtype)
+
+        collection = self._load_collection(collection_name)
+        kept_rows = np.asarray([index for index, record in enumerate(collection["records"])
+                                if record.get("doc_id") != doc_id], dtype=np.int64)
+        vectors = _to_vectors(data, vector_field_name).reshape(len(data),
+                                                               collection["codes"].shape[1])
+        quantizer = collection["quantizer"]
+        codes = np.concatenate([collection["codes"][kept_rows], quantizer.encode(vectors)])
+        rescore_vectors = np.concatenate([
+            np.asarray(collection["vectors"][kept_rows], dtype=rescore_dtype),
+            vectors.astype(rescore_dtype)
+        ])
+        records = [collection["records"][index] for index in kept_rows.tolist()] + \
+            _to_records(data, vector_field_name, primary_field_name)
+        self._save_collection(collection_name, codes, rescore_vectors, quantizer, records)
+        print(f"Quantized collection '{collection_name}' updated with {len(data)} vectors.")
+
+        return self._collection_dir(collection_name)
+
+    def _save_collection(self, collection_name: str, codes: np.ndarray, vectors: np.ndarray,
+                         quantizer: ScalarQuantizer, records: list):
+        """Write codes, re-score vectors, quantizer and records and swap them in"""
+        collection_dir = self._collection_dir(collection_name)
+        np.save(os.path.join(collection_dir, "codes.tmp.npy"), codes)
+        np.save(os.path.join(collection_dir, "vectors.tmp.npy"), vectors)
+        quantizer.save(os.path.join(collection_dir, "quantizer.tmp.npz"))
+
+        with open(os.path.join(collection_dir, "records.tmp.jsonl"), "w") as outfile:
+            for record in records:
+                json.dump(record, outfile)
+                outfile.write("\n")
+
+        with self._lock:
+            for file_name in ("codes.npy", "vectors.npy", "quantizer.npz", "records.jsonl"):
+                name, extension = os.path.splitext(file_name)
+                os.replace(os.path.join(collection_dir, f"{name}.tmp{extension}"),
+                           os.path.join(collection_dir, file_name))
+            self._collections.pop(collection_name, None)
+
+    def _load_collection(self, collection_name: str):
+        """Load collection once, codes are kept in memory and float vectors are memory mapped"""
+        with self._lock:
+            if collection_name not in self._collections:
+                collection_dir = self._collection_dir(collection_name)
+                with open(os.path.join(collection_dir, "records.jsonl"), "r") as json_file:
+                    records = [json.loads(line) for line in json_file]
+                self._collections[collection_name] = {
+                    "codes": np.load(os.path.join(collection_dir, "codes.npy"),
+                                     mmap_mode="r" if self.mmap_codes else None),
+                    "vectors": np.load(os.path.join(collection_dir, "vectors.npy"),
+                                       mmap_mode="r"),
+                    "quantizer": ScalarQuantizer.load(os.path.join(collection_dir,
+                                                                   "quantizer.npz")),
+                    "records": records,
+                }
+
+            return self._collections[collection_name]
+
+    def _approximate_scores(self, collection: dict, query: np.ndarray):
+        """Score all codes against the query without decoding the whole collection"""
+        quantizer = collection["quantizer"]
+        codes = collection["codes"]
+        # x ~ min + code * scale, so x.q ~ min.q + code.(scale * q)
+        offset = float(np.dot(quantizer.min_values, query))
+        scaled_query = quantizer.scales * query
+        scores = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], self.block_size):
+            block = codes[start:start + self.block_size].astype(np.float32)
+            scores[start:start + self.block_size] = block @ scaled_query + offset
+
+        return scores
+
+    def search_ids(self, collection_name: str, query_embedding: list, limit: int, rescore=True):
+        """Get (row index, score) of the closest vectors for the query"""
+        return self._search_collection(self._load_collection(collection_name), query_embedding,
+                                       limit, rescore)
+
+    def _search_collection(self, collection: dict, query_embedding: list, limit: int,
+                           rescore: bool=True):
+        """Get (row index, score) of the closest vectors of a loaded collection"""
+        if collection["codes"].shape[0] == 0 or limit <= 0:
+            return []
+        query = _normalize_rows(np.asarray([query_embedding], dtype=np.float32))[0]
+
+        scores = self._approximate_scores(collection, query)
+        num_candidates = min(len(scores), limit * self.rescore_factor if rescore else limit)
+        candidates = np.argpartition(-scores, num_candidates - 1)[:num_candidates]
+
+        if rescore:
+            # Only the candidate rows of the memory mapped vectors are read from disk
+            candidates = np.sort(candidates)
+            candidate_vectors = np.asarray(collection["vectors"][candidates], dtype=np.float32)
+            scores = dict(zip(candidates.tolist(), (candidate_vectors @ query).tolist()))
+        else:
+            scores = {index: float(scores[index]) for index in candidates.tolist()}
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    def query_collection(self, collection_name: str, query_embedding: list,
+                      limit: int, output_fields: list):
+        """Get relevant docs based on similarity between query embedding and vectors in store"""
+        start_time = time.time()
+        if not self.has_collection(collection_name):
+            raise ValueError(f"Collection with {collection_name} does not exist. Please query \
+                on another collection or create a new collection using .create_collection.")
+
+        # Codes and records of the same version, the collection can be replaced meanwhile
+        collection = self._load_collection(collection_name)
+        hits = []
+        for index, score in self._search_collection(collection, query_embedding, limit):
+            record = collection["records"][index]
+            hits.append({
+                "id": record["id"],
+                "distance": score,
+                "entity": {field: record.get(field) for field in output_fields}
+            })
+
+        execution_time = time.time() - start_time
+        print(f"Retrieved in {execution_time:.6f}s.")
+
+        return [hits]
+
+def create_quantized_collections(store_dir: str, embeddings_data: list, collection_name: str,
+                                 shard_configs: dict, rescore_dtype: str="float16"):
+    """Create quantized copies of the full collection and of every shard"""
+    quantized_store = QuantizedVectorStore(store_dir=store_dir)
+    quantized_store.create_collection(collection_name, embeddings_data,
+                                      rescore_dtype=rescore_dtype)
+    for shard_name, shard_data in split_into_shards(embeddings_data, shard_configs).items():
+        quantized_store.create_collection(shard_name, shard_data, rescore_dtype=rescore_dtype)
+
+    return store_dir
+
+def get_disk_size(path: str):
+    """Size in bytes of a file, or of all files in a folder"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+
+    return sum(os.path.getsize(os.path.join(folder, file_name))
+               for folder, _, file_names in os.walk(path) for file_name in file_names)
+
+def get_collection_footprint(collection_dir: str):
+    """Disk size of the codes, re-score vectors, records and quantizer of a collection"""
+    footprint = {}
+    for name, file_name in (("codes", "codes.npy"), ("rescore_vectors", "vectors.npy"),
+                            ("records", "records.jsonl"), ("quantizer", "quantizer.npz")):
+        footprint[f"{name}_bytes"] = get_disk_size(os.path.join(collection_dir, file_name))
+    footprint["total_bytes"] = sum(footprint.values())
+
+    return footprint
+
+def measure_footprint(store_dir: str, milvus_db_path: str):
+    """Compare disk size of the quantized store with the milvus db holding the same
+    collections (the default collection and the shards created during setup)"""
+    footprint = {"codes_bytes": 0, "rescore_vectors_bytes": 0, "records_bytes": 0,
+                 "quantizer_bytes": 0, "total_bytes": 0}
+    for collection_name in sorted(os.listdir(store_dir)):
+        collection_footprint = get_collection_footprint(os.path.join(store_dir, collection_name))
+        for key, value in collection_footprint.items():
+            footprint[key] += value
+    milvus_db_bytes = get_disk_size(milvus_db_path)
+
+    return {
+        "quantized_store": footprint,
+        "milvus_db_bytes": milvus_db_bytes,
+        "reduction_vs_milvus": round(milvus_db_bytes / footprint["total_bytes"], 2)
+                               if footprint["total_bytes"] else None
+    }
+
+def measure_quantization(embeddings_data: list, query_embeddings: list, store_dir: str,
+                         top_k: int=5, rescore_factor: int=4,
+                         vector_field_name: str="chunk_embedding"):
+    """Compare quantized search against exact float search.
+    Returns size of the codes against float32 vectors, disk footprint of the collection
+    (codes, float16 re-score vectors and records) against float32 vectors with the same
+    records, and recall@k with and without re-scoring."""
+    collection_name = "quantization_benchmark"
+    store = QuantizedVectorStore(store_dir, rescore_factor=rescore_factor)
+    store.create_collection(collection_name, embeddings_data, vector_field_name=vector_field_name)
+    collection = store._load_collection(collection_name) # pylint: disable=protected-access
+
+    vectors = _normalize_rows(np.asarray([entry[vector_field_name]
+                                          for entry in embeddings_data
+                                          if entry.get(vector_field_name)], dtype=np.float32))
+    recall = {"int8": 0.0, "int8_rescored": 0.0}
+    for query_embedding in query_embeddings:
+        query = _normalize_rows(np.asarray([query_embedding], dtype=np.float32))[0]
+        expected = set(np.argsort(-(vectors @ query))[:top_k].tolist())
+        for mode, rescore in (("int8", False), ("int8_rescored", True)):
+            found = {index for index, _ in store.search_ids(collection_name, query_embedding,
+                                                            top_k, rescore=rescore)}
+            recall[mode] += len(found & expected) / top_k
+
+    # Store keeps float16 vectors and records next to the codes, compared with float32
+    # vectors and the same records
+    footprint = get_collection_footprint(store._collection_dir(collection_name)) # pylint: disable=protected-access
+    float32_footprint = vectors.nbytes + footprint["records_bytes"]
+    report = {
+        "num_vectors": int(vectors.shape[0]),
+        "float32_bytes": int(vectors.nbytes),
+        "int8_bytes": int(collection["codes"].nbytes),
+        "int8_vs_float32_reduction": round(vectors.nbytes / collection["codes"].nbytes, 2),
+        "store_footprint": footprint,
+        "footprint_reduction": round(float32_footprint / footprint["total_bytes"], 2),
+        f"recall@{top_k}_int8": round(recall["int8"] / len(query_embeddings), 4),
+        f"recall@{top_k}_int8_rescored": round(recall["int8_rescored"] / len(query_embeddings), 4),
+    }
+
+    return report
@@ -40,6 +40,35 @@ class CustomMilvusClient:
             raise ValueError(f"Collection with name '{collection_name}' does not exist. Please \
                     insert into another or create a new collection using .create_collection.")
 
+    def has_collection(self, collection_name: str):
+        """Check if collection exists"""
+        return self.milvus_client.has_collection(collection_name)
+
+    def get_collection_data(self, collection_name: str, batch_size: int=1000):
+        """Get all entries of the collection with their vectors"""
+        iterator = self.milvus_client.query_iterator(collection_name=collection_name,
+                                                     batch_size=batch_size,
+                                                     output_fields=["*"])
+        data = []
+        while True:
+            batch = iterator.next()
+            if not batch:
+                iterator.close()
+                return data
+            data.extend(batch)
+
+    def replace_document(self, collection_name: str, doc_id: str, data: list):
+        """Replace all chunks of a document, chunks of the older version are deleted first"""
+        if not self.milvus_client.has_collection(collection_name):
+            raise ValueError(f"Collection with name '{collection_name}' does not exist. Please \
+                    create a new collection using .create_collection.")
+
+        self.milvus_client.delete(collection_name=collection_name,
+                                  filter=f'doc_id == "{doc_id}"')
+        self.milvus_client.upsert(collection_name=collection_name,
+                                  data=data)
+        print(f"Document '{doc_id}' upserted to collection '{collection_name}'.")
+
     def query_collection(self, collection_name: str, query_embedding: list,
                       limit: int, output_fields: list):
         """Get relevant docs based on similarity between query embedding and vectors in DB"""
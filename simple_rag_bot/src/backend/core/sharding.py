@@ -0,0 +1,189 @@
+"""Modules for sharded collections, shard selection and scatter-gather search"""
+# pylint: disable=too-many-positional-arguments
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+def assign_shard(document_title: str, shard_configs: dict):
+    """Get the shard (collection) name a document belongs to"""
+    for shard_name, document_titles in shard_configs["shards"].items():
+        if document_title in document_titles:
+            return shard_name
+    return shard_configs["default_shard"]
+
+def split_into_shards(embeddings_data: list, shard_configs: dict):
+    """Group chunks with embeddings into shards based on their document title"""
+    sharded_data = {}
+    for chunk in embeddings_data:
+        shard_name = assign_shard(chunk["document_metadata"]["title"], shard_configs)
+        sharded_data.setdefault(shard_name, []).append(chunk)
+
+    return sharded_data
+
+def _normalize(vector: list):
+    """Scale vector to unit length"""
+    norm = math.sqrt(sum(value * value for value in vector))
+    if norm == 0:
+        return list(vector)
+    return [value / norm for value in vector]
+
+def compute_centroid(vectors: list):
+    """Compute the unit length mean vector of the given vectors"""
+    vectors = [_normalize(vector) for vector in vectors if vector]
+    if not vectors:
+        return []
+    centroid = [sum(values) / len(vectors) for values in zip(*vectors)]
+
+    return _normalize(centroid)
+
+def save_centroids(centroids: dict, path: str):
+    """Save shard centroids to a json file"""
+    with open(path, "w") as outfile:
+        json.dump(centroids, outfile)
+
+    return path
+
+class ShardStats:
+    """Running sum and count of the unit length vectors of every shard, kept per document.
+    Centroids of shards changed by ingestion are updated from the sums, without reading all
+    vectors of the shard again"""
+    def __init__(self, stats: dict=None):
+        """Initialize with the sum and count of every shard and of each of its documents"""
+        self.stats = stats or {}
+
+    @classmethod
+    def from_file(cls, path: str):
+        """Load shard stats from a json file created during setup"""
+        with open(path, "r") as json_file:
+            return cls(json.load(json_file))
+
+    def has_shard(self, shard_name: str):
+        """Check if the sums of the shard are kept"""
+        return shard_name in self.stats
+
+    def set_document(self, shard_name: str, doc_id: str, vectors: list):
+        """Add or replace the vectors of a document in the running sum of the shard"""
+        shard = self.stats.setdefault(shard_name, {"sum": [], "count": 0, "documents": {}})
+        vectors = [_normalize(vector) for vector in vectors if vector]
+        document = {"sum": [sum(values) for values in zip(*vectors)], "count": len(vectors)}
+        old_document = shard["documents"].pop(doc_id, None)
+        if old_document:
+            shard["sum"] = [total - value for total, value in zip(shard["sum"],
+                                                                  old_document["sum"])]
+            shard["count"] -= old_document["count"]
+        if document["count"]:
+            shard["sum"] = [total + value for total, value in
+                            zip(shard["sum"] or [0.0] * len(document["sum"]), document["sum"])]
+            shard["count"] += document["count"]
+            shard["documents"][doc_id] = document
+
+    def set_documents(self, shard_name: str, embeddings_data: list,
+                      vector_field_name: str="chunk_embedding"):
+        """Add chunks with embeddings of several documents to the running sum of the shard"""
+        vectors_by_doc = {}
+        for chunk in embeddings_data:
+            vectors_by_doc.setdefault(chunk["doc_id"], []).append(chunk.get(vector_field_name))
+        for doc_id, vectors in vectors_by_doc.items():
+            self.set_document(shard_name, doc_id, vectors)
+
+    def get_centroid(self, shard_name: str):
+        """Unit length mean vector of the shard, same as compute_centroid of all its vectors"""
+        shard = self.stats.get(shard_name)
+        if not shard or not shard["count"]:
+            return []
+
+        return _normalize(shard["sum"])
+
+    def save(self, path: str):
+        """Save shard stats to a json file"""
+        with open(path, "w") as outfile:
+            json.dump(self.stats, outfile)
+
+        return path
+
+class ShardSelector:
+    """Selects the shards to search for a query using the similarity with shard centroids"""
+    def __init__(self, centroids: dict, min_similarity: float=0.3,
+                 similarity_margin: float=0.1, max_shards: int=2):
+        """Initialize shard selector with centroid of every shard and selection params"""
+        self.centroids = {shard_name: _normalize(centroid)
+                          for shard_name, centroid in centroids.items() if centroid}
+        self.min_similarity = min_similarity
+        self.similarity_margin = similarity_margin
+        self.max_shards = max_shards
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs):
+        """Load shard centroids from a json file created during setup"""
+        with open(path, "r") as json_file:
+            centroids = json.load(json_file)
+
+        return cls(centroids, **kwargs)
+
+    def update_centroid(self, shard_name: str, centroid: list):
+        """Replace centroid of a shard, e.g. after documents are ingested into it.
+        Centroids are swapped as a new dict, so concurrent selections are not affected"""
+        self.centroids = {**self.centroids, shard_name: _normalize(centroid)}
+
+    def get_shard_scores(self, query_embedding: list):
+        """Get cosine similarity between query and each shard, best match first"""
+        query_embedding = _normalize(query_embedding)
+        scores = {
+            shard_name: sum(q * c for q, c in zip(query_embedding, centroid))
+            for shard_name, centroid in self.centroids.items()
+        }
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+    def select(self, query_embedding: list):
+        """Get shard names worth searching for the query.
+        The best matching shard is always selected, others are skipped when they are below the
+        similarity threshold or too far behind the best shard."""
+        shard_scores = self.get_shard_scores(query_embedding)
+        if not shard_scores:
+            return []
+
+        best_score = shard_scores[0][1]
+        selected_shards = [shard_scores[0][0]]
+        for shard_name, score in shard_scores[1:self.max_shards]:
+            if score >= self.min_similarity and best_score - score <= self.similarity_margin:
+                selected_shards.append(shard_name)
+
+        return selected_shards
+
+def scatter_gather_query(retriever, collection_names: list, query_embedding: list,
+                         limit: int, output_fields: list, max_workers: int=4):
+    """Search the collections concurrently and merge their hits into a single top-k result.
+    Result follows the same format as a single milvus search, i.e. [[hit1, hit2, ...]]"""
+    if not collection_names:
+        return [[]]
+    start_time = time.time()
+
+    def search_shard(collection_name):
+        """Search a single shard"""
+        result = retriever.query_collection(collection_name=collection_name,
+                                            query_embedding=query_embedding,
+                                            limit=limit,
+                                            output_fields=output_fields)
+        hits = []
+        for hit in result[0]:
+            hit = dict(hit)
+            hit["collection_name"] = collection_name
+            hits.append(hit)
+        return hits
+
+    if len(collection_names) == 1:
+        shard_results = [search_shard(collection_names[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(collection_names))) as executor:
+            shard_results = list(executor.map(search_shard, collection_names))
+
+    # Collections use COSINE metric, higher distance means more similar
+    merged_hits = sorted((hit for hits in shard_results for hit in hits),
+                         key=lambda hit: hit["distance"], reverse=True)[:limit]
+
+    execution_time = time.time() - start_time
+    print(f"Searched {len(collection_names)} shard(s) in {execution_time:.6f}s.")
+
+    return [merged_hits]
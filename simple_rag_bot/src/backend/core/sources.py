@@ -0,0 +1,139 @@
+"""Modules for fetching remote pdf documents to be ingested"""
+# pylint: disable=too-many-positional-arguments
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from urllib.parse import urlparse, unquote
+import httpx
+
+class RemoteDocumentFetcher:
+    """Downloads documents concurrently using a pooled async http client.
+    ETag and Last-Modified of every download are kept in a manifest, and sent back as
+    conditional headers so unchanged files are skipped (304 Not Modified).
+    Responses are streamed to disk, whole files are never held in memory."""
+    def __init__(self, download_dir: str, manifest_path: str=None, max_concurrency: int=8,
+                 timeout: float=60.0, chunk_size: int=64 * 1024):
+        """Initialize fetcher with download folder and connection limits"""
+        self.download_dir = download_dir
+        self.manifest_path = manifest_path or os.path.join(download_dir, "manifest.json")
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self._manifest_lock = threading.Lock()
+        os.makedirs(download_dir, exist_ok=True)
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        """Load validators of previous downloads"""
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, "r") as manifest_file:
+            return json.load(manifest_file)
+
+    def _save_manifest(self):
+        """Save validators of downloads"""
+        with self._manifest_lock:
+            with open(self.manifest_path, "w") as manifest_file:
+                json.dump(self.manifest, manifest_file, indent=2)
+
+    def get_local_path(self, url: str):
+        """Local file path of the url, url hash avoids clashes of same file names"""
+        file_name = unquote(os.path.basename(urlparse(url).path)) or "document.pdf"
+        url_hash = hashlib.sha1(url.encode("utf-8")).hexdigest()[:10]
+
+        return os.path.join(self.download_dir, f"{url_hash}_{file_name}")
+
+    def _conditional_headers(self, url: str, local_path: str):
+        """If-None-Match/If-Modified-Since headers, only if the earlier download still exists"""
+        validators = self.manifest.get(url)
+        if not validators or not os.path.exists(local_path):
+            return {}
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+        return headers
+
+    async def _fetch(self, client, semaphore, url: str):
+        """Download a single url to disk unless it is not modified"""
+        local_path = self.get_local_path(url)
+        # Written to a temporary file first, so a failed download never replaces the earlier
+        # version, and removed if the download fails
+        temp_path = f"{local_path}.part"
+        result = {"url": url, "path": local_path, "status": "failed", "bytes": 0, "error": None}
+        start_time = time.time()
+        async with semaphore:
+            try:
+                async with client.stream("GET", url,
+                                         headers=self._conditional_headers(url, local_path)
+                                         ) as response:
+                    if response.status_code == 304:
+                        result["status"] = "not_modified"
+                        return result
+                    response.raise_for_status()
+
+                    with open(temp_path, "wb") as output_file:
+                        async for data in response.aiter_bytes(self.chunk_size):
+                            output_file.write(data)
+                            result["bytes"] += len(data)
+                    os.replace(temp_path, local_path)
+
+                    self.manifest[url] = {
+                        "path": local_path,
+                        "etag": response.headers.get("etag"),
+                        "last_modified": response.headers.get("last-modified"),
+                    }
+                    result["status"] = "downloaded"
+            except (httpx.HTTPError, OSError) as e:
+                print(f"Unable to fetch {url} due to {e}.")
+                result["error"] = str(e)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                result["seconds"] = round(time.time() - start_time, 3)
+
+        return result
+
+    async def fetch_all_async(self, urls: list):
+        """Fetch all urls concurrently, at most `max_concurrency` at a time"""
+        limits = httpx.Limits(max_connections=self.max_concurrency,
+                              max_keepalive_connections=self.max_concurrency)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with httpx.AsyncClient(limits=limits, timeout=self.timeout,
+                                     follow_redirects=True) as client:
+            results = await asyncio.gather(*[self._fetch(client, semaphore, url)
+                                             for url in urls])
+        self._save_manifest()
+
+        return list(results)
+
+    def fetch_all(self, urls: list):
+        """Fetch all urls concurrently, for use from sync code"""
+        return asyncio.run(self.fetch_all_async(urls))
+
+def chunk_remote_documents(fetch_results: list, document_splitter):
+    """Chunk downloaded documents with PDFTextSplitter, chunks refer to the remote url"""
+    chunked_file_data = []
+    for result in fetch_results:
+        if result["status"] != "downloaded":
+            continue
+        doc_id, pdf_text, page_info = document_splitter.get_page_info(result["path"],
+                                                                      result["url"])
+        chunked_file_data.extend(document_splitter.get_chunks_with_info(result["url"], pdf_text,
+                                                                        page_info, doc_id))
+
+    return chunked_file_data
+
+def submit_remote_documents(ingestion_service, fetcher: RemoteDocumentFetcher, urls: list):
+    """Fetch urls and submit new or modified documents to the ingestion service"""
+    job_ids = []
+    for result in fetcher.fetch_all(urls):
+        if result["status"] == "downloaded":
+            job_ids.append(ingestion_service.submit(result["path"], source_url=result["url"]))
+
+    return job_ids
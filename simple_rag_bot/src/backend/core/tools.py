@@ -1,30 +1,239 @@
 """Tools file"""
+# pylint: disable=import-outside-toplevel,invalid-name
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from langchain_core.tools import tool
 
 from backend.config import GEMINI_API_KEY
-from backend.core.embedding import EmbeddingClient
-from backend.core.retriever import CustomMilvusClient
+from backend.ml_config import SHARD_CONFIGS, QUANTIZATION_CONFIGS, EXPANSION_CONFIGS
+from backend.ml_config import CITATION_CONFIGS
+from backend.core.sharding import ShardSelector, scatter_gather_query
+from backend.core.multi_query import reciprocal_rank_fusion
 
-embedding_instance = EmbeddingClient(embedding_api_key=GEMINI_API_KEY)
-retriever_instance = CustomMilvusClient(uri="backend/local_db/local_milvus.db")
+MILVUS_DB_PATH = "backend/local_db/local_milvus.db"
+
+# Clients are created on first use (or by warm up), not at import
+embedding_instance = None
+retriever_instance = None
+shard_selector = None
+_shard_selector_loaded = False
+chunk_index = None
+_chunk_index_loaded = False
+citation_store = None
+_citation_store_loaded = False
+_clients_lock = threading.Lock()
+
+def load_retriever(quantization_configs: dict):
+    """Load quantized vector store if enabled and created during setup, else milvus client.
+    In multi worker mode (RAG_SHARED_INDEX is set), the quantized store is memory mapped so
+    that all workers share one read only copy, milvus lite db can only be opened by a single
+    process."""
+    shared_index = bool(os.environ.get("RAG_SHARED_INDEX"))
+    store_dir = os.environ.get("RAG_INDEX_DIR", quantization_configs["store_dir"])
+    if shared_index and not os.path.exists(store_dir):
+        # Workers would all open the same milvus lite db
+        raise ValueError(f"Shared quantized index not found at {store_dir}, create it using "
+                         "the setup before serving with multiple workers.")
+    if (quantization_configs["enabled"] or shared_index) and os.path.exists(store_dir):
+        from backend.core.quantization import QuantizedVectorStore
+        print("Using quantized vector store.")
+        return QuantizedVectorStore(store_dir=store_dir,
+                                    rescore_factor=quantization_configs["rescore_factor"],
+                                    mmap_codes=shared_index)
+
+    return load_milvus_client()
+
+def load_milvus_client():
+    """Load milvus client of the db created during setup"""
+    from backend.core.retriever import CustomMilvusClient
+    return CustomMilvusClient(uri=MILVUS_DB_PATH)
+
+def load_shard_selector(shard_configs: dict):
+    """Load shard selector if the sharded collections were created during setup"""
+    if not os.path.exists(shard_configs["centroids_path"]):
+        print("Shard centroids not found, using default collection.")
+        return None
+
+    return ShardSelector.from_file(shard_configs["centroids_path"],
+                                   min_similarity=shard_configs["min_centroid_similarity"],
+                                   similarity_margin=shard_configs["centroid_similarity_margin"],
+                                   max_shards=shard_configs["max_shards"])
+
+def load_chunk_index(expansion_configs: dict):
+    """Load chunk index if chunks were saved during setup. The index is used to fill
+    retrieved ids with chunk data and to expand chunks with their neighbours"""
+    if not os.path.exists(expansion_configs["chunks_path"]):
+        print("Chunks file not found, chunk data will be retrieved from the vector db.")
+        return None
+
+    from backend.core.chunk_index import ChunkIndex
+    return ChunkIndex.from_file(expansion_configs["chunks_path"])
+
+def load_citation_store(citation_configs: dict):
+    """Load citation records if they were created during setup"""
+    if not os.path.exists(citation_configs["citations_path"]):
+        print("Citations file not found, citations will be formatted per request.")
+        return None
+
+    from backend.core.citations import CitationStore
+    return CitationStore.from_file(citation_configs["citations_path"])
+
+def get_embedding_instance():
+    """Get embedding client, created on first use"""
+    global embedding_instance # pylint: disable=global-statement
+    with _clients_lock:
+        if embedding_instance is None:
+            from backend.core.embedding import EmbeddingClient
+            embedding_instance = EmbeddingClient(embedding_api_key=GEMINI_API_KEY)
+
+    return embedding_instance
+
+def get_retriever_instance():
+    """Get retriever client, created on first use"""
+    global retriever_instance # pylint: disable=global-statement
+    with _clients_lock:
+        if retriever_instance is None:
+            retriever_instance = load_retriever(QUANTIZATION_CONFIGS)
+
+    return retriever_instance
+
+def get_shard_selector():
+    """Get shard selector, loaded on first use. None if shards are not created"""
+    global shard_selector, _shard_selector_loaded # pylint: disable=global-statement
+    with _clients_lock:
+        if not _shard_selector_loaded:
+            shard_selector = load_shard_selector(SHARD_CONFIGS)
+            _shard_selector_loaded = True
+
+    return shard_selector
+
+def get_chunk_index():
+    """Get chunk index, loaded on first use. None if expansion is disabled"""
+    global chunk_index, _chunk_index_loaded # pylint: disable=global-statement
+    with _clients_lock:
+        if not _chunk_index_loaded:
+            chunk_index = load_chunk_index(EXPANSION_CONFIGS)
+            _chunk_index_loaded = True
+
+    return chunk_index
+
+def get_citation_store():
+    """Get citation store, loaded on first use. None if citations are not created"""
+    global citation_store, _citation_store_loaded # pylint: disable=global-statement
+    with _clients_lock:
+        if not _citation_store_loaded:
+            citation_store = load_citation_store(CITATION_CONFIGS)
+            _citation_store_loaded = True
+
+    return citation_store
+
+def configure_clients(embedding_client=None, retriever_client=None, use_shards: bool=True):
+    """Replace the clients used by the tools, e.g. with pooled or offline clients"""
+    global embedding_instance, retriever_instance, shard_selector # pylint: disable=global-statement
+    global _shard_selector_loaded # pylint: disable=global-statement
+    with _clients_lock:
+        if embedding_client:
+            embedding_instance = embedding_client
+        if retriever_client:
+            retriever_instance = retriever_client
+        if not use_shards:
+            shard_selector = None
+            _shard_selector_loaded = True
+
+def warm_up_clients():
+    """Create all clients ahead of the first request"""
+    get_embedding_instance()
+    get_retriever_instance()
+    get_shard_selector()
+    get_chunk_index()
+    get_citation_store()
+
+# Chunk offsets are needed to merge overlapping chunks before generation
+RETRIEVAL_OUTPUT_FIELDS = ["content", "page_span", "document_metadata", "doc_id", "chunk_metadata"]
+
+def get_output_fields():
+    """Fields fetched from the vector db. Only ids and scores are fetched when the chunk
+    index is available, chunk data is filled from the index afterwards"""
+    if get_chunk_index():
+        return []
+
+    return RETRIEVAL_OUTPUT_FIELDS
+
+def hydrate_relevant_docs(relevant_docs: list):
+    """Fill chunk data of docs retrieved with ids and scores only"""
+    if get_chunk_index():
+        return get_chunk_index().hydrate_hits(relevant_docs, RETRIEVAL_OUTPUT_FIELDS)
+
+    return relevant_docs
 
 def get_relevant_docs(collection_name: str, query: str, top_n: int=3):
     """Get relevant docs for a given query"""
-    query_embedding = embedding_instance.get_query_embeddings(content=query)
+    query_embedding = get_embedding_instance().get_query_embeddings(content=query)
+
+    docs = get_retriever_instance().query_collection(collection_name=collection_name,
+                                                     query_embedding=query_embedding,
+                                                     limit=top_n,
+                                                     output_fields=get_output_fields())
+
+    return hydrate_relevant_docs(docs)
 
-    docs = retriever_instance.query_collection(collection_name=collection_name,
-                                                query_embedding=query_embedding,
-                                                limit=top_n,
-                                                output_fields=["content",
-                                                               "page_span",
-                                                               "document_metadata"]
-                                                )
+def get_relevant_docs_from_shards(query: str, top_n: int=3):
+    """Get relevant docs for a given query by searching only the shards that can match"""
+    query_embedding = get_embedding_instance().get_query_embeddings(content=query)
+    shard_names = get_shard_selector().select(query_embedding)
+    print(f"Selected shards: {shard_names}")
 
-    return docs
+    docs = scatter_gather_query(retriever=get_retriever_instance(),
+                                collection_names=shard_names,
+                                query_embedding=query_embedding,
+                                limit=top_n,
+                                output_fields=get_output_fields(),
+                                max_workers=SHARD_CONFIGS["max_workers"])
+
+    return hydrate_relevant_docs(docs)
+
+def search_relevant_docs(query_embedding: list, top_n: int=3):
+    """Search the selected shards, or the default collection, with a query embedding"""
+    if get_shard_selector():
+        return scatter_gather_query(retriever=get_retriever_instance(),
+                                    collection_names=get_shard_selector().select(query_embedding),
+                                    query_embedding=query_embedding,
+                                    limit=top_n,
+                                    output_fields=get_output_fields(),
+                                    max_workers=SHARD_CONFIGS["max_workers"])
+
+    return get_retriever_instance().query_collection(
+        collection_name=SHARD_CONFIGS["default_collection"],
+        query_embedding=query_embedding,
+        limit=top_n,
+        output_fields=get_output_fields()
+    )
+
+def get_relevant_docs_multi_query(queries: list, top_n: int=3, rrf_k: int=60,
+                                  max_workers: int=4):
+    """Get relevant docs for several variations of a query.
+    Queries are embedded in one batch and searched concurrently, results are merged using
+    reciprocal rank fusion."""
+    query_embeddings = get_embedding_instance().get_query_embeddings_batch(contents=queries)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(queries))) as executor:
+        results = list(executor.map(lambda query_embedding: search_relevant_docs(query_embedding,
+                                                                                 top_n)[0],
+                                    query_embeddings))
+
+    return hydrate_relevant_docs(reciprocal_rank_fusion(results, k=rrf_k, limit=top_n))
+
+def expand_relevant_docs(relevant_docs: list):
+    """Expand retrieved chunks with their neighbours if enabled and chunk index is available"""
+    if EXPANSION_CONFIGS["enabled"] and get_chunk_index():
+        return get_chunk_index().expand_hits(relevant_docs, window=EXPANSION_CONFIGS["window"])
+
+    return relevant_docs
 
 @tool
 def get_relevant_docs_tool(query: str) -> list:
-    """Utilize this function if user asks any questions related to climate change, 
+    """Utilize this function if user asks any questions related to climate change,
     recipes and LLMs terminology.
     This tool searches and return information about recipes, LLM terminology and climate change.
     For all user questions, utlize this tool to get relevant sources for answering user query.
@@ -32,9 +241,13 @@ def get_relevant_docs_tool(query: str) -> list:
         query: The exact question asked by the user without any modifications
     """
     print("---CALL RETRIEVER--")
-    collection_name = "local_pdf_rag"
-    relevant_docs = get_relevant_docs(collection_name=collection_name,
-                                        query=query)
+    if get_shard_selector():
+        relevant_docs = get_relevant_docs_from_shards(query=query)
+    else:
+        collection_name = SHARD_CONFIGS["default_collection"]
+        relevant_docs = get_relevant_docs(collection_name=collection_name,
+                                          query=query)
+    relevant_docs = expand_relevant_docs(relevant_docs)
     # reranking logic etc can be added
 
     return relevant_docs
@@ -0,0 +1,65 @@
+"""Import time profile of the app modules using `python -X importtime`.
+Run from the src folder: python -m backend.import_profile"""
+import re
+import sys
+import subprocess
+
+IMPORT_TIME_PATTERN = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)")
+
+def profile_imports(module_name: str):
+    """Import module in a fresh interpreter and parse the import time of every module"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+                            capture_output=True, text=True, check=False)
+    if result.returncode != 0:
+        raise ValueError(f"Unable to import {module_name}: {result.stderr.splitlines()[-1]}")
+
+    imports = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_PATTERN.match(line)
+        if match:
+            imports.append({
+                "module": match.group(4),
+                "self_ms": int(match.group(1)) / 1000,
+                "cumulative_ms": int(match.group(2)) / 1000,
+                # Nested imports are indented by two spaces per level
+                "depth": (len(match.group(3)) - 1) // 2
+            })
+
+    return imports
+
+def import_profile_report(module_name: str, top_n: int=15):
+    """Get total import time of the module and its slowest top level dependencies"""
+    imports = profile_imports(module_name)
+    module_index = next(index for index, entry in enumerate(imports)
+                        if entry["module"] == module_name and entry["depth"] == 0)
+
+    # Dependencies are listed before the module that imports them, direct dependencies of the
+    # module are the depth 1 entries after the previous top level import
+    direct_imports = []
+    for entry in reversed(imports[:module_index]):
+        if entry["depth"] == 0:
+            break
+        if entry["depth"] == 1:
+            direct_imports.append(entry)
+    slowest = sorted(direct_imports, key=lambda entry: entry["cumulative_ms"], reverse=True)
+
+    report = {
+        "module": module_name,
+        "total_ms": imports[module_index]["cumulative_ms"],
+        "num_modules": len(imports),
+        "slowest_imports": slowest[:top_n]
+    }
+
+    return report
+
+def print_import_profile(module_names: list, top_n: int=10):
+    """Print import time report of the modules"""
+    for module_name in module_names:
+        report = import_profile_report(module_name, top_n=top_n)
+        print(f"\n{module_name}: {report['total_ms']:.1f}ms "
+              f"({report['num_modules']} modules imported)")
+        for entry in report["slowest_imports"]:
+            print(f"  {entry['cumulative_ms']:10.1f}ms  {entry['module']}")
+
+if __name__ == "__main__":
+    print_import_profile(["backend.core.tools", "backend.core.chat", "app"])
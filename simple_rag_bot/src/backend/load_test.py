@@ -0,0 +1,180 @@
+"""Load generator and soak test of the rag app with concurrent multi turn conversations.
+Uses fake llm and embedding clients with configurable latency, so it runs offline.
+Run from the src folder: python -m backend.load_test"""
+# pylint: disable=too-many-positional-arguments,too-many-locals,too-many-arguments
+import os
+import time
+import random
+import threading
+import resource
+from concurrent.futures import ThreadPoolExecutor
+from backend.core import tools
+from backend.core.chat import RAGApp
+from backend.core.fakes import FakeChatModel, FakeEmbeddingClient
+from backend.core.quantization import QuantizedVectorStore
+from backend.serving_benchmark import build_benchmark_index
+
+CONVERSATIONS = [
+    ["hi there", "What are the main greenhouse gases?", "How do they trap heat?", "thanks"],
+    ["How to make chilli con carne?", "Can I make it without beans?",
+     "What should I serve it with?"],
+    ["What is an agent in LLMs?", "What tools can it use?", "How is it different from a chain?",
+     "bye"],
+    ["How does climate change affect sea levels?", "Which regions are most at risk?"],
+    ["hello", "What is net zero?", "When should we reach it?", "thank you"],
+    ["Give me an easy pasta recipe", "How long does it take?", "Is it vegetarian?"],
+]
+
+def get_memory_mb():
+    """Current resident memory of the process in MB, peak memory if not on linux"""
+    try:
+        with open("/proc/self/statm", "r") as statm_file:
+            resident_pages = int(statm_file.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def percentiles(values: list):
+    """p50, p95 and p99 of the values in milliseconds"""
+    if not values:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0}
+    values = sorted(values)
+
+    def percentile(fraction):
+        """Value at the fraction of sorted values"""
+        return round(values[min(len(values) - 1, int(fraction * len(values)))] * 1000, 2)
+
+    return {"p50_ms": percentile(0.5), "p95_ms": percentile(0.95), "p99_ms": percentile(0.99)}
+
+class LoadTest:
+    """Replays conversations against the rag app and collects latency, errors and memory.
+    Conversations arrive at `arrival_rate` per second (poisson arrivals), or back to back if
+    arrival rate is None, and at most `concurrency` conversations run at the same time."""
+    def __init__(self, rag_app, conversations: list=None, concurrency: int=8,
+                 arrival_rate: float=None, think_time: float=0.0):
+        """Initialize load test with the app and load shape"""
+        self.rag_app = rag_app
+        self.conversations = conversations or CONVERSATIONS
+        self.concurrency = concurrency
+        self.arrival_rate = arrival_rate
+        self.think_time = think_time
+        self._lock = threading.Lock()
+        self._turn_latencies = []
+        self._node_latencies = {}
+        self._errors = {}
+        self._memory_samples = []
+
+    def _run_conversation(self, conversation: list):
+        """Send the turns of a conversation one after another in a new session"""
+        session_id = self.rag_app.conversation_store.create_session()
+        for user_input in conversation:
+            node_timings = {}
+            start_time = time.perf_counter()
+            try:
+                self.rag_app.generate_rag_response(user_input, session_id,
+                                                   node_timings=node_timings)
+            except Exception as e:
+                with self._lock:
+                    error_name = type(e).__name__
+                    self._errors[error_name] = self._errors.get(error_name, 0) + 1
+                continue
+            latency = time.perf_counter() - start_time
+            with self._lock:
+                self._turn_latencies.append(latency)
+                for node, node_latency in node_timings.items():
+                    self._node_latencies.setdefault(node, []).append(node_latency)
+            if self.think_time:
+                time.sleep(random.expovariate(1 / self.think_time))
+        self.rag_app.conversation_store.delete_session(session_id)
+
+    def _sample_memory(self, stop_event, start_time: float, sample_interval: float):
+        """Record resident memory every sample interval until stopped"""
+        while not stop_event.is_set():
+            self._memory_samples.append((round(time.time() - start_time, 2), get_memory_mb()))
+            stop_event.wait(sample_interval)
+
+    def run(self, duration: float=30.0, sample_interval: float=1.0):
+        """Start conversations for `duration` seconds, wait for them to finish and report"""
+        stop_event = threading.Event()
+        start_time = time.time()
+        memory_thread = threading.Thread(target=self._sample_memory,
+                                         args=(stop_event, start_time, sample_interval),
+                                         daemon=True)
+        memory_thread.start()
+
+        num_conversations = 0
+        slots = threading.Semaphore(self.concurrency)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while time.time() - start_time < duration:
+                conversation = self.conversations[num_conversations % len(self.conversations)]
+                # Arrivals wait for a free slot, so the load never exceeds the concurrency
+                slots.acquire() # pylint: disable=consider-using-with
+                future = executor.submit(self._run_conversation, conversation)
+                future.add_done_callback(lambda _: slots.release())
+                num_conversations += 1
+                if self.arrival_rate:
+                    time.sleep(random.expovariate(self.arrival_rate))
+        elapsed = time.time() - start_time
+        stop_event.set()
+        memory_thread.join()
+        self._memory_samples.append((round(elapsed, 2), get_memory_mb()))
+
+        return self.report(num_conversations, elapsed)
+
+    def report(self, num_conversations: int, elapsed: float):
+        """Throughput, latency percentiles per node, error rate and memory growth"""
+        num_errors = sum(self._errors.values())
+        num_turns = len(self._turn_latencies) + num_errors
+        first_memory = self._memory_samples[0][1]
+        last_memory = self._memory_samples[-1][1]
+        # Memory rises while threads and caches warm up, growth in the second half of the run
+        # is the better signal of a leak in long soak runs
+        mid_time, mid_memory = next(sample for sample in self._memory_samples
+                                    if sample[0] >= elapsed / 2)
+        steady_minutes = (elapsed - mid_time) / 60
+
+        return {
+            "conversations": num_conversations,
+            "turns": num_turns,
+            "elapsed_seconds": round(elapsed, 2),
+            "turns_per_second": round(num_turns / elapsed, 2) if elapsed else 0.0,
+            "error_rate": round(num_errors / num_turns, 4) if num_turns else 0.0,
+            "errors": dict(self._errors),
+            "turn_latency": percentiles(self._turn_latencies),
+            "node_latency": {node: percentiles(latencies)
+                             for node, latencies in sorted(self._node_latencies.items())},
+            "memory_mb": {
+                "start": round(first_memory, 1),
+                "end": round(last_memory, 1),
+                "peak": round(max(memory for _, memory in self._memory_samples), 1),
+                "growth_mb_per_minute": round((last_memory - first_memory) * 60 / elapsed, 2),
+                "steady_growth_mb_per_minute": round((last_memory - mid_memory) / steady_minutes, 2)
+                                               if steady_minutes else 0.0
+            },
+            "memory_samples": self._memory_samples
+        }
+
+def run_load_test(duration: float=30.0, concurrency: int=8, arrival_rate: float=None,
+                  think_time: float=0.0, llm_latency: float=0.05, embedding_latency: float=0.02,
+                  llm_failure_rate: float=0.0, store_dir: str="backend/local_db/serving_benchmark"):
+    """Run load test against the rag app with fake clients and print the report"""
+    if not os.path.exists(store_dir):
+        build_benchmark_index(store_dir)
+    tools.configure_clients(embedding_client=FakeEmbeddingClient(latency=embedding_latency),
+                            retriever_client=QuantizedVectorStore(store_dir=store_dir),
+                            use_shards=False)
+    rag_app = RAGApp({
+        "model": "gemini-2.0-flash",
+        "chat_model": FakeChatModel(latency=llm_latency, failure_rate=llm_failure_rate)
+    })
+    # Load indexes before measuring, so memory growth is only from serving
+    rag_app.warm_up()
+
+    report = LoadTest(rag_app, concurrency=concurrency, arrival_rate=arrival_rate,
+                      think_time=think_time).run(duration=duration)
+    print({key: value for key, value in report.items() if key != "memory_samples"})
+
+    return report
+
+if __name__ == "__main__":
+    run_load_test()
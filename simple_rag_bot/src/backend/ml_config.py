@@ -17,3 +17,128 @@ LLM_CONFIGS = {
         "temperature": 0.0,
     }
 }
+
+# Exact match cache of llm responses, used only for models with temperature 0. Entries are
+# keyed on model config and prompt messages and shared by all workers through sqlite.
+LLM_CACHE_CONFIGS = {
+    "enabled": True,
+    "db_path": "backend/local_db/llm_cache.db",
+    "max_entries": 10000,
+    "ttl_seconds": 7 * 24 * 3600,
+}
+
+# Each shard is a separate milvus collection holding the chunks of a topic/document group.
+# Documents not listed in any shard are placed in the default shard.
+SHARD_CONFIGS = {
+    # Single collection with all chunks, used when shards are not created
+    "default_collection": "local_pdf_rag",
+    "default_shard": "general",
+    "centroids_path": "backend/local_db/shard_centroids.json",
+    # Running sums of the shard vectors, centroids are updated from them during ingestion
+    "stats_path": "backend/local_db/shard_stats.json",
+    "shards": {
+        "climate_change": [
+            "Introduction_to_climate_change_FINAL_002.pdf",
+            "Understanding_Climate_Change.pdf",
+            "understanding-climate-change-2008.pdf",
+        ],
+        "recipes": [
+            "20 Easy International Recipes.pdf",
+            "Easy_recipes.pdf",
+        ],
+        "llm_agents": [
+            "Newwhitepaper_Agents2.pdf",
+            "LLM Powered Autonomous Agents _ Lil'Log.pdf",
+        ],
+    },
+    # Shards whose centroid similarity with the query is below the threshold or too far
+    # behind the best matching shard are skipped. The best shard is always searched.
+    "min_centroid_similarity": 0.3,
+    "centroid_similarity_margin": 0.1,
+    "max_shards": 2,
+    "max_workers": 4,
+}
+
+# Quantized storage keeps 8 bit codes of the embeddings in memory for search and re-scores
+# the top (limit * rescore_factor) candidates with memory mapped float vectors.
+QUANTIZATION_CONFIGS = {
+    "enabled": False,
+    "store_dir": "backend/local_db/quantized",
+    "rescore_factor": 4,
+    "rescore_dtype": "float16",
+    # Embeddings saved during setup, used to create the store when serving with gunicorn
+    "embeddings_path": "backend/local_db/embeddings.jsonl",
+}
+
+# Multi worker serving, see gunicorn.conf.py. Workers share the read only quantized index
+# (memory mapped) and keep sessions in a sqlite db so that any worker can serve any session.
+SERVING_CONFIGS = {
+    "workers": 4,
+    "threads": 4,
+    "bind": "0.0.0.0:32123",
+    "session_db_path": "backend/local_db/sessions.db",
+}
+
+# Startup optimised mode: app starts serving without importing the rag backend, which is
+# loaded on first request or by a background warm up started with the app.
+STARTUP_CONFIGS = {
+    "lazy_startup": True,
+    "warm_up_on_start": True,
+}
+
+# Retrieved chunks are expanded with `window` neighbouring chunks on either side, looked up
+# by position in the document from the chunks saved during setup (no extra vector search).
+# When the chunks file exists, only ids and scores are fetched from the vector db and the
+# chunk data is filled from it.
+EXPANSION_CONFIGS = {
+    "enabled": True,
+    "window": 1,
+    "chunks_path": "backend/local_db/chunked_content.jsonl",
+}
+
+# Multi query retrieval: one llm call generates `num_queries` variations of the question,
+# all queries are embedded in one batch, searched concurrently and merged with rank fusion.
+MULTI_QUERY_CONFIGS = {
+    "enabled": False,
+    "num_queries": 3,
+    "top_n": 3,
+    "rrf_k": 60,
+    "max_workers": 4,
+}
+
+# Citation records (title, url with page anchor and short preview) are created during setup
+# and looked up by chunk id at query time.
+CITATION_CONFIGS = {
+    "citations_path": "backend/local_db/citations.jsonl",
+    "preview_length": 150,
+}
+
+# Compression of retrieved sources before generation. Overlapping chunks of a document are
+# merged and sentences least relevant to the query are dropped to fit in the token budget.
+COMPRESSION_CONFIGS = {
+    "enabled": True,
+    "token_budget": 1500,
+}
+
+# Near duplicate detection of chunks before embedding, using minhash signatures with
+# `bands` lsh bands. Chunks with estimated jaccard similarity above threshold are dropped.
+# Signatures of the corpus chunks are saved during setup, ingested chunks are compared with
+# them as well (e.g. the same pdf added again under another name).
+DEDUP_CONFIGS = {
+    "enabled": True,
+    "threshold": 0.85,
+    "num_perm": 64,
+    "bands": 8,
+    "shingle_size": 5,
+    "index_path": "backend/local_db/minhash_index.npz",
+}
+
+# Background ingestion of pdf files added to the watched directory while the app is serving.
+# Stages (extract -> chunk -> embed -> upsert) are connected by queues of `queue_size` jobs.
+INGESTION_CONFIGS = {
+    "enabled": False,
+    "watch_dir": "../documents",
+    "poll_interval": 10.0,
+    "queue_size": 4,
+    "embed_workers": 2,
+}
@@ -0,0 +1,117 @@
+"""Benchmark requests per second of the rag backend against number of worker processes.
+Uses fake llm and embedding clients, so it runs offline and measures only the serving overhead.
+Run from the src folder: python -m backend.serving_benchmark"""
+# pylint: disable=too-many-positional-arguments,too-many-locals,import-outside-toplevel
+import os
+import time
+import threading
+import multiprocessing
+from backend.ml_config import SHARD_CONFIGS
+from backend.core.fakes import FakeChatModel, FakeEmbeddingClient
+from backend.core.quantization import QuantizedVectorStore
+from backend.utils.utility import load_embeddings
+
+BENCHMARK_QUERIES = [
+    "How to make chilli con carne?",
+    "What are the main greenhouse gases?",
+    "hi there",
+    "What is an agent in LLMs?",
+    "How does climate change affect sea levels?",
+    "thanks for the help",
+]
+
+def build_benchmark_index(store_dir: str,
+                          chunks_path: str="backend/local_db/chunked_content.jsonl"):
+    """Build a quantized index of the chunks using fake embeddings"""
+    chunks_data = load_embeddings(chunks_path)
+    embeddings_data = FakeEmbeddingClient().generate_embeddings(chunks_data)
+    QuantizedVectorStore(store_dir=store_dir).create_collection(
+        SHARD_CONFIGS["default_collection"], embeddings_data
+    )
+
+    return store_dir
+
+def _benchmark_worker(store_dir: str, duration: float, threads: int, llm_latency: float,
+                      embedding_latency: float, ready, start_event, results):
+    """Worker process, loads the shared index and serves requests until duration ends"""
+    # Workers share one read only memory mapped copy of the index
+    os.environ["RAG_SHARED_INDEX"] = "1"
+    os.environ["RAG_INDEX_DIR"] = store_dir
+    from backend.core import tools
+    from backend.core.chat import RAGApp
+
+    tools.configure_clients(embedding_client=FakeEmbeddingClient(latency=embedding_latency),
+                            use_shards=False)
+    rag_app = RAGApp({
+        "model": "gemini-2.0-flash",
+        "chat_model": FakeChatModel(latency=llm_latency)
+    })
+    counts = {"requests": 0, "errors": 0}
+    counts_lock = threading.Lock()
+
+    def serve():
+        """Send requests in a loop from one session"""
+        session_id = rag_app.conversation_store.create_session()
+        index = 0
+        end_time = time.time() + duration
+        while time.time() < end_time:
+            try:
+                rag_app.generate_rag_response(BENCHMARK_QUERIES[index % len(BENCHMARK_QUERIES)],
+                                              session_id)
+                key = "requests"
+            except Exception as e:
+                print(f"Request failed: {e}")
+                key = "errors"
+            with counts_lock:
+                counts[key] += 1
+            index += 1
+
+    ready.put(os.getpid())
+    start_event.wait()
+    serving_threads = [threading.Thread(target=serve) for _ in range(threads)]
+    for thread in serving_threads:
+        thread.start()
+    for thread in serving_threads:
+        thread.join()
+    results.put(counts)
+
+def run_serving_benchmark(worker_counts: tuple=(1, 2, 4), duration: float=10.0,
+                          threads: int=1, llm_latency: float=0.05,
+                          embedding_latency: float=0.02,
+                          store_dir: str="backend/local_db/serving_benchmark"):
+    """Measure requests per second for each worker count"""
+    build_benchmark_index(store_dir)
+    report = []
+    for num_workers in worker_counts:
+        ready = multiprocessing.Queue()
+        start_event = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=_benchmark_worker,
+                                           args=(store_dir, duration, threads, llm_latency,
+                                                 embedding_latency, ready, start_event, results))
+                   for _ in range(num_workers)]
+        for worker in workers:
+            worker.start()
+        # Start measuring after all workers have imported and built the app
+        for _ in workers:
+            ready.get()
+        start_event.set()
+
+        worker_results = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+
+        total_requests = sum(result["requests"] for result in worker_results)
+        report.append({
+            "workers": num_workers,
+            "threads_per_worker": threads,
+            "requests": total_requests,
+            "errors": sum(result["errors"] for result in worker_results),
+            "requests_per_second": round(total_requests / duration, 2)
+        })
+        print(report[-1])
+
+    return report
+
+if __name__ == "__main__":
+    run_serving_benchmark()
@@ -1,12 +1,35 @@
 """File to setup data and vector db initially"""
-
+import os
 from backend.utils.utility import get_files_in_dir, save_embeddings, load_embeddings
 from backend.core.chunking import PDFTextSplitter
 from backend.core.embedding import EmbeddingClient
 from backend.core.retriever import CustomMilvusClient
+from backend.core.sharding import split_into_shards, save_centroids, ShardStats
+from backend.core.quantization import measure_quantization
+from backend.core.quantization import measure_footprint, create_quantized_collections
+from backend.core.citations import build_citations
+from backend.core.dedup import NearDuplicateDetector
+from backend.core.sources import RemoteDocumentFetcher, chunk_remote_documents
 from backend.config import GEMINI_API_KEY
+from backend.ml_config import SHARD_CONFIGS, QUANTIZATION_CONFIGS, CITATION_CONFIGS
+from backend.ml_config import DEDUP_CONFIGS
 
 ### --- SETUP ----
+def deduplicate_chunks(chunked_data: list, dedup_configs: dict, index_path: str=None):
+    """Drop exact and near duplicate chunks before embedding.
+    Kept chunks are saved to the index used to deduplicate ingested documents"""
+    detector = NearDuplicateDetector(threshold=dedup_configs["threshold"],
+                                     num_perm=dedup_configs["num_perm"],
+                                     bands=dedup_configs["bands"],
+                                     shingle_size=dedup_configs["shingle_size"])
+    kept_chunks, report = detector.deduplicate(chunked_data)
+    if index_path:
+        detector.add_to_index(kept_chunks)
+        detector.save_index(index_path)
+        print(f"Successfully saved deduplication index to {index_path}.")
+
+    return kept_chunks, report
+
 def initial_setup():
     """Initial setup of chunking and embedding of docs"""
     documents_list = get_files_in_dir("../../documents")
@@ -18,9 +41,22 @@ def initial_setup():
         chunked_data = document_splitter.process_documents()
         print(f"Successfully chunked data to {len(chunked_data)} chunks.")
 
+        if DEDUP_CONFIGS["enabled"]:
+            # index path in config is relative to src folder, setup runs from backend folder
+            index_path = f"{folder_name}/{DEDUP_CONFIGS['index_path'].split('/')[-1]}"
+            chunked_data, dedup_report = deduplicate_chunks(chunked_data, DEDUP_CONFIGS,
+                                                            index_path=index_path)
+            print(f"Removed {dedup_report['embedding_calls_saved']} duplicate chunks, "
+                  f"{dedup_report['kept_chunks']} chunks left.")
+
         save_embeddings(chunked_data,f"{folder_name}/chunked_content.jsonl")
         print("Successfully saved chunked data jsonl file.")
 
+        citations = build_citations(chunked_data, preview_length=CITATION_CONFIGS["preview_length"],
+                                    documents_dir="../../documents")
+        save_embeddings(citations, f"{folder_name}/citations.jsonl")
+        print("Successfully saved citations jsonl file.")
+
         document_embedding = EmbeddingClient(embedding_api_key=GEMINI_API_KEY)
 
         embedding_data = document_embedding.generate_embeddings(chunked_data)
@@ -38,9 +74,10 @@ def initial_setup():
                          db_name: str, collection_name: str):
         """Creates vector db with provied embeddings"""
         retriever_instance = CustomMilvusClient(uri=f"{folder_name}/{db_name}.db")
+        embedding_dimension = len(embeddings_data[0]["chunk_embedding"])
 
         retriever_instance.create_collection(collection_name=collection_name,
-                                            embedding_dimension=768,
+                                            embedding_dimension=embedding_dimension,
                                             vector_field_name="chunk_embedding",
                                             primary_field_name="chunk_id")
 
@@ -53,6 +90,55 @@ def initial_setup():
                                                     folder_name="local_db",
                                                     db_name="local_milvus",
                                                     collection_name="local_pdf_rag")
+
+    def create_sharded_vector_db(embeddings_data: list, folder_name: str,
+                                 db_name: str, shard_configs: dict):
+        """Creates one collection per shard and saves the centroid of every shard"""
+        retriever_instance = CustomMilvusClient(uri=f"{folder_name}/{db_name}.db")
+        sharded_data = split_into_shards(embeddings_data, shard_configs)
+        embedding_dimension = len(embeddings_data[0]["chunk_embedding"])
+        centroids = {}
+        shard_stats = ShardStats()
+
+        for shard_name, shard_data in sharded_data.items():
+            retriever_instance.create_collection(collection_name=shard_name,
+                                                embedding_dimension=embedding_dimension,
+                                                vector_field_name="chunk_embedding",
+                                                primary_field_name="chunk_id")
+
+            retriever_instance.insert_data_to_collection(collection_name=shard_name,
+                                                        data=shard_data)
+            shard_stats.set_documents(shard_name, shard_data)
+            centroids[shard_name] = shard_stats.get_centroid(shard_name)
+            print(f"Shard '{shard_name}' created with {len(shard_data)} chunks.")
+
+        # centroids path in config is relative to src folder, setup runs from backend folder
+        centroids_path = f"{folder_name}/{shard_configs['centroids_path'].split('/')[-1]}"
+        save_centroids(centroids, centroids_path)
+        print(f"Successfully saved shard centroids to {centroids_path}.")
+        shard_stats.save(f"{folder_name}/{shard_configs['stats_path'].split('/')[-1]}")
+
+        return f"{folder_name}/{db_name}.db", list(sharded_data.keys())
+
+    milvus_db, milvus_shards = create_sharded_vector_db(embeddings_data, # pylint: disable=W0612
+                                                        folder_name="local_db",
+                                                        db_name="local_milvus",
+                                                        shard_configs=SHARD_CONFIGS)
+
+    def create_quantized_store(embeddings_data: list, folder_name: str,
+                               collection_name: str, shard_configs: dict):
+        """Creates quantized copies of the full collection and of every shard"""
+        # store dir in config is relative to src folder, setup runs from backend folder
+        store_dir = f"{folder_name}/{QUANTIZATION_CONFIGS['store_dir'].split('/')[-1]}"
+
+        return create_quantized_collections(store_dir, embeddings_data, collection_name,
+                                            shard_configs,
+                                            rescore_dtype=QUANTIZATION_CONFIGS["rescore_dtype"])
+
+    quantized_store_dir = create_quantized_store(embeddings_data, # pylint: disable=W0612
+                                                 folder_name="local_db",
+                                                 collection_name="local_pdf_rag",
+                                                 shard_configs=SHARD_CONFIGS)
 # initial_setup()
 ### --- SETUP END ---
 
@@ -78,4 +164,55 @@ def run_test():
 
     test_vector_db("local_db/local_milvus.db", "local_pdf_rag", "How to make chilli con carne?")
 # run_test()
+
+def run_quantization_benchmark():
+    """Compare memory and recall of quantized vectors against float vectors, and disk size of
+    the quantized store against the milvus db"""
+    embeddings_data = load_embeddings("local_db/embeddings.jsonl")
+    embedding_instance = EmbeddingClient(embedding_api_key=GEMINI_API_KEY)
+    queries = ["How to make chilli con carne?",
+               "What are the main greenhouse gases?",
+               "What is an agent in LLMs?",
+               "How does climate change affect sea levels?",
+               "What is chain of thought prompting?"]
+    query_embeddings = [embedding_instance.get_query_embeddings(content=query)
+                        for query in queries]
+
+    report = measure_quantization(embeddings_data, query_embeddings,
+                                  store_dir="local_db/quantization_benchmark",
+                                  top_k=5,
+                                  rescore_factor=QUANTIZATION_CONFIGS["rescore_factor"])
+    print(report)
+    # store dir in config is relative to src folder, setup runs from backend folder
+    store_dir = f"local_db/{QUANTIZATION_CONFIGS['store_dir'].split('/')[-1]}"
+    if os.path.exists(store_dir):
+        report["footprint_vs_milvus"] = measure_footprint(store_dir, "local_db/local_milvus.db")
+        print(report["footprint_vs_milvus"])
+    return report
+# run_quantization_benchmark()
+
+def run_deduplication_report():
+    """Report duplicate chunks and embedding calls saved on the saved chunks"""
+    chunked_data = load_embeddings("local_db/chunked_content.jsonl")
+    _, report = deduplicate_chunks(chunked_data, DEDUP_CONFIGS)
+    print({key: value for key, value in report.items() if key != "duplicates"})
+    return report
+# run_deduplication_report()
+
+def run_remote_fetch_test():
+    """Fetch the local documents through a local http server, second fetch should skip all"""
+    from backend.core.file_server import LocalFileServer # pylint: disable=import-outside-toplevel
+    documents_dir = "../../documents"
+    file_names = [file_name for file_name in sorted(os.listdir(documents_dir))
+                  if file_name.endswith(".pdf")]
+    with LocalFileServer(documents_dir) as server:
+        urls = [server.url_for(file_name) for file_name in file_names]
+        fetcher = RemoteDocumentFetcher(download_dir="local_db/remote_documents")
+        first_results = fetcher.fetch_all(urls)
+        chunked_data = chunk_remote_documents(first_results, PDFTextSplitter(file_uri=None))
+        print(f"Fetched {len(first_results)} documents with {len(chunked_data)} chunks.")
+        second_results = fetcher.fetch_all(urls)
+        print([result["status"] for result in second_results])
+    return first_results, second_results
+# run_remote_fetch_test()
 ### --- TESTING END ---
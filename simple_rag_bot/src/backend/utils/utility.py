@@ -30,6 +30,12 @@ def save_embeddings(embeddings_data, path):
         print(f"Unable to save embeddings data due to {e}.")
         return False
 
+def append_embeddings(embeddings_data, path):
+    """Append entries to jsonl file, entries are written in one call so they stay together"""
+    lines = "".join(json.dumps(entry) + "\n" for entry in embeddings_data)
+    with open(path, 'a') as outfile:
+        outfile.write(lines)
+
 def load_embeddings(path):
     """Load embeddings from jsonl file"""
     with open(path, 'r') as json_file:
@@ -45,17 +51,27 @@ def format_sources(relevant_docs: list):
 
     return sources
 
-def format_citations(relevant_docs: list):
-    """Format citations with required keys and page location"""
+def build_citation(chunk_id: str, chunk: dict, preview_length: int=150):
+    """Create citation record of a chunk with title, url to the first page and short preview"""
+    document = chunk["document_metadata"]
+    preview = " ".join(chunk["content"].split())
+
+    return {
+        "id": chunk_id,
+        "title": document["title"],
+        "url": document["url"] + "#page=" + str(min(chunk["page_span"])),
+        "preview": preview[:preview_length]
+    }
+
+def format_citations(relevant_docs: list, citation_store=None):
+    """Format citations with required keys and page location.
+    Citations precomputed at ingestion are used from the citation store when available"""
     citations = []
     docs = relevant_docs[0]
     for doc in docs:
-        citation_data = {}
-        citation_data["id"] = doc["id"]
-        citation_data["content"] = doc["entity"]["content"]
-        document = doc["entity"]["document_metadata"]
-        citation_data["title"] = document["title"]
-        citation_data["url"] = document["url"] + "#page=" + str(min(doc["entity"]["page_span"]))
+        citation_data = citation_store.get(doc["id"]) if citation_store else None
+        if citation_data is None:
+            citation_data = build_citation(doc["id"], doc["entity"])
         citations.append(citation_data)
 
     return citations
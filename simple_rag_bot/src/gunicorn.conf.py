@@ -0,0 +1,43 @@
+"""Gunicorn config for serving the mesop app with multiple workers.
+Run from the src folder: gunicorn app:me (this config file is picked up automatically)"""
+# pylint: disable=invalid-name,import-outside-toplevel
+import os
+from backend.ml_config import SERVING_CONFIGS, QUANTIZATION_CONFIGS, SHARD_CONFIGS
+
+bind = os.environ.get("RAG_BIND", SERVING_CONFIGS["bind"])
+workers = int(os.environ.get("RAG_WORKERS", SERVING_CONFIGS["workers"]))
+# Threads of a worker share the same llm, embedding and retriever clients
+worker_class = "gthread"
+threads = int(os.environ.get("RAG_THREADS", SERVING_CONFIGS["threads"]))
+# Mesop streams responses, llm calls can take a while
+timeout = 120
+# App is imported after fork, grpc based clients are not fork safe
+preload_app = False
+
+raw_env = [
+    f"RAG_SESSION_DB={SERVING_CONFIGS['session_db_path']}",
+]
+# A single worker can use the milvus lite db, multiple workers share the quantized index
+if workers > 1:
+    raw_env.append("RAG_SHARED_INDEX=1")
+
+def on_starting(server):
+    """Make sure the shared read only index exists before starting multiple workers.
+    Missing index is created from the embeddings saved during setup, startup fails if they are
+    missing too, as every worker would open the same milvus lite db"""
+    store_dir = os.environ.get("RAG_INDEX_DIR", QUANTIZATION_CONFIGS["store_dir"])
+    if workers <= 1 or os.path.exists(store_dir):
+        return
+    embeddings_path = QUANTIZATION_CONFIGS["embeddings_path"]
+    if not os.path.exists(embeddings_path):
+        raise RuntimeError(f"Quantized index not found at {store_dir} and embeddings not found "
+                           f"at {embeddings_path}. Run the setup first, or serve with a single "
+                           "worker (RAG_WORKERS=1).")
+
+    from backend.utils.utility import load_embeddings
+    from backend.core.quantization import create_quantized_collections
+    server.log.info(f"Quantized index not found, creating it at {store_dir} "
+                    f"from {embeddings_path}.")
+    create_quantized_collections(store_dir, load_embeddings(embeddings_path),
+                                 SHARD_CONFIGS["default_collection"], SHARD_CONFIGS,
+                                 rescore_dtype=QUANTIZATION_CONFIGS["rescore_dtype"])
@@ -5,6 +5,7 @@ from dataclasses import dataclass, field
 from typing import Optional, Union, Dict, Any, Callable, Generator, Literal
 import mesop as me
 from mesop_components.copy_to_clipboard.copy_to_clipboard_component import copy_to_clipboard_component # pylint: disable=C0301
+from mesop_components.payload_store import diagnostic_store
 
 Role = Literal["user", "assistant"]
 ACCEPTED_FILE_TYPES = ["image/jpeg", "image/png", "application/pdf","video/mp4"]
@@ -22,6 +23,11 @@ _DEFAULT_PADDING = me.Padding.all(5)
 _LABEL_BUTTON = "attach_file"
 _LABEL_BUTTON_IN_PROGRESS = "pending"
 _LABEL_INPUT = "Type your message here."
+_LABEL_DIAGNOSTIC_EXPIRED = "Diagnostic info is no longer available."
+
+# Only the latest messages are rendered, older ones are collapsed into a summary
+_MESSAGE_WINDOW_SIZE = 20
+_SUMMARY_PREVIEW_LENGTH = 80
 
 _STYLE_APP_CONTAINER = me.Style(
   background=_COLOR_BACKGROUND,
@@ -82,6 +88,16 @@ _STYLE_RICH_ELEMENT_BOX = style=me.Style(
   gap=15,
   margin=me.Margin.all(15),
 )
+_STYLE_COLLAPSED_SUMMARY_BOX = me.Style(
+  display="flex",
+  flex_direction="row",
+  align_items="center",
+  justify_content="space-between",
+  background=me.theme_var("surface-container"),
+  border_radius="10px",
+  padding=me.Padding.symmetric(vertical=5, horizontal=15),
+  margin=me.Margin(bottom=10),
+)
 
 
 def _make_style_chat_bubble_wrapper(role: Role) -> me.Style:
@@ -144,17 +160,21 @@ class ChatMessage:
     role: Role = "user"
     content: Union[str, Dict[str, Any], None] = ""
     rich_content: Optional[Dict[str, Any]] = field(default_factory=dict)
-    diagnostic_info: Optional[Dict[str, Any]] = field(default_factory=dict)
+    # Id of the diagnostic info payload kept in the server side diagnostic store
+    diagnostic_info_id: Optional[str] = None
 
 
 @me.stateclass
 class State:
     """Chat box state"""
     input: str
-    output: list[ChatMessage]
+    # Messages are kept in the server side conversation store, state only carries the id
+    session_id: str = ""
+    num_messages: int = 0
     in_progress: bool = False
     file: me.UploadedFile
     open_dialog_id: str | None = None
+    num_visible_messages: int = _MESSAGE_WINDOW_SIZE
 
 def handle_upload(event: me.UploadEvent):
     """Handle upload event"""
@@ -175,13 +195,13 @@ def on_submit(e: me.TextareaShortcutEvent):
     """Handle submit button event"""
     state = me.state(State)
     state.input = e.value
-    state.output = e.value
 
 def on_clear(e: me.TextareaShortcutEvent):
     """Handle text clear event"""
     state = me.state(State)
     state.input = ""
-    state.output = ""
+    # New session is created on next render
+    state.session_id = ""
 
 def on_chip_click(event: me.ClickEvent):
     """Handle chip click event"""
@@ -204,6 +224,11 @@ def on_click_dialog_open(e: me.ClickEvent):
     state = me.state(State)
     state.open_dialog_id = e.key
 
+def on_click_show_earlier(e: me.ClickEvent):
+    """Handle show earlier messages event"""
+    state = me.state(State)
+    state.num_visible_messages += _MESSAGE_WINDOW_SIZE
+
 @me.content_component
 def dialog(*, is_open: bool, on_click_background: Callable | None = None):
     """Display dialog component"""
@@ -324,6 +349,22 @@ def display_rich_elements(rich_content):
         return display_citations(rich_content["citations"])
     return None
 
+def display_collapsed_summary(num_hidden_messages, latest_hidden_messages):
+    """Display lightweight summary in place of older messages that are not rendered.
+    Only the latest hidden messages are loaded, for the last question asked"""
+    last_user_message = next((message.content for message in reversed(latest_hidden_messages)
+                              if message.role == _ROLE_USER), "")
+    if len(last_user_message) > _SUMMARY_PREVIEW_LENGTH:
+        last_user_message = last_user_message[:_SUMMARY_PREVIEW_LENGTH] + "..."
+
+    with me.box(style=_STYLE_COLLAPSED_SUMMARY_BOX):
+        with me.box():
+            me.text(f"{num_hidden_messages} earlier messages", type="subtitle-2")
+            if last_user_message:
+                me.text(f"Last asked: {last_user_message}",
+                        style=me.Style(font_size=13, color=me.theme_var("on-surface-variant")))
+        me.button("Show earlier", on_click=on_click_show_earlier)
+
 def display_helper_buttons(message, message_index):
     """Display helper buttons, copy and diagnostic info"""
     state = me.state(State)
@@ -334,70 +375,82 @@ def display_helper_buttons(message, message_index):
         flex_direction="row-reverse",
         align_items="center"
     )):
-        with dialog(
-            is_open=(state.open_dialog_id == dialog_id),
-            on_click_background=on_click_close_background,
-        ):
-            with me.box(style=me.Style(
-                display="flex",
-                flex_direction="row",
-                align_items="center",
-                justify_content="space-between"
-            )):
-                me.text("Diagnostic Info", type="headline-5")
-                with copy_to_clipboard_component(text=message.diagnostic_info):
-                    with me.content_button(type="icon"):
-                        me.icon("content_copy")
-            with me.box(
-                style=me.Style(
-                overflow_y="auto",
-                max_height="360px",
-                max_width="720px",
-                background=me.theme_var("surface"),
-                border_radius=10,
-                padding=me.Padding.all(10),
-                font_family="monospace",
-                font_size="14px",
-                white_space="pre-wrap",
-                word_wrap="break-word"
-            )):
-                me.markdown(message.diagnostic_info)
-                # TODO: Add a copy button or use markdown for code
-                # me.markdown("```json"+message.diagnostic_info+"```")
-            with dialog_actions():
-                me.button("Close", on_click=on_click_close_dialog)
+        # Diagnostic info is only fetched and rendered when its dialog is open
+        if state.open_dialog_id == dialog_id:
+            display_diagnostic_dialog(message)
         with me.content_button(type="icon",on_click=on_click_dialog_open, key=dialog_id):
             me.icon("assignment")
         with copy_to_clipboard_component(text=message.content):
             with me.content_button(type="icon"):
                 me.icon("content_copy")
 
+def display_diagnostic_dialog(message):
+    """Display dialog with diagnostic info of the message"""
+    diagnostic_info = diagnostic_store.get(message.diagnostic_info_id,
+                                           _LABEL_DIAGNOSTIC_EXPIRED)
+    with dialog(
+        is_open=True,
+        on_click_background=on_click_close_background,
+    ):
+        with me.box(style=me.Style(
+            display="flex",
+            flex_direction="row",
+            align_items="center",
+            justify_content="space-between"
+        )):
+            me.text("Diagnostic Info", type="headline-5")
+            with copy_to_clipboard_component(text=diagnostic_info):
+                with me.content_button(type="icon"):
+                    me.icon("content_copy")
+        with me.box(
+            style=me.Style(
+            overflow_y="auto",
+            max_height="360px",
+            max_width="720px",
+            background=me.theme_var("surface"),
+            border_radius=10,
+            padding=me.Padding.all(10),
+            font_family="monospace",
+            font_size="14px",
+            white_space="pre-wrap",
+            word_wrap="break-word"
+        )):
+            me.markdown(diagnostic_info)
+            # TODO: Add a copy button or use markdown for code
+            # me.markdown("```json"+diagnostic_info+"```")
+        with dialog_actions():
+            me.button("Close", on_click=on_click_close_dialog)
+
 def chat( # pylint: disable=R0915
   transform: Callable[
-    [str, list[ChatMessage]],
+    [str, str],
     Generator[str, None, None] | str
   ],
   *,
+  store,
   title: str | None = None,
   bot_user: str = _BOT_USER_DEFAULT,
   reset: bool = False
 ):
-    """Creates a simple chat UI which takes in a prompt and chat history and returns a
+    """Creates a simple chat UI which takes in a prompt and session id and returns a
     response to the prompt.
 
     This function creates event handlers for text input and output operations
     using the provided function `transform` to process the input and generate the output.
     Args:
-        transform: Function that takes in a prompt and chat history and
+        transform: Function that takes in a prompt and session id and
         returns a response to the prompt.
+        store: Server side conversation store that keeps the messages of each session.
         title: Headline text to display at the top of the UI.
         bot_user: Name of your bo   t / assistant
         reset: Reset chat box.
     """
     state = me.state(State)
 
-    if reset:
-        state.output = []
+    if reset or not state.session_id:
+        state.session_id = store.create_session()
+        state.num_messages = 0
+        state.num_visible_messages = _MESSAGE_WINDOW_SIZE
 
     # def on_click_submit(e: me.ClickEvent):
     #     yield from submit()
@@ -407,7 +460,7 @@ def chat( # pylint: disable=R0915
         state = me.state(State)
         state.input = e.value
         yield from submit()
-        me.focus_component(key=f"input-{len(state.output)}")
+        me.focus_component(key=f"input-{state.num_messages}")
         yield
 
     def submit():
@@ -419,23 +472,24 @@ def chat( # pylint: disable=R0915
         state.input = ""
         yield
 
-        output = state.output
-        if output is None:
-            output = []
-        output.append(ChatMessage(role=_ROLE_USER, content=input))
+        store.add_message(state.session_id, ChatMessage(role=_ROLE_USER, content=input))
+        state.num_messages += 1
         state.in_progress = True
         # me.scroll_into_view(key="end_of_messages")
         yield
 
         # start_time = time.time()
-        output_message = transform(input, state.output)
+        output_message = transform(input, state.session_id)
         assistant_message = ChatMessage(role=_ROLE_ASSISTANT)
-        output.append(assistant_message)
-        state.output = output
 
         assistant_message.content = output_message["message"]
         assistant_message.rich_content = output_message.get("rich_content")
-        assistant_message.diagnostic_info = output_message.get("diagnostic_info")
+        if output_message.get("diagnostic_info"):
+            assistant_message.diagnostic_info_id = diagnostic_store.put(
+                output_message["diagnostic_info"]
+            )
+        store.add_message(state.session_id, assistant_message)
+        state.num_messages += 1
 
         # TODO: Simulate streaming, currently static dict is passed
         # for content in output_message:
@@ -445,7 +499,7 @@ def chat( # pylint: disable=R0915
         #     start_time = time.time()
         #     yield
         state.in_progress = False
-        me.focus_component(key=f"input-{len(state.output)}")
+        me.focus_component(key=f"input-{state.num_messages}")
         me.scroll_into_view(key="end_of_messages")
         yield
 
@@ -476,7 +530,14 @@ def chat( # pylint: disable=R0915
                     me.icon("light_mode" if me.theme_brightness() == "dark" else "dark_mode")
 
         with me.box(style=_STYLE_CHAT_BOX):
-            for index, msg in enumerate(state.output):
+            # Only the visible window is loaded from the store
+            messages = store.get_messages(state.session_id, limit=state.num_visible_messages)
+            first_visible_index = max(0, store.count_messages(state.session_id) - len(messages))
+            if first_visible_index:
+                display_collapsed_summary(first_visible_index,
+                                          store.get_messages(state.session_id, limit=2,
+                                                             offset=len(messages)))
+            for index, msg in enumerate(messages, start=first_visible_index):
                 with me.box(style=_make_style_chat_bubble_wrapper(msg.role)):
                     with me.box(style=_make_chat_bubble_style(msg.role)):
                         if msg.role == _ROLE_USER:
@@ -495,7 +556,7 @@ def chat( # pylint: disable=R0915
                                         display_rich_elements(msg.rich_content)
                                 else:
                                     me.markdown(msg.content)
-                        if msg.diagnostic_info:
+                        if msg.diagnostic_info_id:
                             display_helper_buttons(msg, index)
             with me.box(key="end_of_messages", style=me.Style(height=1)):
                 pass
@@ -503,7 +564,7 @@ def chat( # pylint: disable=R0915
         with me.box(style=_STYLE_CHAT_INPUT_BOX):
             with me.box(style=me.Style(flex_grow=1)):
                 me.native_textarea(
-                    key=f"input-{len(state.output)}",
+                    key=f"input-{state.num_messages}",
                     value=state.input,
                     on_blur=on_blur,
                     shortcuts={
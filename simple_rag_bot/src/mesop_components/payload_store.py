@@ -0,0 +1,102 @@
+"""Server side store for large payloads that are referenced from mesop state by id"""
+import os
+import uuid
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+
+class PayloadStore:
+    """Bounded in memory store, least recently used payloads are evicted first.
+    Keeps large payloads (e.g. diagnostic traces) out of the state that is serialized on
+    every UI event."""
+    def __init__(self, max_items: int=500):
+        """Initialize store with maximum number of payloads to keep"""
+        self.max_items = max_items
+        self._payloads = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, payload, payload_id: str | None = None):
+        """Store payload and return the id to reference it"""
+        payload_id = payload_id or uuid.uuid4().hex
+        with self._lock:
+            self._payloads[payload_id] = payload
+            self._payloads.move_to_end(payload_id)
+            while len(self._payloads) > self.max_items:
+                self._payloads.popitem(last=False)
+
+        return payload_id
+
+    def get(self, payload_id: str, default=None):
+        """Get payload for the id, returns default if missing or evicted"""
+        with self._lock:
+            if payload_id not in self._payloads:
+                return default
+            self._payloads.move_to_end(payload_id)
+            return self._payloads[payload_id]
+
+    def delete(self, payload_id: str):
+        """Remove payload from store"""
+        with self._lock:
+            self._payloads.pop(payload_id, None)
+
+class SQLitePayloadStore:
+    """SQLite backed payload store with the same interface as PayloadStore, shared between
+    worker processes. Oldest payloads are evicted first."""
+    def __init__(self, db_path: str, max_items: int=5000):
+        """Initialize store with the database file and maximum number of payloads to keep"""
+        self.db_path = db_path
+        self.max_items = max_items
+        self._connection = None
+        self._connection_pid = None
+        self._lock = threading.Lock()
+
+    def _get_connection(self):
+        """Get connection of the current process, connections are not shared across forks"""
+        if self._connection is None or self._connection_pid != os.getpid():
+            self._connection = sqlite3.connect(self.db_path, timeout=30,
+                                               check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""CREATE TABLE IF NOT EXISTS payloads (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload_id TEXT UNIQUE,
+                payload BLOB
+            )""")
+            self._connection_pid = os.getpid()
+
+        return self._connection
+
+    def put(self, payload, payload_id: str | None = None):
+        """Store payload and return the id to reference it"""
+        payload_id = payload_id or uuid.uuid4().hex
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                connection.execute("INSERT OR REPLACE INTO payloads (payload_id, payload) "
+                                   "VALUES (?, ?)", (payload_id, pickle.dumps(payload)))
+                connection.execute("DELETE FROM payloads WHERE seq <= "
+                                   "(SELECT MAX(seq) FROM payloads) - ?", (self.max_items,))
+
+        return payload_id
+
+    def get(self, payload_id: str, default=None):
+        """Get payload for the id, returns default if missing or evicted"""
+        with self._lock:
+            row = self._get_connection().execute(
+                "SELECT payload FROM payloads WHERE payload_id = ?", (payload_id,)
+            ).fetchone()
+
+        return pickle.loads(row[0]) if row else default
+
+    def delete(self, payload_id: str):
+        """Remove payload from store"""
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                connection.execute("DELETE FROM payloads WHERE payload_id = ?", (payload_id,))
+
+# Multi worker serving shares payloads between workers through sqlite
+if os.environ.get("RAG_SESSION_DB"):
+    diagnostic_store = SQLitePayloadStore(os.environ["RAG_SESSION_DB"])
+else:
+    diagnostic_store = PayloadStore()
@@ -0,0 +1,66 @@
+"""Tests of expanding retrieved chunks with their neighbours"""
+from backend.core.chunk_index import ChunkIndex
+
+def create_chunks(doc_id: str, positions: list, chunk_size: int=10, overlap: int=2):
+    """Overlapping chunks of a document at the given positions"""
+    chunks = []
+    for position in positions:
+        start = position * (chunk_size - overlap)
+        chunks.append({
+            "chunk_id": f"{doc_id}/chunks/c{position}",
+            "doc_id": doc_id,
+            "content": f"{position}" * chunk_size,
+            "page_span": [position // 2],
+            "chunk_metadata": {"start_char_idx": start, "end_char_idx": start + chunk_size},
+            "document_metadata": {"file_name": f"{doc_id}.pdf"}
+        })
+    return chunks
+
+def create_hit(chunk: dict, distance: float):
+    """Search hit of the chunk"""
+    return {"id": chunk["chunk_id"], "distance": distance,
+            "entity": {"doc_id": chunk["doc_id"], "content": chunk["content"]}}
+
+def test_neighbouring_hits_are_joined():
+    """Hits whose neighbourhoods touch form one passage with the best score"""
+    chunks = create_chunks("doc_a", range(6))
+    chunk_index = ChunkIndex(chunks)
+    relevant_docs = [[create_hit(chunks[1], 0.5), create_hit(chunks[3], 0.8)]]
+
+    passages = chunk_index.expand_hits(relevant_docs, window=1)[0]
+
+    assert len(passages) == 1
+    assert passages[0]["id"] == "doc_a/chunks/c3"
+    assert passages[0]["distance"] == 0.8
+    assert passages[0]["expanded_ids"] == [f"doc_a/chunks/c{i}" for i in range(5)]
+    assert passages[0]["entity"]["page_span"] == [0, 1, 2]
+
+def test_gapped_document_expands_up_to_the_gap():
+    """Chunks behind a missing position are not part of the passage"""
+    chunks = create_chunks("doc_a", [3, 5, 6, 7])
+    chunk_index = ChunkIndex(chunks)
+
+    passages = chunk_index.expand_hits([[create_hit(chunks[1], 0.7)]], window=2)[0]
+
+    assert len(passages) == 1
+    assert passages[0]["id"] == "doc_a/chunks/c5"
+    assert passages[0]["expanded_ids"] == ["doc_a/chunks/c5", "doc_a/chunks/c6",
+                                           "doc_a/chunks/c7"]
+
+def test_hits_separated_by_a_gap_are_separate_passages():
+    """Hits on both sides of a gap give one passage each, in score order"""
+    chunks = create_chunks("doc_a", [0, 1, 3, 4])
+    chunk_index = ChunkIndex(chunks)
+    relevant_docs = [[create_hit(chunks[0], 0.4), create_hit(chunks[3], 0.9)]]
+
+    passages = chunk_index.expand_hits(relevant_docs, window=2)[0]
+
+    assert [passage["expanded_ids"] for passage in passages] == [
+        ["doc_a/chunks/c3", "doc_a/chunks/c4"], ["doc_a/chunks/c0", "doc_a/chunks/c1"]]
+
+def test_missing_hit_is_returned_as_is():
+    """Hits not in the index are kept unexpanded"""
+    chunk_index = ChunkIndex(create_chunks("doc_a", range(3)))
+    hit = create_hit(create_chunks("doc_b", [0])[0], 0.6)
+
+    assert chunk_index.expand_hits([[hit]], window=1) == [[hit]]
@@ -0,0 +1,38 @@
+"""Tests of merging and trimming retrieved sources to the token budget"""
+from backend.core.compression import SourceCompressor, estimate_tokens
+
+def create_hit(chunk_id: str, content: str, distance: float=0.5):
+    """Retrieved hit without chunk offsets"""
+    return {"id": chunk_id, "distance": distance, "entity": {"content": content}}
+
+def test_sources_within_budget_are_unchanged():
+    """Nothing is trimmed when the sources fit the budget"""
+    hits = [create_hit("doc_a/chunks/c0", "Garlic is fried in oil. Onions are added later.")]
+
+    compressed_docs, report = SourceCompressor(token_budget=100).compress([hits], "garlic")
+
+    assert compressed_docs == [hits]
+    assert report["tokens_saved"] == 0
+
+def test_relevant_sentences_are_kept_in_order():
+    """Sentences about the query are kept in their order in the passage"""
+    content = ("Garlic is fried in oil first. The weather was cold that day. "
+               "Tomato sauce is added to the garlic. The kitchen was painted blue.")
+    hits = [create_hit("doc_a/chunks/c0", content)]
+
+    compressed_docs, _ = SourceCompressor(token_budget=17).compress([hits], "garlic tomato sauce")
+
+    assert compressed_docs[0][0]["entity"]["content"] == (
+        "Garlic is fried in oil first. Tomato sauce is added to the garlic.")
+
+def test_sentence_over_budget_is_cut():
+    """Most relevant sentence is kept even when it alone is over the budget"""
+    content = "Garlic " * 100 + "is fried in oil. " + "Onion " * 100 + "is chopped."
+    hits = [create_hit("doc_a/chunks/c0", content)]
+
+    compressed_docs, _ = SourceCompressor(token_budget=20).compress([hits], "garlic")
+
+    passages = compressed_docs[0]
+    assert len(passages) == 1
+    assert passages[0]["entity"]["content"].startswith("Garlic Garlic")
+    assert estimate_tokens(passages[0]["entity"]["content"]) <= 20
@@ -0,0 +1,67 @@
+"""Tests of the in memory and sqlite conversation stores"""
+from types import SimpleNamespace
+import pytest
+from langchain_core.messages import HumanMessage, AIMessage
+
+from backend.core.conversation_store import InMemoryConversationStore, SQLiteConversationStore
+
+@pytest.fixture(name="store", params=["memory", "sqlite"])
+def fixture_store(request, tmp_path):
+    """Store with a history window of 3 turns and summaries of 2 turns"""
+    if request.param == "memory":
+        return InMemoryConversationStore(max_history_messages=6, max_summary_turns=2)
+    return SQLiteConversationStore(db_path=str(tmp_path / "sessions.db"),
+                                   max_history_messages=6, max_summary_turns=2)
+
+def add_turns(store, session_id: str, num_turns: int):
+    """Add user and bot turns numbered from 0"""
+    for turn in range(num_turns):
+        store.add_turn(session_id, f"question {turn}", f"answer {turn}")
+
+def test_history_within_window_is_unchanged(store):
+    """Short conversations are sent as is"""
+    session_id = store.create_session()
+    add_turns(store, session_id, 2)
+
+    chat_history = store.get_chat_history(session_id)
+
+    assert [message.content for message in chat_history] == [
+        "question 0", "answer 0", "question 1", "answer 1"]
+
+def test_older_turns_are_summarized(store):
+    """Turns leaving the window are replaced by a summary of the latest of them"""
+    session_id = store.create_session()
+    add_turns(store, session_id, 6)
+
+    chat_history = store.get_chat_history(session_id)
+
+    assert [type(message) for message in chat_history] == [HumanMessage, AIMessage] * 4
+    assert [message.content for message in chat_history[2:]] == [
+        "question 3", "answer 3", "question 4", "answer 4", "question 5", "answer 5"]
+    summary = chat_history[1].content
+    assert "question 2" in summary and "answer 1" in summary
+    assert "question 0" not in summary
+
+def test_messages_are_loaded_by_window(store):
+    """Latest messages are returned in order, skipping the offset latest ones"""
+    session_id = store.create_session()
+    for index in range(5):
+        store.add_message(session_id, SimpleNamespace(role="user", content=f"message {index}"))
+
+    assert store.count_messages(session_id) == 5
+    assert [message.content for message in store.get_messages(session_id, limit=2)] == [
+        "message 3", "message 4"]
+    assert [message.content for message in store.get_messages(session_id, limit=2,
+                                                              offset=3)] == [
+        "message 0", "message 1"]
+    assert len(store.get_messages(session_id)) == 5
+    assert not store.get_messages(session_id, limit=2, offset=5)
+
+def test_deleted_session_is_empty(store):
+    """Deleting a session removes its messages and summary"""
+    session_id = store.create_session()
+    add_turns(store, session_id, 5)
+    store.delete_session(session_id)
+
+    assert not store.get_chat_history(session_id)
+    assert store.count_messages(session_id) == 0
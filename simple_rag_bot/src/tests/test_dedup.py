@@ -0,0 +1,71 @@
+"""Tests of duplicate detection within a document and against the corpus index"""
+import random
+
+from backend.core.dedup import NearDuplicateDetector
+
+WORDS = ["climate", "carbon", "ocean", "recipe", "garlic", "onion", "agent", "model", "prompt",
+         "energy", "forest", "river", "pepper", "tomato", "memory", "planning", "heat", "ice"]
+
+def create_chunks(doc_id: str, contents: list):
+    """Chunks of a document with the given contents"""
+    return [{"chunk_id": f"{doc_id}/chunks/c{i}", "doc_id": doc_id, "content": content}
+            for i, content in enumerate(contents)]
+
+def random_texts(num_texts: int, seed: int, num_words: int=60):
+    """Texts of random words"""
+    generator = random.Random(seed)
+    return [" ".join(generator.choice(WORDS) for _ in range(num_words))
+            for _ in range(num_texts)]
+
+def test_duplicates_within_a_document():
+    """Exact and near duplicate chunks of a document are dropped"""
+    texts = random_texts(3, seed=1)
+    near_copy = texts[0].rsplit(" ", 1)[0] + " tomato"
+    chunks = create_chunks("doc_a", texts + [texts[1].upper(), near_copy])
+
+    kept_chunks, report = NearDuplicateDetector().deduplicate(chunks)
+
+    assert [chunk["chunk_id"] for chunk in kept_chunks] == [f"doc_a/chunks/c{i}" for i in range(3)]
+    assert report["exact_duplicates"] == 1
+    assert report["near_duplicates"] == 1
+    assert report["corpus_duplicates"] == 0
+
+def test_same_document_under_another_name_is_dropped():
+    """Chunks of a document already in the corpus are duplicates of the indexed chunks"""
+    texts = random_texts(5, seed=2)
+    detector = NearDuplicateDetector()
+    detector.add_to_index(create_chunks("doc_a", texts))
+
+    kept_chunks, report = detector.deduplicate(create_chunks("doc_b", texts + random_texts(1, 3)))
+
+    assert [chunk["chunk_id"] for chunk in kept_chunks] == ["doc_b/chunks/c5"]
+    assert report["corpus_duplicates"] == 5
+    assert report["duplicates"]["doc_b/chunks/c0"] == "doc_a/chunks/c0"
+
+def test_new_version_of_indexed_document_is_kept():
+    """Indexed chunks of the same document are replaced, not duplicates"""
+    texts = random_texts(4, seed=4)
+    detector = NearDuplicateDetector()
+    detector.add_to_index(create_chunks("doc_a", texts))
+    detector.add_to_index(create_chunks("doc_a", texts[:2]))
+
+    kept_chunks, _ = detector.deduplicate(create_chunks("doc_a", texts))
+
+    assert len(kept_chunks) == 4
+    assert detector.index_size() == 2
+
+def test_index_is_saved_and_loaded(tmp_path):
+    """Index saved at setup finds the same duplicates after loading"""
+    texts = random_texts(5, seed=5)
+    detector = NearDuplicateDetector()
+    detector.add_to_index(create_chunks("doc_a", texts))
+    index_path = detector.save_index(str(tmp_path / "minhash_index.npz"))
+
+    loaded_detector = NearDuplicateDetector()
+    assert loaded_detector.load_index(index_path)
+    _, report = loaded_detector.deduplicate(create_chunks("doc_b", texts))
+
+    assert loaded_detector.index_size() == 5
+    assert report["corpus_duplicates"] == 5
+    assert not NearDuplicateDetector(num_perm=32).load_index(index_path)
+    assert not NearDuplicateDetector().load_index(str(tmp_path / "missing.npz"))
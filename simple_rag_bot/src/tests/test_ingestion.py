@@ -0,0 +1,213 @@
+"""Tests of background ingestion into the collections searched by the app"""
+import os
+import json
+import shutil
+import pytest
+
+from backend.core import tools
+from backend.core.chunk_index import ChunkIndex
+from backend.core.citations import CitationStore
+from backend.core.chunking import PDFTextSplitter
+from backend.core.fakes import FakeEmbeddingClient
+from backend.core.dedup import NearDuplicateDetector
+from backend.core.ingestion import IngestionService, is_multi_worker
+from backend.core.quantization import QuantizedVectorStore
+from backend.core.sharding import ShardSelector, ShardStats, compute_centroid
+from backend.ml_config import DEDUP_CONFIGS, EXPANSION_CONFIGS, CITATION_CONFIGS
+from backend.setup import deduplicate_chunks
+
+DOCUMENTS_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "documents")
+
+class FakeMilvusClient:
+    """In memory collections with the same interface as CustomMilvusClient"""
+    def __init__(self):
+        self.collections = {}
+
+    def has_collection(self, collection_name: str):
+        """Check if collection exists"""
+        return collection_name in self.collections
+
+    def create_collection(self, collection_name: str, **kwargs):
+        """Create an empty collection"""
+        self.collections[collection_name] = []
+
+    def replace_document(self, collection_name: str, doc_id: str, data: list):
+        """Replace all chunks of a document"""
+        self.collections[collection_name] = [
+            entry for entry in self.collections[collection_name] if entry["doc_id"] != doc_id
+        ] + list(data)
+
+    def get_collection_data(self, collection_name: str):
+        """Get all entries of the collection"""
+        return list(self.collections[collection_name])
+
+@pytest.fixture(name="shard_configs")
+def fixture_shard_configs(tmp_path, monkeypatch):
+    """Shards of the recipes and climate documents, tools do not load setup files"""
+    monkeypatch.setattr(tools, "get_chunk_index", lambda: None)
+    monkeypatch.setattr(tools, "get_citation_store", lambda: None)
+    monkeypatch.setattr(tools, "get_shard_selector", lambda: None)
+    return {
+        "default_shard": "general",
+        "centroids_path": str(tmp_path / "shard_centroids.json"),
+        "stats_path": str(tmp_path / "shard_stats.json"),
+        "shards": {"recipes": ["Easy_recipes.pdf"],
+                   "climate_change": ["Understanding_Climate_Change.pdf"]},
+    }
+
+def ingest(service, file_names: list):
+    """Ingest the documents and return their jobs"""
+    service.start()
+    try:
+        job_ids = [service.submit(os.path.join(DOCUMENTS_DIR, file_name))
+                   for file_name in file_names]
+        assert service.wait(job_ids, timeout=60)
+    finally:
+        service.stop()
+    return [service.get_job(job_id) for job_id in job_ids]
+
+def test_chunks_are_written_to_their_shard(shard_configs):
+    """Documents go to the default collection and their shard, centroids are saved"""
+    retriever = FakeMilvusClient()
+    embedding_client = FakeEmbeddingClient(embedding_dimension=64)
+    recipes_centroid = embedding_client.get_query_embeddings("cooking")
+    shard_selector = ShardSelector({"recipes": recipes_centroid})
+    service = IngestionService(embedding_client=embedding_client, retriever_client=retriever,
+                               shard_selector=shard_selector, shard_configs=shard_configs)
+
+    jobs = ingest(service, ["Easy_recipes.pdf", "Understanding_Climate_Change.pdf"])
+
+    assert [job["status"] for job in jobs] == ["completed", "completed"]
+    assert sorted(retriever.collections) == ["climate_change", "local_pdf_rag", "recipes"]
+    assert len(retriever.collections["local_pdf_rag"]) == sum(job["num_chunks"] for job in jobs)
+    assert {entry["document_metadata"]["title"]
+            for entry in retriever.collections["recipes"]} == {"Easy_recipes.pdf"}
+    # New shard is selectable and the centroid of the existing one moved to its chunks
+    with open(shard_configs["centroids_path"], "r") as json_file:
+        assert sorted(json.load(json_file)) == ["climate_change", "recipes"]
+    assert shard_selector.centroids["recipes"] != recipes_centroid
+    query_embedding = embedding_client.get_query_embeddings("greenhouse gases warming")
+    assert shard_selector.select(query_embedding)[0] == "climate_change"
+
+def test_centroids_are_updated_from_running_sums(shard_configs):
+    """Centroids after ingesting and ingesting again match the centroids of all vectors"""
+    retriever = FakeMilvusClient()
+    embedding_client = FakeEmbeddingClient(embedding_dimension=64)
+    shard_selector = ShardSelector({"recipes": embedding_client.get_query_embeddings("cooking")})
+    service = IngestionService(embedding_client=embedding_client, retriever_client=retriever,
+                               shard_selector=shard_selector, shard_configs=shard_configs)
+
+    ingest(service, ["Easy_recipes.pdf", "Understanding_Climate_Change.pdf"])
+    ingest(service, ["Easy_recipes.pdf"])
+
+    for shard_name in ("recipes", "climate_change"):
+        expected = compute_centroid([entry["chunk_embedding"]
+                                     for entry in retriever.collections[shard_name]])
+        assert shard_selector.centroids[shard_name] == pytest.approx(expected)
+    assert ShardStats.from_file(shard_configs["stats_path"]).get_centroid(
+        "recipes") == pytest.approx(shard_selector.centroids["recipes"])
+
+def test_unsharded_setup_writes_default_collection(shard_configs):
+    """Without shard centroids only the default collection is written"""
+    retriever = FakeMilvusClient()
+    service = IngestionService(embedding_client=FakeEmbeddingClient(embedding_dimension=64),
+                               retriever_client=retriever, shard_configs=shard_configs)
+
+    ingest(service, ["Easy_recipes.pdf"])
+
+    assert list(retriever.collections) == ["local_pdf_rag"]
+    assert not os.path.exists(shard_configs["centroids_path"])
+
+def test_quantized_store_is_refreshed(shard_configs, tmp_path):
+    """Changed collections are quantized again and searched without a restart"""
+    retriever = FakeMilvusClient()
+    embedding_client = FakeEmbeddingClient(embedding_dimension=64)
+    quantized_store = QuantizedVectorStore(store_dir=str(tmp_path / "quantized"))
+    service = IngestionService(embedding_client=embedding_client, retriever_client=retriever,
+                               quantized_store=quantized_store, shard_configs=shard_configs)
+
+    ingest(service, ["Easy_recipes.pdf"])
+    hits = quantized_store.query_collection("local_pdf_rag",
+                                            embedding_client.get_query_embeddings("recipe"),
+                                            limit=3, output_fields=["doc_id"])[0]
+    ingest(service, ["Understanding_Climate_Change.pdf"])
+
+    assert len(hits) == 3
+    assert len(quantized_store._load_collection("local_pdf_rag")["records"]) == len( # pylint: disable=protected-access
+        retriever.collections["local_pdf_rag"])
+
+def test_ingested_chunks_are_retrieved_after_restart(shard_configs, tmp_path, monkeypatch):
+    """Chunks and citations of ingested documents are saved with the ones of the setup"""
+    chunks_path, citations_path = tmp_path / "chunked_content.jsonl", tmp_path / "citations.jsonl"
+    chunks_path.write_text("")
+    citations_path.write_text("")
+    monkeypatch.setitem(EXPANSION_CONFIGS, "chunks_path", str(chunks_path))
+    monkeypatch.setitem(CITATION_CONFIGS, "citations_path", str(citations_path))
+    monkeypatch.setattr(tools, "get_chunk_index", lambda index=ChunkIndex([]): index)
+    monkeypatch.setattr(tools, "get_citation_store", lambda store=CitationStore([]): store)
+    retriever = FakeMilvusClient()
+    service = IngestionService(embedding_client=FakeEmbeddingClient(embedding_dimension=64),
+                               retriever_client=retriever, shard_configs=shard_configs,
+                               watch_dir=DOCUMENTS_DIR)
+
+    ingest(service, ["Easy_recipes.pdf", "Understanding_Climate_Change.pdf"])
+    # Ingesting a document again replaces its chunks
+    ingest(service, ["Easy_recipes.pdf"])
+    chunk_index = ChunkIndex.from_file(str(chunks_path))
+    citation_store = CitationStore.from_file(str(citations_path))
+    relevant_docs = [[{"id": entry["chunk_id"], "distance": 0.5}
+                      for entry in retriever.collections["local_pdf_rag"]]]
+
+    hits = chunk_index.hydrate_hits(relevant_docs, ["content", "doc_id"])[0]
+    assert len(hits) == len(chunk_index.chunks) == len(retriever.collections["local_pdf_rag"])
+    assert citation_store.get(hits[0]["id"])["url"] in ("Easy_recipes.pdf#page=1",
+                                                        "Understanding_Climate_Change.pdf#page=1")
+
+def test_document_already_in_corpus_is_not_ingested(shard_configs, tmp_path):
+    """Same pdf under another name only has duplicates of the corpus index saved at setup"""
+    chunked_data = PDFTextSplitter(file_uri=None).process_documents(
+        [os.path.join(DOCUMENTS_DIR, "Easy_recipes.pdf")])
+    kept_chunks, _ = deduplicate_chunks(chunked_data, DEDUP_CONFIGS,
+                                        index_path=str(tmp_path / "minhash_index.npz"))
+    copy_path = shutil.copy(os.path.join(DOCUMENTS_DIR, "Easy_recipes.pdf"),
+                            tmp_path / "Easy_recipes_copy.pdf")
+
+    retriever = FakeMilvusClient()
+    service = IngestionService(embedding_client=FakeEmbeddingClient(embedding_dimension=64),
+                               retriever_client=retriever, shard_configs=shard_configs,
+                               deduplicator=NearDuplicateDetector(),
+                               dedup_index_path=str(tmp_path / "minhash_index.npz"))
+    service.start()
+    job_id = service.submit(str(copy_path))
+    assert service.wait([job_id], timeout=60)
+    service.stop()
+
+    job = service.get_job(job_id)
+    assert job["status"] == "completed"
+    assert job["num_chunks"] == 0
+    assert job["duplicates_removed"] == len(kept_chunks)
+    assert not retriever.collections
+
+def test_queued_jobs_are_cancelled_on_stop(shard_configs):
+    """Jobs still queued when the service stops are marked cancelled"""
+    service = IngestionService(embedding_client=FakeEmbeddingClient(embedding_dimension=64),
+                               retriever_client=FakeMilvusClient(), shard_configs=shard_configs)
+    job_id = service.submit(os.path.join(DOCUMENTS_DIR, "Easy_recipes.pdf"))
+    service.stop()
+
+    assert service.get_job(job_id)["status"] == "cancelled"
+    assert service.wait([job_id], timeout=1)
+
+def test_ingestion_is_not_started_by_multiple_workers(monkeypatch):
+    """Workers serving a shared index do not write the milvus db"""
+    monkeypatch.delenv("RAG_SHARED_INDEX", raising=False)
+    monkeypatch.setenv("RAG_WORKERS", "1")
+    assert not is_multi_worker()
+
+    monkeypatch.setenv("RAG_WORKERS", "4")
+    assert is_multi_worker()
+    service = IngestionService(embedding_client=FakeEmbeddingClient(embedding_dimension=64),
+                               quantized_store=QuantizedVectorStore(store_dir="unused"))
+    monkeypatch.setattr(tools, "get_retriever_instance", lambda: service.quantized_store)
+    with pytest.raises(ValueError, match="multi worker mode"):
+        service.start()
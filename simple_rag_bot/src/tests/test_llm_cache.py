@@ -0,0 +1,65 @@
+"""Tests of the sqlite llm response cache"""
+from langchain_core.tools import tool
+from langchain_core.outputs import Generation
+
+from backend.core.fakes import FakeChatModel
+from backend.core.llm_cache import SQLiteLLMCache
+
+@tool
+def get_relevant_docs_tool(query: str):
+    """Get documents relevant to the query"""
+    return query
+
+def test_repeated_prompt_is_a_hit(tmp_path):
+    """Same prompt to the same model is answered from the cache"""
+    cache = SQLiteLLMCache(db_path=str(tmp_path / "llm_cache.db"))
+    llm = FakeChatModel(cache=cache)
+
+    first_response = llm.invoke("what is climate change")
+    second_response = llm.invoke("what is climate change")
+
+    assert second_response.content == first_response.content
+    assert cache.get_stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+def test_other_prompt_is_a_miss(tmp_path):
+    """Prompts are matched exactly"""
+    cache = SQLiteLLMCache(db_path=str(tmp_path / "llm_cache.db"))
+    llm = FakeChatModel(cache=cache)
+
+    llm.invoke("what is climate change")
+    response = llm.invoke("what is global warming")
+
+    assert response.content == "Fake response to: what is global warming"
+    assert cache.get_stats()["hits"] == 0
+
+def test_bound_tools_are_part_of_the_key(tmp_path):
+    """Model with tools does not get the response of the model without tools"""
+    cache = SQLiteLLMCache(db_path=str(tmp_path / "llm_cache.db"))
+    llm = FakeChatModel(cache=cache)
+
+    llm.invoke("what is climate change")
+    tool_response = llm.bind_tools([get_relevant_docs_tool]).invoke("what is climate change")
+    cached_tool_response = llm.bind_tools([get_relevant_docs_tool]).invoke(
+        "what is climate change")
+
+    assert tool_response.tool_calls[0]["name"] == "get_relevant_docs_tool"
+    assert cached_tool_response.tool_calls == tool_response.tool_calls
+    assert cache.get_stats()["misses"] == 2
+
+def test_entries_are_separated_by_prompt_and_model(tmp_path):
+    """Llm string holds the model name and params, entries of other models are not used"""
+    cache = SQLiteLLMCache(db_path=str(tmp_path / "llm_cache.db"))
+    flash = "[('_type', 'chat-google-generative-ai'), ('model', 'gemini-2.0-flash')]"
+    pro = "[('_type', 'chat-google-generative-ai'), ('model', 'gemini-1.5-pro')]"
+    cache.update("prompt a", flash, [Generation(text="flash answer")])
+
+    assert cache.lookup("prompt a", flash)[0].text == "flash answer"
+    assert cache.lookup("prompt a", pro) is None
+    assert cache.lookup("prompt b", flash) is None
+
+def test_entries_are_shared_by_cache_instances(tmp_path):
+    """Workers open the same database file"""
+    db_path = str(tmp_path / "llm_cache.db")
+    SQLiteLLMCache(db_path=db_path).update("prompt a", "model", [Generation(text="answer")])
+
+    assert SQLiteLLMCache(db_path=db_path).lookup("prompt a", "model")[0].text == "answer"
@@ -0,0 +1,80 @@
+"""Tests of the quantized vector store and its footprint report"""
+import os
+import numpy as np
+
+from backend.core.quantization import QuantizedVectorStore, measure_quantization
+from backend.core.quantization import measure_footprint
+
+def create_embeddings(num_vectors: int, dimension: int=128, seed: int=0):
+    """Chunks with random embeddings"""
+    generator = np.random.default_rng(seed)
+    return [{"chunk_id": f"doc_a/chunks/c{i}", "content": f"chunk {i} " * 20,
+             "chunk_embedding": generator.normal(size=dimension).tolist()}
+            for i in range(num_vectors)]
+
+def test_search_finds_the_vector(tmp_path):
+    """Closest vector is the first hit"""
+    embeddings_data = create_embeddings(100)
+    store = QuantizedVectorStore(store_dir=str(tmp_path))
+    store.create_collection("chunks", embeddings_data)
+
+    hits = store.query_collection("chunks", embeddings_data[7]["chunk_embedding"], limit=3,
+                                  output_fields=["content"])[0]
+
+    assert hits[0]["id"] == "doc_a/chunks/c7"
+    assert hits[0]["entity"]["content"] == embeddings_data[7]["content"]
+
+def test_empty_collection_has_no_hits(tmp_path):
+    """Collections without vectors are searched without errors"""
+    store = QuantizedVectorStore(store_dir=str(tmp_path))
+    store.create_collection("empty", [{"chunk_id": "doc_a/chunks/c0", "content": "no vector"}])
+
+    assert store.query_collection("empty", [0.1] * 8, limit=3, output_fields=["content"]) == [[]]
+
+def test_report_includes_float16_vectors_and_records(tmp_path):
+    """Footprint counts every file of the store, not only the codes"""
+    embeddings_data = create_embeddings(200)
+    report = measure_quantization(embeddings_data, [embeddings_data[0]["chunk_embedding"]],
+                                  store_dir=str(tmp_path), top_k=5)
+
+    footprint = report["store_footprint"]
+    assert report["int8_vs_float32_reduction"] == 4.0
+    assert footprint["rescore_vectors_bytes"] > 2 * report["int8_bytes"]
+    assert footprint["total_bytes"] > report["int8_bytes"] + footprint["records_bytes"]
+    assert 1.0 < report["footprint_reduction"] < 4.0
+    assert report["recall@5_int8_rescored"] == 1.0
+
+def test_footprint_against_milvus_db(tmp_path):
+    """All collections of the store are compared with the milvus db file"""
+    store = QuantizedVectorStore(store_dir=str(tmp_path / "quantized"))
+    store.create_collection("local_pdf_rag", create_embeddings(50))
+    store.create_collection("recipes", create_embeddings(20))
+    milvus_db_path = tmp_path / "local_milvus.db"
+    milvus_db_path.write_bytes(os.urandom(100000))
+
+    footprint = measure_footprint(str(tmp_path / "quantized"), str(milvus_db_path))
+
+    assert footprint["milvus_db_bytes"] == 100000
+    assert footprint["quantized_store"]["total_bytes"] == sum(
+        os.path.getsize(os.path.join(folder, file_name))
+        for folder, _, file_names in os.walk(tmp_path / "quantized") for file_name in file_names)
+    assert footprint["reduction_vs_milvus"] == round(
+        100000 / footprint["quantized_store"]["total_bytes"], 2)
+
+def test_document_vectors_are_replaced(tmp_path):
+    """Vectors of other documents keep their codes, vectors of the document are replaced"""
+    embeddings_data = [{**entry, "doc_id": "doc_a"} for entry in create_embeddings(50)]
+    new_data = [{**entry, "chunk_id": entry["chunk_id"].replace("doc_a", "doc_b"),
+                 "doc_id": "doc_b"} for entry in create_embeddings(10, seed=1)]
+    store = QuantizedVectorStore(store_dir=str(tmp_path))
+    store.create_collection("chunks", embeddings_data + new_data[:5])
+    codes = store._load_collection("chunks")["codes"].copy() # pylint: disable=protected-access
+
+    store.upsert_document("chunks", "doc_b", new_data)
+    collection = store._load_collection("chunks") # pylint: disable=protected-access
+    hits = store.query_collection("chunks", new_data[7]["chunk_embedding"], limit=1,
+                                  output_fields=["doc_id"])[0]
+
+    assert len(collection["records"]) == 60
+    assert (collection["codes"][:50] == codes[:50]).all()
+    assert hits[0]["id"] == "doc_b/chunks/c7"
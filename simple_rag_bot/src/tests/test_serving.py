@@ -0,0 +1,63 @@
+"""Tests of the shared index check before serving with multiple workers"""
+import os
+import logging
+import importlib.util
+import numpy as np
+import pytest
+
+from backend.core import tools
+from backend.ml_config import QUANTIZATION_CONFIGS
+from backend.utils.utility import save_embeddings
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "gunicorn.conf.py")
+
+class FakeServer:
+    """Gunicorn arbiter with its logger"""
+    log = logging.getLogger("gunicorn.test")
+
+def load_config(monkeypatch, tmp_path, workers: int):
+    """Gunicorn config with the given workers and index paths in the temp folder"""
+    monkeypatch.setenv("RAG_WORKERS", str(workers))
+    monkeypatch.setenv("RAG_INDEX_DIR", str(tmp_path / "quantized"))
+    monkeypatch.setitem(QUANTIZATION_CONFIGS, "embeddings_path", str(tmp_path / "embeddings.jsonl"))
+    spec = importlib.util.spec_from_file_location("gunicorn_conf", CONFIG_PATH)
+    config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config)
+    return config
+
+def test_missing_index_and_embeddings_stop_multiple_workers(monkeypatch, tmp_path):
+    """Workers are not started when they would share the milvus lite db"""
+    config = load_config(monkeypatch, tmp_path, workers=4)
+
+    assert "RAG_SHARED_INDEX=1" in config.raw_env
+    with pytest.raises(RuntimeError, match="Run the setup first"):
+        config.on_starting(FakeServer())
+
+def test_missing_index_is_created_from_embeddings(monkeypatch, tmp_path):
+    """Index is created from the saved embeddings, including the shard collections"""
+    generator = np.random.default_rng(0)
+    save_embeddings([{"chunk_id": f"doc_a/chunks/c{i}", "content": f"chunk {i}",
+                      "document_metadata": {"title": "Easy_recipes.pdf"},
+                      "chunk_embedding": generator.normal(size=16).tolist()}
+                     for i in range(10)], str(tmp_path / "embeddings.jsonl"))
+    config = load_config(monkeypatch, tmp_path, workers=4)
+
+    config.on_starting(FakeServer())
+
+    assert sorted(os.listdir(tmp_path / "quantized")) == ["local_pdf_rag", "recipes"]
+
+def test_single_worker_uses_milvus_db(monkeypatch, tmp_path):
+    """A single worker does not need the shared index"""
+    config = load_config(monkeypatch, tmp_path, workers=1)
+    config.on_starting(FakeServer())
+
+    assert "RAG_SHARED_INDEX=1" not in config.raw_env
+    assert not os.path.exists(tmp_path / "quantized")
+
+def test_worker_without_shared_index_fails(monkeypatch, tmp_path):
+    """Workers in shared mode do not fall back to the milvus lite db"""
+    monkeypatch.setenv("RAG_SHARED_INDEX", "1")
+    monkeypatch.setenv("RAG_INDEX_DIR", str(tmp_path / "quantized"))
+
+    with pytest.raises(ValueError, match="Shared quantized index not found"):
+        tools.load_retriever(QUANTIZATION_CONFIGS)
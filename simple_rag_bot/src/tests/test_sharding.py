@@ -0,0 +1,61 @@
+"""Tests of shard assignment, shard selection and scatter-gather search"""
+from backend.core.sharding import assign_shard, split_into_shards, ShardSelector
+from backend.core.sharding import scatter_gather_query
+
+SHARD_CONFIGS = {
+    "default_shard": "general",
+    "shards": {"recipes": ["Easy_recipes.pdf"], "climate_change": ["Climate.pdf"]},
+}
+
+class FakeRetriever:
+    """Collections of (id, distance) hits, recording the searched collections"""
+    def __init__(self, collections: dict):
+        self.collections = collections
+        self.searched = []
+
+    def query_collection(self, collection_name, query_embedding, limit, output_fields):
+        """Best hits of the collection"""
+        self.searched.append(collection_name)
+        hits = sorted(self.collections[collection_name], key=lambda hit: hit[1], reverse=True)
+        return [[{"id": chunk_id, "distance": distance, "entity": {}}
+                 for chunk_id, distance in hits[:limit]]]
+
+def test_documents_are_assigned_to_their_shard():
+    """Listed documents go to their shard, others to the default shard"""
+    chunks = [{"chunk_id": f"c{i}", "document_metadata": {"title": title}}
+              for i, title in enumerate(["Easy_recipes.pdf", "Climate.pdf", "Agents.pdf",
+                                         "Easy_recipes.pdf"])]
+
+    sharded_data = split_into_shards(chunks, SHARD_CONFIGS)
+
+    assert assign_shard("Unknown.pdf", SHARD_CONFIGS) == "general"
+    assert {shard_name: [chunk["chunk_id"] for chunk in shard_data]
+            for shard_name, shard_data in sharded_data.items()} == {
+        "recipes": ["c0", "c3"], "climate_change": ["c1"], "general": ["c2"]}
+
+def test_selection_skips_shards_far_behind_the_best():
+    """Best shard is always selected, close shards are added up to max shards"""
+    selector = ShardSelector({"recipes": [1.0, 0.0, 0.0], "climate_change": [0.9, 0.1, 0.0],
+                              "agents": [0.0, 0.0, 1.0]}, max_shards=3)
+
+    assert selector.select([1.0, 0.05, 0.0]) == ["recipes", "climate_change"]
+    assert selector.select([0.0, 0.0, 1.0]) == ["agents"]
+    assert ShardSelector({}).select([1.0, 0.0, 0.0]) == []
+
+def test_scatter_gather_merges_top_hits():
+    """Hits of all shards are merged into one top-k result with their collection"""
+    retriever = FakeRetriever({"recipes": [("r0", 0.9), ("r1", 0.4)],
+                               "climate_change": [("c0", 0.7), ("c1", 0.6)]})
+
+    hits = scatter_gather_query(retriever, ["recipes", "climate_change"], [1.0], limit=3,
+                                output_fields=[])[0]
+
+    assert [(hit["id"], hit["collection_name"]) for hit in hits] == [
+        ("r0", "recipes"), ("c0", "climate_change"), ("c1", "climate_change")]
+
+def test_scatter_gather_without_shards_has_no_hits():
+    """No selected shards return an empty result without searching"""
+    retriever = FakeRetriever({})
+
+    assert scatter_gather_query(retriever, [], [1.0], limit=3, output_fields=[]) == [[]]
+    assert not retriever.searched
@@ -0,0 +1,70 @@
+"""Tests of fetching remote documents with conditional requests"""
+import os
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest
+
+from backend.core.file_server import LocalFileServer
+from backend.core.sources import RemoteDocumentFetcher
+
+class TruncatedResponseHandler(BaseHTTPRequestHandler):
+    """Sends part of the announced body and closes the connection"""
+    def do_GET(self): # pylint: disable=invalid-name
+        """Send 10 of 1000 bytes"""
+        self.send_response(200)
+        self.send_header("Content-Length", "1000")
+        self.end_headers()
+        self.wfile.write(b"%PDF-1.4 ")
+        self.wfile.flush()
+        self.close_connection = True
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        """Do not log every request"""
+
+@pytest.fixture(name="server")
+def fixture_server(tmp_path):
+    """File server of a folder with a single pdf"""
+    served_dir = tmp_path / "served"
+    served_dir.mkdir()
+    (served_dir / "Easy recipes.pdf").write_bytes(b"%PDF-1.4 recipes")
+    with LocalFileServer(str(served_dir)) as server:
+        yield server
+
+def test_unchanged_document_is_not_downloaded_again(tmp_path, server):
+    """Second fetch sends the validators and gets 304 Not Modified"""
+    fetcher = RemoteDocumentFetcher(download_dir=str(tmp_path / "downloads"))
+    url = server.url_for("Easy recipes.pdf")
+
+    first_result = fetcher.fetch_all([url])[0]
+    second_result = RemoteDocumentFetcher(download_dir=str(tmp_path / "downloads")).fetch_all(
+        [url])[0]
+
+    assert first_result["status"] == "downloaded"
+    assert first_result["path"].endswith("_Easy recipes.pdf")
+    with open(first_result["path"], "rb") as pdf_file:
+        assert pdf_file.read() == b"%PDF-1.4 recipes"
+    assert second_result["status"] == "not_modified"
+
+def test_missing_document_fails(tmp_path, server):
+    """Http errors are reported in the result"""
+    fetcher = RemoteDocumentFetcher(download_dir=str(tmp_path / "downloads"))
+
+    result = fetcher.fetch_all([server.url_for("Missing.pdf")])[0]
+
+    assert result["status"] == "failed"
+    assert "404" in result["error"]
+
+def test_interrupted_download_leaves_no_partial_file(tmp_path):
+    """Partial file of a failed download is removed"""
+    http_server = ThreadingHTTPServer(("127.0.0.1", 0), TruncatedResponseHandler)
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    fetcher = RemoteDocumentFetcher(download_dir=str(tmp_path / "downloads"))
+    try:
+        host, port = http_server.server_address
+        result = fetcher.fetch_all([f"http://{host}:{port}/Truncated.pdf"])[0]
+    finally:
+        http_server.shutdown()
+        http_server.server_close()
+
+    assert result["status"] == "failed"
+    assert sorted(os.listdir(tmp_path / "downloads")) == ["manifest.json"]
@@ -2,11 +2,14 @@
 # pylint: disable=line-too-long,invalid-name
 
 import os
+import uuid
 from datetime import datetime, timedelta, timezone
 from typing import Union, List, Dict, Any
 import streamlit as st
-from video_processor.processor import get_video_data
-from utils.utility import construct_contents
+from video_processor.processor import get_video_data, get_video_id, SNAPSHOT_FORMAT
+from utils.utility import construct_contents, process_video_metadata
+from utils.artefact_cache import ArtefactCache
+from utils.media_uploader import MediaUploader
 from core.video_analyzer import VideoAnalyzer
 from core.prompt_generator import PromptGenerator
 from core.image_generator import ImageGenerator
@@ -70,6 +73,16 @@ num_snapshots_input = st.number_input(
     key="num_snapshots"
 )
 
+snapshot_strategy_input = st.selectbox(
+    "Snapshot Selection (for videos > 2 mins)",
+    ("content", "auto", "seek", "sequential", "keyframe", "thumbnail", "segmented"),
+    help="content: picks distinct, sharp frames and skips dark or transition frames, "
+         "might return fewer snapshots. Others take equally spaced snapshots, segmented "
+         "splits them over worker processes and is faster for many snapshots on multi core "
+         "machines.",
+    key="snapshot_strategy"
+)
+
 # --- Initialize session state variables ---
 if 'video_processor_progress' not in st.session_state:
     st.session_state.video_processor_progress = st.progress(0)
@@ -103,6 +116,29 @@ if 'image_generator' not in st.session_state:
     st.session_state.image_generator = ""
 if 'image_editor' not in st.session_state:
     st.session_state.image_editor = ""
+if 'media_uploader' not in st.session_state:
+    st.session_state.media_uploader = None
+if 'cache_key' not in st.session_state:
+    st.session_state.cache_key = None
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
+@st.cache_resource
+def get_artefact_cache():
+    """Artefact cache shared by all sessions, created once so its lock guards every write"""
+    return ArtefactCache(cache_dir="artefact_cache", max_size_mb=500)
+
+@st.cache_resource
+def get_media_uploader(account_id: str, _client):
+    """Media uploader shared by all sessions of an api key, uploads and the uri cache file
+    are written under its lock"""
+    return MediaUploader(client=_client, account_id=account_id)
+
+# Processed videos, descriptions and prompts are reused across runs
+artefact_cache = get_artefact_cache()
+# Every rerun keeps the media of the current video from being evicted by other sessions
+if st.session_state.cache_key:
+    artefact_cache.pin(st.session_state.session_id, st.session_state.cache_key)
 
 def validate_api_key(apikey: str):
     """Validate api key"""
@@ -115,7 +151,7 @@ def validate_api_key(apikey: str):
 
     return True, client
 
-def get_video_info_and_process(url: str, num_snaps: int=5):
+def get_video_info_and_process(url: str, num_snaps: int=5, snapshot_strategy: str="auto"):
     """Video processing logic
     Returns: (success_flag, message, media_paths, video_metadata, downloaded_path)
     """
@@ -129,7 +165,19 @@ def get_video_info_and_process(url: str, num_snaps: int=5):
         return False, st.session_state.error_message, [], {}, None
 
     try:
-        video_metadata, media_path = get_video_data(url=url, num_snaps=num_snaps)
+        cache_key = ArtefactCache.get_key(get_video_id(url), {
+            "num_snaps": num_snaps,
+            "snapshot_strategy": snapshot_strategy,
+            "format": SNAPSHOT_FORMAT
+        })
+        st.session_state.cache_key = cache_key
+        artefact_cache.pin(st.session_state.session_id, cache_key)
+        video_metadata, media_path = artefact_cache.get_video(cache_key)
+        if video_metadata is None:
+            video_metadata, media_path = get_video_data(url=url, num_snaps=num_snaps,
+                                                        snapshot_strategy=snapshot_strategy)
+            if media_path:
+                media_path = artefact_cache.put_video(cache_key, video_metadata, media_path)
         st.session_state.video_title = video_metadata.get("title")
 
         if isinstance(media_path, list):
@@ -148,17 +196,40 @@ def get_video_info_and_process(url: str, num_snaps: int=5):
 
 def generate_description_from_video_data(video_metadata: dict, media_content: str, model: str=""):
     """Wrapper to generate video desciption from metadata and media contents"""
-    message_content = construct_contents(video_metadata, media_content)
+    cache_key = st.session_state.cache_key
+    video_description = artefact_cache.get_text(cache_key, f"description_{model}")
+    if video_description:
+        return True, "Description loaded from cache.", video_description
+
+    # Subtitles are fetched only once per video
+    metadata_description = artefact_cache.get_text(cache_key, "metadata_description")
+    if metadata_description is None:
+        metadata_description = process_video_metadata(video_metadata)
+        artefact_cache.put_text(cache_key, "metadata_description", metadata_description)
+    try:
+        message_content = construct_contents(video_metadata, media_content, metadata_description,
+                                             st.session_state.media_uploader)
+    except ValueError as e:
+        # Video upload failed and it is too big to send inline
+        return False, f"Error occured while generating video description: {e}", ""
 
     video_description, status = st.session_state.video_analyzer.get_gemini_response(message_content, model)
     if video_description:
+        artefact_cache.put_text(cache_key, f"description_{model}", video_description)
         return True, "Description generated.", video_description
     return False, f"Error occured while generating video description: {status}", ""
 
 def generate_prompt_from_description(description: str, model: str=""):
     """Wrapper to generate prompt from video description"""
+    # Keyed on the description, as it can be edited before generating the prompt
+    prompt_name = f"prompt_{model}_{ArtefactCache.text_hash(description)}"
+    imagen_prompt = artefact_cache.get_text(st.session_state.cache_key, prompt_name)
+    if imagen_prompt:
+        return True, "Image prompt loaded from cache.", imagen_prompt
+
     imagen_prompt, status = st.session_state.imagen_prompter.get_imagen_prompt(description, model)
     if imagen_prompt:
+        artefact_cache.put_text(st.session_state.cache_key, prompt_name, imagen_prompt)
         return True, "Image prompt generated.", imagen_prompt
     return False, f"Error occured while generating image generation prompt: {status}", ""
 
@@ -209,7 +280,7 @@ with col1_btn:
 with col2_btn_clear:
     if st.button("Reset Workflow", use_container_width=True):
         for key in list(st.session_state.keys()):
-            if key not in ['api_key', 'prompt_model', 'image_model', 'workflow_mode', 'video_url', 'num_snapshots']:
+            if key not in ['api_key', 'prompt_model', 'image_model', 'workflow_mode', 'video_url', 'num_snapshots', 'snapshot_strategy']:
                 del st.session_state[key]
         st.rerun()
 
@@ -243,10 +314,15 @@ with st.expander("Step 1: Video Processing", expanded=True):
             st.session_state.image_editor = ImageEditor(
                 client=result
             )
+            # Videos are uploaded once per api key and reused until the upload expires
+            st.session_state.media_uploader = get_media_uploader(
+                ArtefactCache.text_hash(st.session_state.api_key), result
+            )
             with st.spinner("Processing video, this might take a while..."):
                 success, msg, paths, metadata, dl_path = get_video_info_and_process(
                     st.session_state.video_url,
-                    st.session_state.num_snapshots
+                    st.session_state.num_snapshots,
+                    st.session_state.snapshot_strategy
                 )
                 if success:
                     st.session_state.video_processed = True
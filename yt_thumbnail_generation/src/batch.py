@@ -0,0 +1,54 @@
+"""Generate thumbnails for many videos, playlists or channels in one run.
+Usage from the src folder: python batch.py <video/playlist url or file of urls> ...
+Runs again with the same checkpoint resume from the last completed stage of every video"""
+import os
+import sys
+import json
+
+from google import genai
+from core.video_analyzer import VideoAnalyzer
+from core.prompt_generator import PromptGenerator
+from core.image_generator import ImageGenerator
+from core.batch_pipeline import BatchPipeline
+from core.prompts import video_analyzer_prompt, imagen_prompt_generator
+from video_processor.processor import expand_playlist
+from utils.artefact_cache import ArtefactCache
+from utils.media_uploader import MediaUploader
+
+def read_urls(inputs: list):
+    """Video urls of the inputs, text files have one url per line and playlists are expanded"""
+    urls = []
+    for value in inputs:
+        if os.path.isfile(value):
+            with open(value, "r") as url_file:
+                urls.extend(line.strip() for line in url_file if line.strip())
+        else:
+            urls.extend(expand_playlist(value))
+
+    return urls
+
+def run_batch(inputs: list, checkpoint_path: str="batch_checkpoint.jsonl"):
+    """Run batch pipeline for the inputs and print per stage throughput"""
+    api_key = os.environ.get("GEMINI_API_KEY")
+    client = genai.Client(api_key=api_key)
+    pipeline = BatchPipeline(
+        video_analyzer=VideoAnalyzer(client=client, system_instructions=video_analyzer_prompt),
+        imagen_prompter=PromptGenerator(client=client,
+                                        system_instructions=imagen_prompt_generator),
+        image_generator=ImageGenerator(client=client),
+        checkpoint_path=checkpoint_path,
+        media_uploader=MediaUploader(client=client,
+                                     account_id=ArtefactCache.text_hash(api_key or ""))
+    )
+    result = pipeline.run(read_urls(inputs))
+    for job in result["jobs"]:
+        print(f"{job['url']}: {job.get('image_path') or job.get('error')}")
+    print(json.dumps(result["report"], indent=2))
+
+    return result
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    run_batch(sys.argv[1:])
@@ -0,0 +1,276 @@
+"""Batch thumbnail generation for many videos as a pipeline of stages"""
+# pylint: disable=too-many-positional-arguments
+import os
+import json
+import time
+import queue
+import logging
+import threading
+
+from utils.utility import construct_contents, process_video_metadata, clean_title
+from video_processor.processor import extract_video_info, get_video_media
+
+logger = logging.getLogger(__name__)
+
+STAGES = ["metadata", "media", "describe", "prompt", "image"]
+
+# Worker threads of every stage, video processing is network and cpu bound, generation
+# stages mostly wait on the api
+DEFAULT_CONCURRENCY = {"metadata": 4, "media": 2, "describe": 4, "prompt": 4, "image": 2}
+
+# Requests per minute of every model. Free tier gemini limits are per model, so stages
+# calling the same model (describe and prompt) share one limiter
+DEFAULT_RATE_LIMITS = {"gemini-2.0-flash-001": 15,
+                       "gemini-2.0-flash-preview-image-generation": 10}
+# Limit of models that are not in the rate limits
+DEFAULT_MODEL_RATE_LIMIT = 10
+
+# Job fields saved to the checkpoint when a stage completes, metadata is not saved as the
+# info dict is large and its urls expire, a resumed job starts again from metadata
+CHECKPOINT_FIELDS = {
+    "metadata": [],
+    "media": ["title", "video_id", "media_path", "metadata_description"],
+    "describe": ["description"],
+    "prompt": ["prompt"],
+    "image": ["image_path"],
+}
+
+class RateLimiter:
+    """Token bucket limiter shared by the workers of a stage"""
+    def __init__(self, requests_per_minute: float):
+        """Initialize limiter with a budget of requests per minute"""
+        self.interval = 60.0 / requests_per_minute
+        self._next_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until the next request is allowed, returns seconds waited"""
+        with self._lock:
+            now = time.monotonic()
+            wait_time = max(0.0, self._next_time - now)
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait_time:
+            time.sleep(wait_time)
+
+        return wait_time
+
+class BatchPipeline:
+    """Runs metadata -> media -> describe -> prompt -> image for many videos.
+    Every stage has its own worker threads and rate limiter, stages are connected by bounded
+    queues so videos move through stages independently. Completed stages are appended to a
+    jsonl checkpoint, running again with the same checkpoint skips finished work."""
+    def __init__(self, video_analyzer, imagen_prompter, image_generator,
+                 checkpoint_path: str="batch_checkpoint.jsonl", num_snaps: int=5,
+                 snapshot_strategy: str="auto", prompt_model: str="gemini-2.0-flash-001",
+                 image_model: str="", concurrency: dict=None, rate_limits: dict=None,
+                 queue_size: int=4, media_uploader=None):
+        """Initialize pipeline with the generators and per stage limits"""
+        self.video_analyzer = video_analyzer
+        self.imagen_prompter = imagen_prompter
+        self.image_generator = image_generator
+        self.checkpoint_path = checkpoint_path
+        self.num_snaps = num_snaps
+        self.snapshot_strategy = snapshot_strategy
+        self.prompt_model = prompt_model
+        self.image_model = image_model
+        self.concurrency = {**DEFAULT_CONCURRENCY, **(concurrency or {})}
+        # Generation stages and the model they call, video stages are not limited
+        self.stage_models = {
+            "describe": prompt_model,
+            "prompt": prompt_model,
+            "image": image_model or image_generator.model
+        }
+        self.rate_limiters = self._create_rate_limiters({**DEFAULT_RATE_LIMITS,
+                                                         **(rate_limits or {})})
+        self.queue_size = queue_size
+        self.media_uploader = media_uploader
+        self._checkpoint_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {}
+
+    def _create_rate_limiters(self, rate_limits: dict):
+        """Rate limiter of every stage, one limiter per model shared by its stages"""
+        model_limiters = {}
+        for model in set(self.stage_models.values()):
+            rate = rate_limits.get(model, DEFAULT_MODEL_RATE_LIMIT)
+            model_limiters[model] = RateLimiter(rate) if rate else None
+
+        return {stage: model_limiters.get(self.stage_models.get(stage)) for stage in STAGES}
+
+    def load_checkpoint(self):
+        """Completed stages and their outputs of every url from the checkpoint"""
+        completed = {}
+        if not os.path.exists(self.checkpoint_path):
+            return completed
+        with open(self.checkpoint_path, "r") as checkpoint_file:
+            for line in checkpoint_file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Last line can be partial if the run crashed while writing it
+                    continue
+                job = completed.setdefault(record["url"], {"url": record["url"], "stages": []})
+                job["stages"].append(record["stage"])
+                job.update(record["output"])
+
+        return completed
+
+    def _save_checkpoint(self, job: dict, stage: str):
+        """Append completed stage and its outputs to the checkpoint"""
+        record = {"url": job["url"], "stage": stage,
+                  "output": {field: job.get(field) for field in CHECKPOINT_FIELDS[stage]}}
+        with self._checkpoint_lock:
+            with open(self.checkpoint_path, "a") as checkpoint_file:
+                checkpoint_file.write(json.dumps(record) + "\n")
+
+    def _resume_stage(self, job: dict):
+        """Index of the stage the job continues from, len(STAGES) if it is done"""
+        # Stages after metadata are resumable, they only need saved outputs
+        for index in range(len(STAGES) - 1, 0, -1):
+            if STAGES[index] in job["stages"]:
+                return index + 1
+
+        return 0
+
+    def _stage_metadata(self, job: dict):
+        """Extract video metadata"""
+        job["info_dict"] = extract_video_info(job["url"])
+        job["title"] = clean_title(job["info_dict"].get("title", "video"))
+        job["video_id"] = job["info_dict"].get("id")
+
+    def _stage_media(self, job: dict):
+        """Download short video or take snapshots, and fetch subtitles"""
+        info_dict, media_path = get_video_media(job.pop("info_dict"), num_snaps=self.num_snaps,
+                                                snapshot_strategy=self.snapshot_strategy)
+        if not media_path:
+            raise ValueError("Video is too long or has no duration")
+        job["media_path"] = media_path
+        job["metadata_description"] = process_video_metadata(info_dict)
+
+    def _stage_describe(self, job: dict):
+        """Generate video description"""
+        contents = construct_contents({}, job["media_path"], job["metadata_description"],
+                                      self.media_uploader)
+        description, status = self.video_analyzer.get_gemini_response(contents,
+                                                                      self.prompt_model)
+        if not description:
+            raise ValueError(status)
+        job["description"] = description
+
+    def _stage_prompt(self, job: dict):
+        """Generate image prompt from the description"""
+        prompt, status = self.imagen_prompter.get_imagen_prompt(job["description"],
+                                                                self.prompt_model)
+        if not prompt:
+            raise ValueError(status)
+        job["prompt"] = prompt
+
+    def _stage_image(self, job: dict):
+        """Generate thumbnail from the prompt"""
+        # Titles repeat and non ascii titles are cleaned to nothing, video id keeps names unique
+        image_name = "_".join(name for name in (job["title"], job.get("video_id")) if name)
+        image_path = self.image_generator.generate_image(job["prompt"], image_name,
+                                                         self.image_model)
+        if not image_path:
+            raise ValueError("No image in the response")
+        job["image_path"] = image_path
+
+    def _record(self, stage: str, seconds: float, wait_seconds: float, failed: bool):
+        """Record a processed job of the stage, rate limit wait is not counted as work"""
+        with self._stats_lock:
+            stats = self._stats.setdefault(stage, {"processed": 0, "failed": 0,
+                                                   "busy_seconds": 0.0, "wait_seconds": 0.0})
+            stats["failed" if failed else "processed"] += 1
+            stats["busy_seconds"] += seconds
+            stats["wait_seconds"] += wait_seconds
+
+    def _run_worker(self, stage_index: int, queues: list, done_jobs: list):
+        """Take jobs of the stage until a stop marker, pass them on to the next stage"""
+        stage = STAGES[stage_index]
+        stage_method = getattr(self, f"_stage_{stage}")
+        while True:
+            job = queues[stage_index].get()
+            if job is None:
+                return
+            wait_seconds = 0.0
+            if self.rate_limiters[stage]:
+                wait_seconds = self.rate_limiters[stage].acquire()
+            start_time = time.perf_counter()
+            try:
+                stage_method(job)
+            except Exception as e:
+                logger.error(f"{stage} failed for {job['url']}: {e}")
+                job["error"] = f"{stage}: {e}"
+                job.pop("info_dict", None)
+                self._record(stage, time.perf_counter() - start_time, wait_seconds, failed=True)
+                done_jobs.append(job)
+                continue
+            self._record(stage, time.perf_counter() - start_time, wait_seconds, failed=False)
+            job["stages"].append(stage)
+            self._save_checkpoint(job, stage)
+            if stage_index + 1 < len(STAGES):
+                queues[stage_index + 1].put(job)
+            else:
+                done_jobs.append(job)
+
+    def run(self, urls: list):
+        """Generate thumbnails of all urls, returns the jobs and a per stage report"""
+        self._stats = {}
+        completed = self.load_checkpoint()
+        # First stage gets all new urls up front, queues between stages are bounded
+        queues = [queue.Queue()] + [queue.Queue(maxsize=self.queue_size)
+                                    for _ in STAGES[1:]]
+        done_jobs = []
+        workers = []
+        for stage_index, stage in enumerate(STAGES):
+            stage_workers = [threading.Thread(target=self._run_worker,
+                                              args=(stage_index, queues, done_jobs),
+                                              daemon=True)
+                             for _ in range(self.concurrency[stage])]
+            for worker in stage_workers:
+                worker.start()
+            workers.append(stage_workers)
+
+        start_time = time.time()
+        for url in dict.fromkeys(urls):
+            job = completed.get(url, {"url": url, "stages": []})
+            stage_index = self._resume_stage(job)
+            if stage_index == len(STAGES):
+                done_jobs.append(job)
+                continue
+            if stage_index == 0:
+                job = {"url": url, "stages": []}
+            queues[stage_index].put(job)
+
+        # Stop markers go down stage by stage, after all jobs of the previous stage
+        for stage_index, stage_workers in enumerate(workers):
+            for _ in stage_workers:
+                queues[stage_index].put(None)
+            for worker in stage_workers:
+                worker.join()
+        elapsed = time.time() - start_time
+
+        return {"jobs": done_jobs, "report": self.report(done_jobs, elapsed)}
+
+    def report(self, done_jobs: list, elapsed: float):
+        """Throughput, busy time and rate limit wait of every stage"""
+        stages = {}
+        for stage in STAGES:
+            stats = self._stats.get(stage, {"processed": 0, "failed": 0, "busy_seconds": 0.0,
+                                            "wait_seconds": 0.0})
+            handled = stats["processed"] + stats["failed"]
+            stages[stage] = {
+                **stats,
+                "busy_seconds": round(stats["busy_seconds"], 2),
+                "wait_seconds": round(stats["wait_seconds"], 2),
+                "mean_seconds": round(stats["busy_seconds"] / handled, 3) if handled else 0.0,
+                "per_minute": round(stats["processed"] * 60 / elapsed, 2) if elapsed else 0.0
+            }
+
+        return {
+            "videos": len(done_jobs),
+            "completed": sum(1 for job in done_jobs if "error" not in job),
+            "failed": sum(1 for job in done_jobs if "error" in job),
+            "elapsed_seconds": round(elapsed, 2),
+            "stages": stages
+        }
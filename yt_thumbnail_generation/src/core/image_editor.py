@@ -1,10 +1,9 @@
 """Image Editing Module"""
 
 import mimetypes
-from utils.utility import history_to_contents, save_binary_file
+from utils.utility import history_to_contents, save_binary_file, handle_genai_errors
 from google.genai import types
 from google.genai.client import Client as geminiClient
-from google.genai.errors import ClientError, ServerError
 
 class ImageEditor():
     """Image editor class"""
@@ -16,26 +15,33 @@ class ImageEditor():
         self.model = image_model
         self.system_instructions = system_instructions #To be used
 
+    @staticmethod
+    def get_config():
+        """Generation config of image editing requests"""
+        return types.GenerateContentConfig(
+            response_modalities=["IMAGE","TEXT"],
+            response_mime_type="text/plain",
+        )
+
+    @handle_genai_errors
     def chat_session(self, message, history: list):
         """Chat session to edit messages"""
-        try:
-            response = self.client.models.generate_content(
-                model=self.model,
-                config = types.GenerateContentConfig(
-                    response_modalities=["IMAGE","TEXT"],
-                    response_mime_type="text/plain",
-                ),
-                contents=history_to_contents(message, history)
-            )
-            return response, None
-        except ClientError as e:
-            # Invalid api key or client side error
-            return None, str(e)
-        except ServerError as e:
-            # Server side error
-            return None, str(e)
-        except Exception as e:
-            return None, str(e)
+        response = self.client.models.generate_content(
+            model=self.model,
+            config=self.get_config(),
+            contents=history_to_contents(message, history)
+        )
+        return response, None
+
+    @handle_genai_errors
+    async def chat_session_async(self, message, history: list):
+        """Async version of chat_session, uses the client.aio event loop client"""
+        response = await self.client.aio.models.generate_content(
+            model=self.model,
+            config=self.get_config(),
+            contents=history_to_contents(message, history)
+        )
+        return response, None
 
     def serialize_response(self, response, image_name: str, version: str):
         """Converts llm response to savable format"""
@@ -13,6 +13,56 @@ class ImageGenerator():
         self.client = client
         self.model = image_model
 
+    @staticmethod
+    def get_gemini_config():
+        """Generation config of gemini image requests"""
+        return types.GenerateContentConfig(
+            response_modalities=["IMAGE","TEXT"],
+            response_mime_type="text/plain",
+        )
+
+    @staticmethod
+    def get_imagen_config():
+        """Generation config of imagen requests"""
+        return types.GenerateImagesConfig(
+            number_of_images= 1, # Let's keep only one for now, works with current UI
+            aspect_ratio="16:9", # youtube thumbnail usually landscape
+            output_mime_type="image/png" # should be configurable from UI
+        )
+
+    @staticmethod
+    def save_gemini_image(response, image_name: str):
+        """Save first image of a gemini response, returns saved path or None"""
+        if (response.candidates is None
+            or response.candidates[0].content is None
+            or response.candidates[0].content.parts is None):
+            return None
+
+        response_parts = response.candidates[0].content.parts
+
+        for part in response_parts:
+            if part.inline_data and part.inline_data.data:
+                image_data = part.inline_data.data
+                file_extension = mimetypes.guess_extension(part.inline_data.mime_type)
+                file_name = f"{clean_title(image_name.lower())}{file_extension}"
+                saved_path = save_binary_file(file_name, image_data)
+
+                return saved_path
+
+        return None
+
+    @staticmethod
+    def save_imagen_image(response, image_name: str):
+        """Save first image of an imagen response, returns saved path or None"""
+        for generated_image in response.generated_images or []:
+            image_data = generated_image.image.image_bytes
+            file_name = f"{clean_title(image_name.lower())}.png"
+            saved_path = save_binary_file(file_name, image_data)
+
+            return saved_path
+
+        return None
+
     def generate_image(self, prompt: str, image_name: str, model_key: str=""):
         """Generates image using given prompt and save as image_name"""
         model_code = self.model
@@ -21,47 +71,42 @@ class ImageGenerator():
         if "gemini" in model_code:
             response = self.client.models.generate_content(
                 model=model_code,
-                config = types.GenerateContentConfig(
-                    response_modalities=["IMAGE","TEXT"],
-                    response_mime_type="text/plain",
-                ),
+                config=self.get_gemini_config(),
                 contents=[prompt]
             )
 
-            if (response.candidates is None
-                or response.candidates[0].content is None
-                or response.candidates[0].content.parts is None):
-                return None
-
-            response_parts = response.candidates[0].content.parts
+            return self.save_gemini_image(response, image_name)
+        if "imagen" in model_code:
+            response = self.client.models.generate_images(
+                model=model_code,
+                prompt=prompt,
+                config=self.get_imagen_config()
+            )
 
-            for part in response_parts:
-                if part.inline_data and part.inline_data.data:
-                    image_data = part.inline_data.data
-                    file_extension = mimetypes.guess_extension(part.inline_data.mime_type)
-                    file_name = f"{clean_title(image_name.lower())}{file_extension}"
-                    saved_path = save_binary_file(file_name, image_data)
+            return self.save_imagen_image(response, image_name)
+        print("Support to be added for other models")
+        return None
 
-                    return saved_path
+    async def generate_image_async(self, prompt: str, image_name: str, model_key: str=""):
+        """Async version of generate_image, uses the client.aio event loop client"""
+        model_code = self.model
+        if model_key:
+            model_code = model_key
+        if "gemini" in model_code:
+            response = await self.client.aio.models.generate_content(
+                model=model_code,
+                config=self.get_gemini_config(),
+                contents=[prompt]
+            )
 
-            return None
+            return self.save_gemini_image(response, image_name)
         if "imagen" in model_code:
-            response = self.client.models.generate_images(
+            response = await self.client.aio.models.generate_images(
                 model=model_code,
                 prompt=prompt,
-                config=types.GenerateImagesConfig(
-                    number_of_images= 1, # Let's keep only one for now, works with current UI
-                    aspect_ratio="16:9", # youtube thumbnail usually landscape
-                    output_mime_type="image/png" # should be configurable from UI
-                )
+                config=self.get_imagen_config()
             )
 
-            for generated_image in response.generated_images:
-                image_data = generated_image.image.image_bytes
-                file_extension = generated_image.image.mime_type.split("/")[-1]
-                file_name = f"{clean_title(image_name.lower())}.png"
-                saved_path = save_binary_file(file_name, image_data)
-
-                return saved_path
+            return self.save_imagen_image(response, image_name)
         print("Support to be added for other models")
         return None
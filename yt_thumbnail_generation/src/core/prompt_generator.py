@@ -1,7 +1,7 @@
 """Prompt generator for image generation"""
 from google.genai import types
 from google.genai.client import Client as geminiClient
-from google.genai.errors import ClientError, ServerError
+from utils.utility import handle_genai_errors
 
 class PromptGenerator():
     """Prompt generator class"""
@@ -13,30 +13,46 @@ class PromptGenerator():
         self.system_instructions = system_instructions
         self.model = model
 
+    def get_config(self):
+        """Generation config of image prompt requests"""
+        return types.GenerateContentConfig(
+            system_instruction=self.system_instructions,
+            temperature=0.1,
+            max_output_tokens=512
+        )
+
+    @staticmethod
+    def get_contents(video_description: str):
+        """Request contents of the video description"""
+        return ["Video Description:",
+                video_description,
+                "\nVisual Design Description:"]
+
+    @handle_genai_errors
     def get_imagen_prompt(self, video_description: str, model_key: str = "gemini-2.0-flash-001"):
         """Generates prompt for image generation using video description"""
-        try:
-            model_code = self.model
-            if model_key:
-                model_code = model_key
-            response = self.client.models.generate_content(
-                model=model_code,
-                config=types.GenerateContentConfig(
-                    system_instruction=self.system_instructions,
-                    temperature=0.1,
-                    max_output_tokens=512
-                ),
-                contents=["Video Description:",
-                        video_description,
-                        "\nVisual Design Description:"],
-            )
+        model_code = self.model
+        if model_key:
+            model_code = model_key
+        response = self.client.models.generate_content(
+            model=model_code,
+            config=self.get_config(),
+            contents=self.get_contents(video_description),
+        )
+
+        return response.text, None
+
+    @handle_genai_errors
+    async def get_imagen_prompt_async(self, video_description: str,
+                                      model_key: str = "gemini-2.0-flash-001"):
+        """Async version of get_imagen_prompt, uses the client.aio event loop client"""
+        model_code = self.model
+        if model_key:
+            model_code = model_key
+        response = await self.client.aio.models.generate_content(
+            model=model_code,
+            config=self.get_config(),
+            contents=self.get_contents(video_description),
+        )
 
-            return response.text, None
-        except ClientError as e:
-            # Invalid api key or client side error
-            return None, str(e)
-        except ServerError as e:
-            # Server side error
-            return None, str(e)
-        except Exception as e:
-            return None, str(e)
+        return response.text, None
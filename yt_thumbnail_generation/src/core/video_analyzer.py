@@ -1,7 +1,7 @@
 """Video description generator module"""
 from google.genai import types
 from google.genai.client import Client as geminiClient
-from google.genai.errors import ClientError, ServerError
+from utils.utility import handle_genai_errors
 
 class VideoAnalyzer():
     """Video Analyzer class"""
@@ -13,28 +13,39 @@ class VideoAnalyzer():
         self.system_instructions = system_instructions
         self.model = model
 
+    def get_config(self):
+        """Generation config of video description requests"""
+        return types.GenerateContentConfig(
+            system_instruction=self.system_instructions,
+            temperature=0.1,
+            max_output_tokens=512
+        )
+
+    @handle_genai_errors
     def get_gemini_response(self, contents: list, model_key: str = "gemini-2.0-flash-001"):
         """Generates video description based on input contents"""
-        try:
-            model_code = self.model
-            if model_key:
-                model_code = model_key
-            response = self.client.models.generate_content(
-                model=model_code,
-                config=types.GenerateContentConfig(
-                    system_instruction=self.system_instructions,
-                    temperature=0.1,
-                    max_output_tokens=512
-                ),
-                contents=contents,
-            )
+        model_code = self.model
+        if model_key:
+            model_code = model_key
+        response = self.client.models.generate_content(
+            model=model_code,
+            config=self.get_config(),
+            contents=contents,
+        )
+
+        return response.text, None
+
+    @handle_genai_errors
+    async def get_gemini_response_async(self, contents: list,
+                                        model_key: str = "gemini-2.0-flash-001"):
+        """Async version of get_gemini_response, uses the client.aio event loop client"""
+        model_code = self.model
+        if model_key:
+            model_code = model_key
+        response = await self.client.aio.models.generate_content(
+            model=model_code,
+            config=self.get_config(),
+            contents=contents,
+        )
 
-            return response.text, None
-        except ClientError as e:
-            # Invalid api key or client side error
-            return None, str(e)
-        except ServerError as e:
-            # Server side error
-            return None, str(e)
-        except Exception as e:
-            return None, str(e)
+        return response.text, None
@@ -0,0 +1,85 @@
+"""Local mock of the gemini generateContent and imagen predict endpoints"""
+import json
+import time
+import base64
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from google import genai
+from google.genai import types
+
+MOCK_IMAGE = b"\x89PNG\r\n\x1a\nmock image"
+
+class MockGenaiHandler(BaseHTTPRequestHandler):
+    """Answers generate requests, models with "error" in the name fail with a client error
+    and models with "unavailable" in the name fail with a server error"""
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        """Keep test output clean"""
+
+    def send_json(self, status: int, body: dict):
+        """Send json response"""
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self): # pylint: disable=invalid-name
+        """Handle models/{model}:generateContent and models/{model}:predict"""
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        model, method = self.path.split("/models/")[-1].split(":")
+        self.server.requests.append({"model": model, "method": method, "body": request})
+        time.sleep(self.server.delay)
+
+        if "error" in model:
+            self.send_json(400, {"error": {"code": 400, "message": "Invalid model",
+                                           "status": "INVALID_ARGUMENT"}})
+        elif "unavailable" in model:
+            self.send_json(503, {"error": {"code": 503, "message": "Model is overloaded",
+                                           "status": "UNAVAILABLE"}})
+        elif method == "predict":
+            self.send_json(200, {"predictions": [{
+                "bytesBase64Encoded": base64.b64encode(MOCK_IMAGE).decode("utf-8"),
+                "mimeType": "image/png"
+            }]})
+        elif "image" in model:
+            self.send_json(200, {"candidates": [{"content": {"role": "model", "parts": [
+                {"text": "Edited image"},
+                {"inlineData": {"mimeType": "image/png",
+                                "data": base64.b64encode(MOCK_IMAGE).decode("utf-8")}}
+            ]}}]})
+        else:
+            last_text = request["contents"][-1]["parts"][-1].get("text", "")
+            self.send_json(200, {"candidates": [{"content": {"role": "model", "parts": [
+                {"text": f"{model} response to {last_text}"}
+            ]}}]})
+
+class MockGenaiServer:
+    """Mock genai api on a local port, every request waits `delay` seconds"""
+    def __init__(self, delay: float=0.0):
+        """Initialize server on a free port"""
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), MockGenaiHandler)
+        self.server.delay = delay
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def requests(self):
+        """Requests received by the server"""
+        return self.server.requests
+
+    def start(self):
+        """Start serving in a background thread"""
+        self.thread.start()
+
+    def stop(self):
+        """Stop serving"""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_client(self):
+        """genai client sending requests to the mock server"""
+        base_url = f"http://127.0.0.1:{self.server.server_port}"
+        return genai.Client(api_key="mock-api-key",
+                            http_options=types.HttpOptions(base_url=base_url))
@@ -0,0 +1,61 @@
+"""Tests of the artefact cache eviction and pinning"""
+import os
+import time
+
+from utils.artefact_cache import ArtefactCache
+
+def create_snapshots(folder, name: str, size: int=400 * 1024):
+    """Snapshot files of a processed video"""
+    os.makedirs(folder, exist_ok=True)
+    snapshot_path = os.path.join(folder, f"{name}.png")
+    with open(snapshot_path, "wb") as snapshot_file:
+        snapshot_file.write(os.urandom(size))
+    return [snapshot_path]
+
+def put_videos(cache, tmp_path, keys: list):
+    """Cache a video of every key, oldest first"""
+    for key in keys:
+        cache.put_video(key, {"title": key}, create_snapshots(tmp_path / "new" / key, key))
+        time.sleep(0.01)
+
+def test_least_recently_used_is_evicted(tmp_path):
+    """Cache over its size drops the least recently used entry"""
+    cache = ArtefactCache(cache_dir=str(tmp_path / "cache"), max_size_mb=1.0)
+    put_videos(cache, tmp_path, ["video_a", "video_b"])
+    cache.get_video("video_a")
+    put_videos(cache, tmp_path, ["video_c"])
+
+    assert cache.get_video("video_b") == (None, None)
+    assert cache.get_video("video_a")[0] == {"title": "video_a"}
+    assert cache.get_video("video_c")[0] == {"title": "video_c"}
+
+def test_pinned_entry_is_not_evicted(tmp_path):
+    """Media of a video a session is working with stays cached"""
+    cache = ArtefactCache(cache_dir=str(tmp_path / "cache"), max_size_mb=1.0)
+    put_videos(cache, tmp_path, ["video_a", "video_b"])
+    cache.pin("session_1", "video_a")
+    put_videos(cache, tmp_path, ["video_c"])
+
+    _, media_path = cache.get_video("video_a")
+    assert os.path.exists(media_path[0])
+    assert cache.get_video("video_b") == (None, None)
+
+def test_expired_pin_is_evicted(tmp_path):
+    """Pins of closed sessions stop protecting entries after the pin time"""
+    cache = ArtefactCache(cache_dir=str(tmp_path / "cache"), max_size_mb=1.0, pin_seconds=0.05)
+    put_videos(cache, tmp_path, ["video_a", "video_b"])
+    cache.pin("session_1", "video_a")
+    time.sleep(0.1)
+    put_videos(cache, tmp_path, ["video_c"])
+
+    assert cache.get_video("video_a") == (None, None)
+
+def test_texts_are_kept_with_the_video(tmp_path):
+    """Descriptions are cached per entry and missing entries return None"""
+    cache = ArtefactCache(cache_dir=str(tmp_path / "cache"))
+    put_videos(cache, tmp_path, ["video_a"])
+    cache.put_text("video_a", "description_gemini", "A cooking video")
+
+    assert cache.get_text("video_a", "description_gemini") == "A cooking video"
+    assert cache.get_text("video_b", "description_gemini") is None
+    assert cache.get_text(None, "description_gemini") is None
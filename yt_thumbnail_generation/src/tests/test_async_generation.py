@@ -0,0 +1,114 @@
+"""Tests of the async generation methods against the local genai api mock"""
+import time
+import asyncio
+import pytest
+from google.genai.errors import ClientError
+
+from core.video_analyzer import VideoAnalyzer
+from core.prompt_generator import PromptGenerator
+from core.image_generator import ImageGenerator
+from core.image_editor import ImageEditor
+from tests.mock_genai import MockGenaiServer, MOCK_IMAGE
+
+@pytest.fixture(name="mock_server")
+def fixture_mock_server():
+    """Mock api answering every request after 0.2 seconds"""
+    server = MockGenaiServer(delay=0.2)
+    server.start()
+    yield server
+    server.stop()
+
+@pytest.fixture(autouse=True)
+def fixture_work_dir(tmp_path, monkeypatch):
+    """Generated images are saved in a temp folder"""
+    monkeypatch.chdir(tmp_path)
+
+def test_video_analyzer_async(mock_server):
+    """Async description has the same result and error tuples as the sync one"""
+    video_analyzer = VideoAnalyzer(mock_server.get_client(), "Describe the video")
+
+    description, error = asyncio.run(video_analyzer.get_gemini_response_async(["Snapshots"]))
+    sync_description, _ = video_analyzer.get_gemini_response(["Snapshots"])
+    assert (description, error) == ("gemini-2.0-flash-001 response to Snapshots", None)
+    assert description == sync_description
+    request = mock_server.requests[0]["body"]
+    assert request["systemInstruction"]["parts"][0]["text"] == "Describe the video"
+    assert request["generationConfig"]["maxOutputTokens"] == 512
+
+    description, error = asyncio.run(
+        video_analyzer.get_gemini_response_async(["Snapshots"], "model-error"))
+    assert description is None
+    assert "400 INVALID_ARGUMENT" in error
+
+    description, error = asyncio.run(
+        video_analyzer.get_gemini_response_async(["Snapshots"], "model-unavailable"))
+    assert description is None
+    assert "503 UNAVAILABLE" in error
+
+def test_prompt_generator_async(mock_server):
+    """Async prompt sends the description like the sync one"""
+    prompt_generator = PromptGenerator(mock_server.get_client(), "Write an image prompt")
+
+    prompt, error = asyncio.run(prompt_generator.get_imagen_prompt_async("A cooking video"))
+    assert error is None
+    assert prompt.endswith("Visual Design Description:")
+    parts = mock_server.requests[0]["body"]["contents"][0]["parts"]
+    assert [part["text"] for part in parts][:2] == ["Video Description:", "A cooking video"]
+
+    prompt, error = asyncio.run(
+        prompt_generator.get_imagen_prompt_async("A cooking video", "model-error"))
+    assert prompt is None
+    assert "Invalid model" in error
+
+def test_image_generator_async(mock_server):
+    """Gemini and imagen images are saved like with the sync method"""
+    image_generator = ImageGenerator(mock_server.get_client())
+
+    image_path = asyncio.run(image_generator.generate_image_async("prompt", "Cooking Video"))
+    with open(image_path, "rb") as image_file:
+        assert image_file.read() == MOCK_IMAGE
+    assert image_path == "thumbnails/cooking_video.png"
+
+    image_path = asyncio.run(image_generator.generate_image_async(
+        "prompt", "Imagen Video", "imagen-3.0-generate-002"))
+    assert image_path == "thumbnails/imagen_video.png"
+    assert mock_server.requests[-1]["method"] == "predict"
+
+    assert asyncio.run(image_generator.generate_image_async("prompt", "Video", "other")) is None
+    # Image generation raises errors like the sync method
+    with pytest.raises(ClientError):
+        asyncio.run(image_generator.generate_image_async("prompt", "Video", "gemini-error"))
+
+def test_image_editor_async(mock_server):
+    """Async chat session returns the response for serialize_response"""
+    image_editor = ImageEditor(mock_server.get_client())
+    history = [{"role": "user", "content": {"text": "Make a thumbnail"}},
+               {"role": "model", "content": {"text": "Here it is"}}]
+
+    response, error = asyncio.run(image_editor.chat_session_async("Make it blue", history))
+    assert error is None
+    text, media_path = image_editor.serialize_response(response, "video", "1")
+    assert text == "Edited image"
+    assert media_path == "thumbnails/video_edit1.png"
+    assert len(mock_server.requests[0]["body"]["contents"]) == 3
+
+    image_editor.model = "gemini-error"
+    response, error = asyncio.run(image_editor.chat_session_async("Make it blue", history))
+    assert response is None
+    assert "400 INVALID_ARGUMENT" in error
+
+def test_async_requests_run_concurrently(mock_server):
+    """Many generations are in flight at once on one event loop"""
+    video_analyzer = VideoAnalyzer(mock_server.get_client(), "Describe the video")
+
+    async def generate_all():
+        return await asyncio.gather(*[
+            video_analyzer.get_gemini_response_async([f"Video {index}"]) for index in range(10)
+        ])
+
+    start_time = time.perf_counter()
+    responses = asyncio.run(generate_all())
+
+    assert time.perf_counter() - start_time < 1.0
+    assert [error for _, error in responses] == [None] * 10
+    assert len(mock_server.requests) == 10
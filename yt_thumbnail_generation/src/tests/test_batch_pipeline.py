@@ -0,0 +1,157 @@
+"""Tests of the batch pipeline with fake video processing and generators"""
+import json
+import time
+import pytest
+
+from core import batch_pipeline
+from core.batch_pipeline import BatchPipeline, STAGES
+
+class FakeAnalyzer:
+    """Video analyzer returning a fixed description"""
+    def __init__(self):
+        self.calls = []
+
+    def get_gemini_response(self, contents, model_key):
+        """Record the call and describe the video"""
+        self.calls.append(contents)
+        return "description", None
+
+class FakePrompter:
+    """Prompt generator returning a fixed prompt"""
+    def __init__(self):
+        self.calls = []
+
+    def get_imagen_prompt(self, video_description, model_key):
+        """Record the call and return a prompt"""
+        self.calls.append(video_description)
+        return "prompt", None
+
+class FakeImageGenerator:
+    """Image generator failing for the titles in `fail_titles`"""
+    def __init__(self, fail_titles=()):
+        self.model = "fake-image-model"
+        self.fail_titles = set(fail_titles)
+        self.calls = []
+
+    def generate_image(self, prompt, image_name, model_key):
+        """Record the call and return an image path"""
+        self.calls.append(image_name)
+        if image_name in self.fail_titles:
+            return None
+        return f"thumbnails/{image_name}.png"
+
+@pytest.fixture(name="video_calls")
+def fixture_video_calls(monkeypatch):
+    """Patch video processing of the pipeline, returns the processed urls of every stage.
+    Videos are titled by their url unless they are in `titles`"""
+    video_calls = {"metadata": [], "media": [], "titles": {}}
+
+    def extract_video_info(url):
+        video_calls["metadata"].append(url)
+        if "private" in url:
+            raise ValueError("Private video")
+        return {"id": url, "title": video_calls["titles"].get(url, url)}
+
+    def get_video_media(info_dict, **kwargs):
+        video_calls["media"].append(info_dict["id"])
+        return info_dict, [f"snapshots/{info_dict['id']}/snapshot_1.png"]
+
+    monkeypatch.setattr(batch_pipeline, "extract_video_info", extract_video_info)
+    monkeypatch.setattr(batch_pipeline, "get_video_media", get_video_media)
+    monkeypatch.setattr(batch_pipeline, "process_video_metadata", lambda info_dict: "metadata")
+    monkeypatch.setattr(batch_pipeline, "construct_contents", lambda *args: ["contents"])
+
+    return video_calls
+
+def create_pipeline(checkpoint_path, image_generator, **kwargs):
+    """Pipeline with fake generators and no rate limits"""
+    rate_limits = {"gemini-2.0-flash-001": None, "fake-image-model": None}
+    return BatchPipeline(FakeAnalyzer(), FakePrompter(), image_generator,
+                         checkpoint_path=str(checkpoint_path), rate_limits=rate_limits,
+                         **kwargs)
+
+def test_run_generates_all_videos(tmp_path, video_calls):
+    """Every stage runs once per video and failures are reported"""
+    urls = ["video_a", "video_b", "private_video", "video_a"]
+    result = create_pipeline(tmp_path / "checkpoint.jsonl", FakeImageGenerator()).run(urls)
+
+    jobs = {job["url"]: job for job in result["jobs"]}
+    assert jobs["video_a"]["image_path"] == "thumbnails/video_a_video_a.png"
+    assert jobs["video_b"]["stages"] == STAGES
+    assert jobs["private_video"]["error"].startswith("metadata")
+    assert sorted(video_calls["media"]) == ["video_a", "video_b"]
+    assert result["report"]["completed"] == 2
+    assert result["report"]["failed"] == 1
+    assert result["report"]["stages"]["metadata"]["failed"] == 1
+
+def test_resume_continues_from_checkpoint(tmp_path, video_calls):
+    """Second run only repeats the failed stage, finished stages are loaded"""
+    checkpoint_path = tmp_path / "checkpoint.jsonl"
+    first_run = create_pipeline(checkpoint_path,
+                                FakeImageGenerator(fail_titles={"video_b_video_b"}))
+    first_result = first_run.run(["video_a", "video_b"])
+    assert first_result["report"]["failed"] == 1
+
+    image_generator = FakeImageGenerator()
+    second_run = create_pipeline(checkpoint_path, image_generator)
+    second_result = second_run.run(["video_a", "video_b"])
+
+    jobs = {job["url"]: job for job in second_result["jobs"]}
+    assert image_generator.calls == ["video_b_video_b"]
+    assert second_run.video_analyzer.calls == []
+    assert second_run.imagen_prompter.calls == []
+    assert sorted(video_calls["metadata"]) == ["video_a", "video_b"]
+    assert jobs["video_a"]["image_path"] == "thumbnails/video_a_video_a.png"
+    assert jobs["video_b"]["image_path"] == "thumbnails/video_b_video_b.png"
+    assert second_result["report"]["completed"] == 2
+
+def test_resume_ignores_partial_checkpoint_line(tmp_path, video_calls):
+    """Line cut off by a crash is skipped, the stage runs again"""
+    checkpoint_path = tmp_path / "checkpoint.jsonl"
+    record = {"url": "video_a", "stage": "media",
+              "output": {"title": "video_a", "video_id": "video_a",
+                         "media_path": ["snapshot_1.png"],
+                         "metadata_description": "metadata"}}
+    checkpoint_path.write_text(json.dumps(record) + "\n" + '{"url": "video_a", "sta')
+
+    result = create_pipeline(checkpoint_path, FakeImageGenerator()).run(["video_a"])
+
+    assert video_calls["metadata"] == []
+    assert result["jobs"][0]["image_path"] == "thumbnails/video_a_video_a.png"
+
+def test_thumbnails_of_same_titles_do_not_collide(tmp_path, video_calls):
+    """Thumbnails are named with the video id, also when the title is cleaned to nothing"""
+    video_calls["titles"].update({"video_a": "Cooking 101", "video_b": "Cooking 101",
+                                  "video_c": "料理の基本", "video_d": "料理の基本"})
+    result = create_pipeline(tmp_path / "checkpoint.jsonl", FakeImageGenerator()).run(
+        ["video_a", "video_b", "video_c", "video_d"])
+
+    assert sorted(job["image_path"] for job in result["jobs"]) == [
+        "thumbnails/Cooking_101_video_a.png", "thumbnails/Cooking_101_video_b.png",
+        "thumbnails/video_c.png", "thumbnails/video_d.png"]
+
+def test_stages_of_one_model_share_rate_limiter(tmp_path):
+    """Describe and prompt call the same model so they share its requests per minute"""
+    pipeline = BatchPipeline(FakeAnalyzer(), FakePrompter(), FakeImageGenerator(),
+                             checkpoint_path=str(tmp_path / "checkpoint.jsonl"))
+
+    assert pipeline.rate_limiters["describe"] is pipeline.rate_limiters["prompt"]
+    assert pipeline.rate_limiters["image"] is not pipeline.rate_limiters["prompt"]
+    assert pipeline.rate_limiters["metadata"] is None
+
+def test_report_separates_rate_limit_wait(tmp_path, video_calls):
+    """Time waiting on the rate limiter is not counted as stage work"""
+    pipeline = BatchPipeline(FakeAnalyzer(), FakePrompter(), FakeImageGenerator(),
+                             checkpoint_path=str(tmp_path / "checkpoint.jsonl"),
+                             rate_limits={"gemini-2.0-flash-001": 600,
+                                          "fake-image-model": None})
+    start_time = time.perf_counter()
+    result = pipeline.run(["video_a", "video_b", "video_c"])
+
+    describe = result["report"]["stages"]["describe"]
+    prompt = result["report"]["stages"]["prompt"]
+    # 6 requests at 10 per second on the shared limiter
+    assert time.perf_counter() - start_time >= 0.45
+    assert describe["wait_seconds"] + prompt["wait_seconds"] > 0.2
+    assert describe["busy_seconds"] < 0.1
+    assert len(video_calls["media"]) == 3
@@ -0,0 +1,57 @@
+"""Tests of content aware frame selection with synthetic frame features"""
+import numpy as np
+
+from video_processor.frame_selector import ContentFrameSelector, histogram_distance
+
+def create_features(shots: list, brightness: list=None, sharpness: list=None):
+    """Features of frames showing the given shot ids, every shot has its own colour bin"""
+    histograms = np.zeros((len(shots), 64))
+    histograms[np.arange(len(shots)), shots] = 1.0
+    scene_change = np.zeros(len(shots))
+    scene_change[1:] = histogram_distance(histograms[1:], histograms[:-1])
+    return {
+        "brightness": np.array(brightness or [120.0] * len(shots)),
+        "sharpness": np.array(sharpness or [100.0] * len(shots)),
+        "histograms": histograms,
+        "scene_change": scene_change
+    }
+
+def test_dark_bright_and_transition_frames_are_dropped():
+    """Frames out of the brightness range and frames different from both neighbours"""
+    features = create_features([0, 0, 0, 5, 1, 1, 1],
+                               brightness=[120.0, 10.0, 120.0, 120.0, 120.0, 250.0, 120.0])
+
+    candidates = ContentFrameSelector().get_candidates(features)
+
+    assert np.flatnonzero(~candidates).tolist() == [1, 3, 5]
+
+def test_single_shot_stops_early():
+    """Frames of one repeated shot give a single snapshot"""
+    features = create_features([3] * 20, sharpness=list(range(1, 21)))
+    selector = ContentFrameSelector()
+
+    picked = selector.pick_frames(features, selector.get_candidates(features), num_snapshots=5)
+
+    assert picked == [19]
+
+def test_sharpest_frame_of_distinct_shots_is_picked():
+    """At most num snapshots frames of different shots are returned in video order"""
+    shots = [shot for shot in range(6) for _ in range(3)]
+    sharpness = [50.0] * len(shots)
+    sharpness[4] = 200.0
+    features = create_features(shots, sharpness=sharpness)
+    selector = ContentFrameSelector()
+
+    picked = selector.pick_frames(features, selector.get_candidates(features), num_snapshots=4)
+
+    assert len(picked) == 4
+    assert picked == sorted(picked)
+    assert 4 in picked
+    assert len({shots[frame_id] for frame_id in picked}) == 4
+
+def test_no_candidates_pick_nothing():
+    """Video that is dark throughout has no snapshots"""
+    features = create_features([0, 1, 2], brightness=[5.0, 5.0, 5.0])
+    selector = ContentFrameSelector()
+
+    assert not selector.pick_frames(features, selector.get_candidates(features), num_snapshots=3)
@@ -0,0 +1,41 @@
+"""Tests of the inline media parts reused when chat history is replayed"""
+import os
+
+from utils import utility
+from utils.utility import MediaPartCache, get_media_part, deserialize_parts
+
+def write_image(folder, name: str, num_bytes: int):
+    """Image file of the given size"""
+    image_path = folder / name
+    image_path.write_bytes(os.urandom(num_bytes))
+    return str(image_path)
+
+def test_cache_is_bounded_by_bytes(tmp_path, monkeypatch):
+    """Least recently used parts are evicted when the files are over the limit in total"""
+    monkeypatch.setattr(utility, "media_part_cache", MediaPartCache(max_bytes=2500))
+    image_paths = [write_image(tmp_path, f"edit_{i}.png", 1000) for i in range(3)]
+
+    first_part = get_media_part(image_paths[0], "image/png")
+    get_media_part(image_paths[1], "image/png")
+    assert get_media_part(image_paths[0], "image/png") is first_part
+    get_media_part(image_paths[2], "image/png")
+
+    assert utility.media_part_cache.total_bytes == 2000
+    assert get_media_part(image_paths[0], "image/png") is first_part
+    assert get_media_part(image_paths[1], "image/png").inline_data.data == (
+        tmp_path / "edit_1.png").read_bytes()
+
+def test_file_over_the_limit_is_not_cached(tmp_path, monkeypatch):
+    """Big files are read every time instead of evicting all other parts"""
+    monkeypatch.setattr(utility, "media_part_cache", MediaPartCache(max_bytes=500))
+    image_path = write_image(tmp_path, "edit_0.png", 1000)
+
+    assert len(get_media_part(image_path, "image/png").inline_data.data) == 1000
+    assert utility.media_part_cache.total_bytes == 0
+
+def test_missing_file_has_no_part(tmp_path):
+    """Deleted images are skipped instead of failing the whole history"""
+    message = {"text": "Edit 0", "media": str(tmp_path / "deleted.png")}
+
+    assert get_media_part(message["media"], "image/png") is None
+    assert [part.text for part in deserialize_parts(message)] == ["Edit 0"]
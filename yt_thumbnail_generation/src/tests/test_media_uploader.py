@@ -0,0 +1,119 @@
+"""Tests of the media uploader with a fake Files API"""
+import os
+import json
+import time
+import threading
+from types import SimpleNamespace
+from datetime import datetime, timezone
+import pytest
+from google.genai import types
+
+from utils.media_uploader import MediaUploader
+
+class FakeFiles:
+    """Files API recording uploads, uploaded files are active right away"""
+    def __init__(self, fail: bool=False, expires_in: float=48 * 3600):
+        self.fail = fail
+        self.expires_in = expires_in
+        self.uploads = []
+
+    def get_file(self, name: str, state: str):
+        """Uploaded file of the name"""
+        expiration_time = datetime.fromtimestamp(time.time() + self.expires_in, timezone.utc)
+        return types.File(name=name, uri=f"https://files.test/{name}", state=state,
+                          expiration_time=expiration_time)
+
+    def upload(self, file, config):
+        """Upload the file"""
+        self.uploads.append((file, config.mime_type))
+        time.sleep(0.05)
+        if self.fail:
+            raise RuntimeError("Upload quota exceeded")
+        return self.get_file(f"files/file_{len(self.uploads)}", "ACTIVE")
+
+@pytest.fixture(name="media_files")
+def fixture_media_files(tmp_path):
+    """A 2MB video and a small image"""
+    video_path = tmp_path / "video.mp4"
+    video_path.write_bytes(os.urandom(2 * 1024 * 1024))
+    image_path = tmp_path / "snapshot.png"
+    image_path.write_bytes(b"\x89PNG small image")
+    return str(video_path), str(image_path)
+
+def create_uploader(files, tmp_path, **kwargs):
+    """Uploader with a 1MB inline limit, so the test video is uploaded"""
+    return MediaUploader(SimpleNamespace(files=files), cache_path=str(tmp_path / "uploads.json"),
+                         inline_limit_mb=1.0, **kwargs)
+
+def test_big_file_is_uploaded_once(tmp_path, media_files):
+    """Concurrent requests and new uploaders reuse the cached uri"""
+    files = FakeFiles()
+    uploader = create_uploader(files, tmp_path)
+    parts = []
+    threads = [threading.Thread(target=lambda: parts.append(
+        uploader.get_part(media_files[0], "video/mp4"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert {part.file_data.file_uri for part in parts} == {"https://files.test/files/file_1"}
+    assert create_uploader(files, tmp_path).get_part(
+        media_files[0], "video/mp4").file_data.file_uri == "https://files.test/files/file_1"
+    assert len(files.uploads) == 1
+
+def test_uploads_are_cached_per_account(tmp_path, media_files):
+    """Uploaded files belong to a project, another api key uploads again"""
+    files = FakeFiles()
+    create_uploader(files, tmp_path, account_id="key_1").get_part(media_files[0], "video/mp4")
+    create_uploader(files, tmp_path, account_id="key_2").get_part(media_files[0], "video/mp4")
+
+    assert len(files.uploads) == 2
+
+def test_expiring_upload_is_uploaded_again(tmp_path, media_files):
+    """Uris expiring within the margin are not used"""
+    files = FakeFiles(expires_in=600)
+    uploader = create_uploader(files, tmp_path)
+    uploader.get_part(media_files[0], "video/mp4")
+    uploader.get_part(media_files[0], "video/mp4")
+
+    assert len(files.uploads) == 2
+
+def test_small_file_is_inline(tmp_path, media_files):
+    """Files under the inline limit are sent with the request"""
+    files = FakeFiles()
+    part = create_uploader(files, tmp_path).get_part(media_files[1], "image/png")
+
+    assert part.inline_data.data == b"\x89PNG small image"
+    assert not files.uploads
+
+def test_failed_upload_of_big_file_raises(tmp_path, media_files):
+    """Big files are not sent inline when the upload fails, the request would be too big"""
+    uploader = create_uploader(FakeFiles(fail=True), tmp_path)
+
+    with pytest.raises(ValueError, match="too big to send inline"):
+        uploader.get_part(media_files[0], "video/mp4")
+
+def test_uploaders_sharing_the_cache_file_keep_all_uploads(tmp_path, media_files):
+    """Uploads of another uploader saved meanwhile are not overwritten"""
+    files = FakeFiles()
+    uploader_1 = create_uploader(files, tmp_path, account_id="key_1")
+    uploader_2 = create_uploader(files, tmp_path, account_id="key_2")
+    uploader_1.get_part(media_files[0], "video/mp4")
+    uploader_2.get_part(media_files[0], "video/mp4")
+
+    with open(tmp_path / "uploads.json", "r") as cache_file:
+        upload_keys = json.load(cache_file)
+    assert sorted(key.rsplit("_", 1)[0] for key in upload_keys) == ["key_1", "key_2"]
+    assert len(create_uploader(files, tmp_path, account_id="key_1")._uploads) == 2 # pylint: disable=protected-access
+    assert sorted(os.listdir(tmp_path)) == ["snapshot.png", "uploads.json", "video.mp4"]
+
+def test_unsaved_cache_does_not_fail_the_upload(tmp_path, media_files):
+    """Uri of the uploaded file is returned when the cache file cannot be written"""
+    files = FakeFiles()
+    uploader = MediaUploader(SimpleNamespace(files=files), inline_limit_mb=1.0,
+                             cache_path=str(tmp_path / "missing_dir" / "uploads.json"))
+
+    part = uploader.get_part(media_files[0], "video/mp4")
+
+    assert part.file_data.file_uri == "https://files.test/files/file_1"
@@ -0,0 +1,46 @@
+"""Tests of snapshot strategy selection and fallbacks"""
+# pylint: disable=too-many-positional-arguments
+from concurrent.futures.process import BrokenProcessPool
+import pytest
+
+from video_processor import snapshots
+from video_processor.snapshots import SnapshotExtractor
+
+VIDEO_INFO = {"total_frames": 10800, "fps": 30.0, "duration": 360.0}
+
+@pytest.mark.parametrize("workers, num_snapshots, total_frames, ffmpeg, expected", [
+    (4, 30, 10800, True, "segmented"),
+    (2, 24, 10800, True, "segmented"),
+    (8, 10, 10800, True, "keyframe"),
+    (8, 10, 10800, False, "seek"),
+    (1, 40, 10800, True, "sequential"),
+    (8, 20, 3600, True, "sequential"),
+])
+def test_auto_strategy(monkeypatch, workers, num_snapshots, total_frames, ffmpeg, expected):
+    """Segmented needs enough snapshots per worker, others depend on snapshot spacing"""
+    monkeypatch.setattr(snapshots, "ffmpeg_available", lambda: ffmpeg)
+    extractor = SnapshotExtractor(workers=workers)
+
+    assert extractor.resolve_strategy(total_frames, num_snapshots) == expected
+
+def test_segment_workers_get_enough_snapshots():
+    """Workers are limited so every worker has the minimum snapshots"""
+    extractor = SnapshotExtractor(strategy="segmented", workers=8)
+
+    assert extractor.get_segment_workers(10) == 1
+    assert extractor.get_segment_workers(30) == 2
+    assert extractor.get_segment_workers(200) == 8
+
+def test_broken_worker_falls_back_to_seek(monkeypatch, tmp_path):
+    """A crashed segmented worker falls back to opencv seeks"""
+    def crash(*args):
+        raise BrokenProcessPool("worker terminated")
+
+    seek_calls = []
+    extractor = SnapshotExtractor(strategy="segmented", workers=2)
+    monkeypatch.setattr(extractor, "_extract_segmented", crash)
+    monkeypatch.setattr(extractor, "_extract_seek",
+                        lambda *args: seek_calls.append(args) or ["snapshot_1.png"])
+
+    assert extractor.extract("video.mp4", 30, str(tmp_path), VIDEO_INFO) == ["snapshot_1.png"]
+    assert len(seek_calls) == 1
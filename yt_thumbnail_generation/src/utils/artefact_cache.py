@@ -0,0 +1,184 @@
+"""Disk cache of processed video artefacts keyed by video id and processing params"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class ArtefactCache:
+    """Stores video metadata, snapshots (or the short video), metadata description with
+    subtitles and generated descriptions and prompts of processed videos.
+    Every entry is a folder with an entry.json, entries are evicted least recently used first
+    once the cache is over `max_size_mb`. Entries pinned by a session in the last
+    `pin_seconds` are not evicted, so media a session is working with stays on disk.
+    Use one instance per process, the lock only guards writes of the same instance."""
+    def __init__(self, cache_dir: str="artefact_cache", max_size_mb: float=500.0,
+                 pin_seconds: float=3600.0):
+        """Initialize cache with the cache folder and size limit"""
+        self.cache_dir = cache_dir
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.pin_seconds = pin_seconds
+        self._lock = threading.Lock()
+        self._pins = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def get_key(video_id: str, params: dict):
+        """Cache key of the video and the params it was processed with"""
+        params_hash = hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+        return f"{video_id}_{params_hash[:10]}"
+
+    @staticmethod
+    def text_hash(text: str):
+        """Short hash of a text, for keying artefacts generated from edited text"""
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()[:10]
+
+    def _entry_dir(self, key: str):
+        """Folder of the cache entry"""
+        return os.path.join(self.cache_dir, key)
+
+    def _load_entry(self, key: str):
+        """Entry of the key, None if it is not cached"""
+        entry_path = os.path.join(self._entry_dir(key), "entry.json")
+        if not os.path.exists(entry_path):
+            return None
+        try:
+            with open(entry_path, "r") as entry_file:
+                return json.load(entry_file)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Unable to read cache entry {key}: {e}")
+            return None
+
+    def _save_entry(self, key: str, entry: dict):
+        """Write entry atomically, a crash never leaves a partial entry"""
+        entry_path = os.path.join(self._entry_dir(key), "entry.json")
+        with open(f"{entry_path}.tmp", "w") as entry_file:
+            json.dump(entry, entry_file)
+        os.replace(f"{entry_path}.tmp", entry_path)
+
+    def get_video(self, key: str):
+        """Get cached (video metadata, media path), media path is a list of snapshots or the
+        video file. Returns None, None on a miss"""
+        with self._lock:
+            entry = self._load_entry(key)
+            if entry is None or "media_path" not in entry:
+                return None, None
+            media_paths = entry["media_path"] if isinstance(entry["media_path"], list) \
+                          else [entry["media_path"]]
+            if not all(os.path.exists(media_path) for media_path in media_paths):
+                logger.warning(f"Cached media of {key} is missing, processing video again")
+                return None, None
+            with open(os.path.join(self._entry_dir(key), "metadata.json"), "r") as metadata_file:
+                video_metadata = json.load(metadata_file)
+            entry["last_access"] = time.time()
+            self._save_entry(key, entry)
+        logger.info(f"Loaded video artefacts from cache: {key}")
+
+        return video_metadata, entry["media_path"]
+
+    def put_video(self, key: str, video_metadata: dict, media_path):
+        """Move processed media into the cache and store the metadata.
+        Returns media path inside the cache, or the given media path if it is too big to cache"""
+        media_paths = media_path if isinstance(media_path, list) else [media_path]
+        media_size = sum(os.path.getsize(path) for path in media_paths)
+        if media_size > self.max_size_bytes:
+            logger.warning(f"Media of {key} is bigger than the cache, not caching it")
+            return media_path
+
+        with self._lock:
+            entry_dir = self._entry_dir(key)
+            os.makedirs(entry_dir, exist_ok=True)
+            cached_paths = []
+            for path in media_paths:
+                cached_path = os.path.join(entry_dir, os.path.basename(path))
+                shutil.move(path, cached_path)
+                cached_paths.append(cached_path)
+            with open(os.path.join(entry_dir, "metadata.json"), "w") as metadata_file:
+                # Some yt_dlp fields are not json serializable, they are not used later
+                json.dump(video_metadata, metadata_file, default=str)
+
+            entry = self._load_entry(key) or {"texts": {}}
+            entry["media_path"] = cached_paths if isinstance(media_path, list) \
+                                  else cached_paths[0]
+            entry["created_at"] = entry["last_access"] = time.time()
+            self._save_entry(key, entry)
+            self._evict(keep_key=key)
+
+        return entry["media_path"]
+
+    def pin(self, owner: str, key: str):
+        """Keep the entry of the owner (a session) from eviction, replaces its earlier pin"""
+        with self._lock:
+            self._pins[owner] = (key, time.time())
+
+    def _get_pinned_keys(self):
+        """Keys pinned within the pin time, expired pins of closed sessions are dropped"""
+        now = time.time()
+        self._pins = {owner: (key, pinned_at) for owner, (key, pinned_at) in self._pins.items()
+                      if now - pinned_at < self.pin_seconds}
+        return {key for key, _ in self._pins.values()}
+
+    def get_text(self, key: str, name: str):
+        """Get a cached text artefact like a description or prompt, None if missing"""
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._load_entry(key)
+        if entry is None:
+            return None
+
+        return entry["texts"].get(name)
+
+    def put_text(self, key: str, name: str, text: str):
+        """Cache a text artefact of the video"""
+        if key is None:
+            return
+        with self._lock:
+            entry = self._load_entry(key)
+            if entry is None:
+                return
+            entry["texts"][name] = text
+            entry["last_access"] = time.time()
+            self._save_entry(key, entry)
+
+    def get_size(self):
+        """Total size of cached files in bytes"""
+        return sum(os.path.getsize(os.path.join(root, file_name))
+                   for root, _, file_names in os.walk(self.cache_dir)
+                   for file_name in file_names)
+
+    def _evict(self, keep_key: str=None):
+        """Remove least recently used entries that are not pinned, until the cache is within
+        the size limit"""
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry = self._load_entry(key)
+            if entry is None:
+                # Leftover of an interrupted write
+                shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+                continue
+            entries.append((entry.get("last_access", 0), key))
+
+        total_size = self.get_size()
+        pinned_keys = self._get_pinned_keys()
+        for _, key in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+            if key == keep_key or key in pinned_keys:
+                continue
+            entry_dir = self._entry_dir(key)
+            entry_size = sum(os.path.getsize(os.path.join(entry_dir, file_name))
+                             for file_name in os.listdir(entry_dir))
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_size -= entry_size
+            logger.info(f"Evicted {key} from artefact cache")
+
+    def clear(self):
+        """Remove all cached entries"""
+        with self._lock:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+            os.makedirs(self.cache_dir, exist_ok=True)
@@ -0,0 +1,81 @@
+"""Benchmark of edit chat history replay, base64 encoded file data vs cached raw byte parts.
+Run from the src folder: python -m utils.media_benchmark"""
+import os
+import time
+import base64
+import tempfile
+import tracemalloc
+import cv2
+import numpy as np
+
+from google.genai import types
+from utils.utility import history_to_contents, media_part_cache
+
+def base64_history_to_contents(message: str, history: list):
+    """Earlier flow, every media file is read, base64 encoded and decoded again by the sdk"""
+    contents = []
+    for chat_message in history:
+        parts = []
+        content_data = chat_message["content"]
+        if "text" in content_data:
+            parts.append(types.Part.from_text(text=content_data["text"]))
+        if "media" in content_data:
+            with open(content_data["media"], "rb") as media_file:
+                file_data = base64.b64encode(media_file.read()).decode("utf-8")
+            parts.append(types.Part.from_bytes(
+                mime_type="image/"+content_data["media"].split(".")[-1],
+                data=file_data
+            ))
+        contents.append(types.Content(role=chat_message["role"], parts=parts))
+    contents.append(types.Content(role="user", parts=[types.Part.from_text(text=message)]))
+
+    return contents
+
+def create_chat_history(media_dir: str, turns: int, size: tuple=(1280, 720)):
+    """Edit chat history with a generated image in every model turn"""
+    rng = np.random.default_rng(0)
+    history = []
+    for turn in range(turns):
+        image = rng.integers(0, 256, (size[1] // 8, size[0] // 8, 3), dtype=np.uint8)
+        image = cv2.resize(image, size, interpolation=cv2.INTER_CUBIC)
+        image_path = os.path.join(media_dir, f"edit_{turn}.png")
+        cv2.imwrite(image_path, image)
+        history.append({"role": "user", "content": {"text": f"Edit request {turn}"}})
+        history.append({"role": "model", "content": {"text": f"Edit {turn}",
+                                                     "media": image_path}})
+
+    return history
+
+def run_media_benchmark(turn_counts: tuple=(2, 5, 10), replays: int=10):
+    """Time and peak memory of replaying the history once per chat message"""
+    results = []
+    with tempfile.TemporaryDirectory() as media_dir:
+        for turns in turn_counts:
+            history = create_chat_history(media_dir, turns)
+            media_bytes = sum(os.path.getsize(message["content"]["media"])
+                              for message in history if "media" in message["content"])
+            for flow in (base64_history_to_contents, history_to_contents):
+                media_part_cache.clear()
+                tracemalloc.start()
+                start_time = time.perf_counter()
+                for replay in range(replays):
+                    contents = flow(f"Message {replay}", history)
+                    # Request body encoding is the same for both flows
+                    for content in contents:
+                        content.model_dump(mode="json", exclude_none=True)
+                elapsed = time.perf_counter() - start_time
+                _, peak_memory = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                results.append({
+                    "turns": turns,
+                    "media_mb": round(media_bytes / 1024 / 1024, 2),
+                    "flow": flow.__name__,
+                    "seconds_per_replay": round(elapsed / replays, 4),
+                    "peak_memory_mb": round(peak_memory / 1024 / 1024, 2)
+                })
+                print(results[-1])
+
+    return results
+
+if __name__ == "__main__":
+    run_media_benchmark()
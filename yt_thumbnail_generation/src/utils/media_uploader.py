@@ -0,0 +1,145 @@
+"""Upload media with the gemini Files API once and reference it by uri in later requests"""
+# pylint: disable=too-many-positional-arguments
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+from google.genai import types
+from google.genai.client import Client as geminiClient
+from utils.utility import get_file_data
+
+logger = logging.getLogger(__name__)
+
+class MediaUploader:
+    """Returns request parts of media files. Files smaller than `inline_limit_mb` are sent
+    inline, bigger ones are uploaded with the Files API and their uri is cached per file hash
+    until shortly before the uploaded file expires (48 hours after upload).
+    Inline data is base64 encoded in the json body, a third bigger than the file, and
+    requests are limited to 20MB, so the inline limit leaves room for the rest of the request"""
+    def __init__(self, client: geminiClient, cache_path: str="upload_cache.json",
+                 inline_limit_mb: float=10.0, account_id: str="",
+                 expiry_margin_seconds: int=3600, processing_timeout: int=300):
+        """Initialize uploader with the client, uri cache file and inline size limit.
+        `account_id` separates cached uris of different api keys, files are per project"""
+        self.client = client
+        self.cache_path = cache_path
+        self.inline_limit_bytes = int(inline_limit_mb * 1024 * 1024)
+        self.account_id = account_id
+        self.expiry_margin_seconds = expiry_margin_seconds
+        self.processing_timeout = processing_timeout
+        self._lock = threading.Lock()
+        self._file_locks = {}
+        self._hashes = {}
+        self._uploads = self._load_cache()
+
+    def _load_cache(self):
+        """Uploaded files of earlier runs from the cache file"""
+        if not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, "r") as cache_file:
+                return json.load(cache_file)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Unable to read upload cache: {e}")
+            return {}
+
+    def _save_cache(self):
+        """Write uploaded files atomically, drops expired ones.
+        Uploaders of other api keys and processes write the same file, so their uploads are
+        read again and kept, the later expiring upload wins for the same key"""
+        now = time.time()
+        uploads = self._load_cache()
+        for key, upload in self._uploads.items():
+            if key not in uploads or uploads[key]["expires_at"] < upload["expires_at"]:
+                uploads[key] = upload
+        self._uploads = {key: upload for key, upload in uploads.items()
+                         if upload["expires_at"] > now}
+        tmp_path = f"{self.cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w") as cache_file:
+                json.dump(self._uploads, cache_file)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            # File is uploaded, it is uploaded again by the next run only
+            logger.error(f"Unable to save upload cache: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get_file_hash(self, file_path: str):
+        """sha256 of the file, remembered per path, size and modified time"""
+        stat = os.stat(file_path)
+        hash_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        if hash_key not in self._hashes:
+            file_hash = hashlib.sha256()
+            with open(file_path, "rb") as media_file:
+                for chunk in iter(lambda: media_file.read(1024 * 1024), b""):
+                    file_hash.update(chunk)
+            self._hashes[hash_key] = file_hash.hexdigest()
+
+        return self._hashes[hash_key]
+
+    def _wait_until_active(self, uploaded_file: types.File):
+        """Videos are processed after upload, they can be used once they are active"""
+        deadline = time.time() + self.processing_timeout
+        while uploaded_file.state == types.FileState.PROCESSING:
+            if time.time() > deadline:
+                raise TimeoutError(f"{uploaded_file.name} is still processing")
+            time.sleep(2)
+            uploaded_file = self.client.files.get(name=uploaded_file.name)
+        if uploaded_file.state == types.FileState.FAILED:
+            raise ValueError(f"Processing failed for {uploaded_file.name}: {uploaded_file.error}")
+
+        return uploaded_file
+
+    def upload(self, file_path: str, mime_type: str):
+        """Uri of the uploaded file, uploads it if there is no unexpired upload of its hash"""
+        upload_key = f"{self.account_id}_{self.get_file_hash(file_path)}"
+        with self._lock:
+            file_lock = self._file_locks.setdefault(upload_key, threading.Lock())
+
+        # Same file requested by many threads is uploaded only once
+        with file_lock:
+            upload = self._uploads.get(upload_key)
+            if upload and upload["expires_at"] - self.expiry_margin_seconds > time.time():
+                logger.info(f"Using uploaded file {upload['name']} for {file_path}")
+                return upload["uri"]
+
+            start_time = time.perf_counter()
+            uploaded_file = self.client.files.upload(
+                file=file_path,
+                config=types.UploadFileConfig(mime_type=mime_type)
+            )
+            uploaded_file = self._wait_until_active(uploaded_file)
+            expiration_time = uploaded_file.expiration_time or datetime.fromtimestamp(
+                time.time() + 48 * 3600)
+            logger.info(f"Uploaded {file_path} as {uploaded_file.name} in "
+                        f"{time.perf_counter() - start_time:.1f}s")
+            with self._lock:
+                self._uploads[upload_key] = {
+                    "name": uploaded_file.name,
+                    "uri": uploaded_file.uri,
+                    "mime_type": mime_type,
+                    "expires_at": expiration_time.timestamp()
+                }
+                self._save_cache()
+
+        return uploaded_file.uri
+
+    def get_part(self, file_path: str, mime_type: str):
+        """Request part of the media file, inline for small files and file uri otherwise.
+        Raises ValueError if the upload fails, the file is too big to send inline"""
+        if os.path.getsize(file_path) > self.inline_limit_bytes:
+            try:
+                return types.Part.from_uri(file_uri=self.upload(file_path, mime_type),
+                                           mime_type=mime_type)
+            except Exception as e:
+                logger.error(f"Upload failed for {file_path}: {e}")
+                raise ValueError(f"Upload of {os.path.basename(file_path)} failed and it is "
+                                 f"too big to send inline: {e}") from e
+
+        return types.Part(inline_data=types.Blob(data=get_file_data(file_path),
+                                                 mime_type=mime_type))
@@ -2,8 +2,12 @@
 # pylint: disable=consider-using-with
 import re
 import os
-import base64
+import shutil
+import inspect
 import logging
+import functools
+import threading
+from collections import OrderedDict
 from typing import Union, List, Dict, Any
 import requests
 from google.genai import types
@@ -30,16 +34,106 @@ def strip_escape_seqs(text: str):
     ansi_escape_chars = re.compile(r'(?:\x1b\[|\x9b)[0-?]*[ -/]*[@-~]')
     return ansi_escape_chars.sub('', text)
 
+def handle_genai_errors(method):
+    """Decorator of sync and async generation methods returning (result, error), client
+    errors like an invalid api key, server errors and others are returned as (None, message)"""
+    if inspect.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def async_wrapper(*args, **kwargs):
+            try:
+                return await method(*args, **kwargs)
+            except Exception as e:
+                return None, str(e)
+        return async_wrapper
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        except Exception as e:
+            return None, str(e)
+    return wrapper
+
+def ffmpeg_available():
+    """Check if ffmpeg binary is on the path"""
+    return shutil.which("ffmpeg") is not None
+
+def ffmpeg_input_args(video_path: str, http_headers: dict=None):
+    """ffmpeg input args of a local file or a url, with request headers for urls"""
+    if not http_headers:
+        return ["-i", video_path]
+    headers = "".join(f"{name}: {value}\r\n" for name, value in http_headers.items())
+    return ["-headers", headers, "-i", video_path]
+
 def get_file_data(file_path: str):
-    """Convert file data to base64"""
+    """Read file data as raw bytes, the sdk base64 encodes it once when sending the request"""
     try:
-        file_content = open(file_path, 'rb').read()
-        file_data = base64.b64encode(file_content).decode("utf-8")
-        return file_data
+        with open(file_path, 'rb') as media_file:
+            return media_file.read()
     except Exception as e:
         logger.error(f"Error processing image: {e}")
         return None
 
+class MediaPartCache:
+    """Least recently used inline parts, bounded by the total bytes of the files.
+    Shared by all sessions of the app, so the lock guards every access"""
+    def __init__(self, max_bytes: int):
+        """Initialize cache with the maximum total bytes of cached files"""
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._parts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple):
+        """Cached part of the key, None if missing"""
+        with self._lock:
+            if key not in self._parts:
+                return None
+            self._parts.move_to_end(key)
+            return self._parts[key][0]
+
+    def put(self, key: tuple, part: types.Part, num_bytes: int):
+        """Cache the part, evicts least recently used parts over the limit"""
+        if num_bytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._parts:
+                self.total_bytes -= self._parts.pop(key)[1]
+            self._parts[key] = (part, num_bytes)
+            self.total_bytes += num_bytes
+            while self.total_bytes > self.max_bytes:
+                self.total_bytes -= self._parts.popitem(last=False)[1][1]
+
+    def clear(self):
+        """Remove all cached parts"""
+        with self._lock:
+            self._parts.clear()
+            self.total_bytes = 0
+
+# Edit chats of all sessions replay their images, 256MB keeps recent ones in memory
+media_part_cache = MediaPartCache(max_bytes=256 * 1024 * 1024)
+
+def get_media_part(file_path: str, mime_type: str):
+    """Inline part of an image, read once and reused while the file is unchanged, so
+    replaying chat history or snapshots does not read the files again. None if the file
+    cannot be read"""
+    try:
+        stat = os.stat(file_path)
+    except OSError as e:
+        logger.error(f"Error processing image: {e}")
+        return None
+    # Size and modified time are part of the key, a changed file is read again
+    cache_key = (os.path.abspath(file_path), mime_type, stat.st_size, stat.st_mtime_ns)
+    part = media_part_cache.get(cache_key)
+    if part is None:
+        file_data = get_file_data(file_path)
+        if file_data is None:
+            return None
+        part = types.Part.from_bytes(data=file_data, mime_type=mime_type)
+        media_part_cache.put(cache_key, part, len(file_data))
+
+    return part
+
 def save_binary_file(file_name: str, data, thumbnails_dir = "thumbnails"):
     """Save the image to thumbnails dir"""
     if not os.path.exists(thumbnails_dir):
@@ -106,29 +200,36 @@ def process_video_metadata(video_metadata: dict):
 
     return metadata_description
 
-def construct_contents(video_metadata: dict, media_path: str):
-    """Construct contents based on media received"""
+def construct_contents(video_metadata: dict, media_path: str, metadata_description: str=None,
+                       media_uploader=None):
+    """Construct contents based on media received, metadata description (with subtitles) is
+    created from the video metadata if it is not given. Videos are sent with the
+    media uploader (utils/media_uploader.py) if given, so they are uploaded only once"""
+    if metadata_description is None:
+        metadata_description = process_video_metadata(video_metadata)
     if isinstance(media_path, str):
+        if media_uploader:
+            video_part = media_uploader.get_part(media_path, 'video/mp4')
+        else:
+            video_part = types.Part(
+                inline_data=types.Blob(data=get_file_data(media_path), mime_type='video/mp4')
+            )
         contents = [
-            f"Video Metadata: {process_video_metadata(video_metadata)}",
+            f"Video Metadata: {metadata_description}",
             "Video file:",
-            types.Part(
-                inline_data=types.Blob(data=get_file_data(media_path), mime_type='video/mp4')
-            ),
+            video_part,
             "Description:"
         ]
     elif isinstance(media_path, list):
         contents = [
-            f"Video Metadata: {process_video_metadata(video_metadata)}",
+            f"Video Metadata: {metadata_description}",
             "Snapshots of video:"
         ]
         for snapshot_image in media_path:
-            contents.append(
-                types.Part.from_bytes(
-                    data=get_file_data(snapshot_image),
-                    mime_type=f'image/{snapshot_image.split(".")[-1]}',
-                ),
-            )
+            snapshot_part = get_media_part(snapshot_image,
+                                           f'image/{snapshot_image.split(".")[-1]}')
+            if snapshot_part:
+                contents.append(snapshot_part)
             contents.append("Description:")
 
     return contents
@@ -141,10 +242,10 @@ def deserialize_parts(content_data: dict):
             types.Part.from_text(text=content_data["text"])
         )
     if "media" in content_data:
-        parts.append(types.Part.from_bytes(
-            mime_type="image/"+content_data["media"].split(".")[-1],
-            data=get_file_data(content_data["media"])
-        ))
+        media_part = get_media_part(content_data["media"],
+                                    "image/"+content_data["media"].split(".")[-1])
+        if media_part:
+            parts.append(media_part)
 
     return parts
 
@@ -0,0 +1,53 @@
+"""Benchmark of metadata resolution, extracting info twice vs reusing the extracted info.
+Needs network access to youtube, downloads are skipped so only metadata work is timed.
+Run from the src folder: python -m video_processor.extraction_benchmark"""
+import time
+import copy
+import yt_dlp
+
+from video_processor.processor import SNAPSHOT_FORMAT, get_pooled_ydl
+
+def extract_twice(url: str, format_spec: str=SNAPSHOT_FORMAT):
+    """Earlier flow, extract info and then download([url]) with a new YoutubeDL"""
+    with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True}) as ydl:
+        info_dict = ydl.extract_info(url, download=False)
+    ydl_opts = {'format': format_spec, 'quiet': True, 'no_warnings': True,
+                'skip_download': True}
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl_download:
+        ydl_download.download([url])
+
+    return info_dict
+
+def reuse_info(url: str, format_spec: str=SNAPSHOT_FORMAT):
+    """Current flow, extract info once with pooled instances and process it for the format"""
+    with get_pooled_ydl() as ydl:
+        info_dict = ydl.extract_info(url, download=False)
+    with get_pooled_ydl(format_spec) as ydl_format:
+        ydl_format.process_ie_result(copy.deepcopy(info_dict), download=False)
+
+    return info_dict
+
+def run_extraction_benchmark(urls: list=None, runs: int=3, format_spec: str=SNAPSHOT_FORMAT):
+    """Time both flows for every url, first run of the pooled flow includes creating instances"""
+    urls = urls or ["https://youtu.be/u_Gm_Hi7gV4"]
+    results = []
+    for url in urls:
+        for flow in (extract_twice, reuse_info):
+            timings = []
+            for _ in range(runs):
+                start_time = time.perf_counter()
+                flow(url, format_spec)
+                timings.append(time.perf_counter() - start_time)
+            results.append({
+                "url": url,
+                "flow": flow.__name__,
+                "first_seconds": round(timings[0], 3),
+                "mean_seconds": round(sum(timings) / runs, 3),
+                "min_seconds": round(min(timings), 3)
+            })
+            print(results[-1])
+
+    return results
+
+if __name__ == "__main__":
+    run_extraction_benchmark()
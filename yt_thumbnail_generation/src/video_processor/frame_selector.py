@@ -0,0 +1,152 @@
+"""Content aware selection of snapshot frames using scene changes, sharpness and brightness"""
+# pylint: disable=too-many-positional-arguments
+import logging
+import subprocess
+import cv2
+import numpy as np
+
+from utils.utility import ffmpeg_available, ffmpeg_input_args
+
+logger = logging.getLogger(__name__)
+
+def color_histograms(frames: np.ndarray, bins_per_channel: int=4):
+    """Normalized joint bgr histogram of every frame, frames are (N, H, W, 3) uint8"""
+    shift = 8 - int(np.log2(bins_per_channel))
+    quantized = (frames >> shift).astype(np.int32)
+    bin_ids = (quantized[..., 0] * bins_per_channel + quantized[..., 1]) * bins_per_channel \
+              + quantized[..., 2]
+    num_bins = bins_per_channel ** 3
+    # Offset bins of every frame, so a single bincount gives all histograms
+    bin_ids = bin_ids.reshape(len(frames), -1) + np.arange(len(frames))[:, None] * num_bins
+    counts = np.bincount(bin_ids.ravel(), minlength=len(frames) * num_bins)
+
+    return counts.reshape(len(frames), num_bins) / bin_ids.shape[1]
+
+def laplacian_variance(gray_frames: np.ndarray):
+    """Variance of the laplacian of every frame, low values are blurry or flat frames"""
+    laplacian = (gray_frames[:, :-2, 1:-1] + gray_frames[:, 2:, 1:-1]
+                 + gray_frames[:, 1:-1, :-2] + gray_frames[:, 1:-1, 2:]
+                 - 4 * gray_frames[:, 1:-1, 1:-1])
+
+    return laplacian.reshape(len(gray_frames), -1).var(axis=1)
+
+def histogram_distance(histograms: np.ndarray, histogram: np.ndarray):
+    """Total variation distance between histograms and a histogram, 0 same and 1 disjoint"""
+    return 0.5 * np.abs(histograms - histogram).sum(axis=-1)
+
+def frame_features(frames: np.ndarray, batch_size: int=256):
+    """Brightness, sharpness, histograms and scene change scores of frames in order.
+    Computed in batches, so float copies of long videos are not held in memory at once"""
+    brightness, sharpness, histograms = [], [], []
+    for start in range(0, len(frames), batch_size):
+        batch = frames[start:start + batch_size]
+        gray_frames = batch.astype(np.float32) @ np.array([0.114, 0.587, 0.299],
+                                                          dtype=np.float32)
+        brightness.append(gray_frames.mean(axis=(1, 2)))
+        sharpness.append(laplacian_variance(gray_frames))
+        histograms.append(color_histograms(batch))
+    histograms = np.concatenate(histograms)
+    scene_change = np.zeros(len(frames))
+    scene_change[1:] = histogram_distance(histograms[1:], histograms[:-1])
+
+    return {
+        "brightness": np.concatenate(brightness),
+        "sharpness": np.concatenate(sharpness),
+        "histograms": histograms,
+        "scene_change": scene_change
+    }
+
+class ContentFrameSelector:
+    """Picks the most distinct and sharp frames of a video, instead of equally spaced ones.
+    The video is sampled at `sample_fps` and downscaled, dark or washed out frames and frames
+    in the middle of a transition are dropped, then frames are picked one at a time by
+    sharpness times the colour distance to already picked frames. Picking stops early if the
+    remaining frames are all similar to picked ones (e.g. a single talking head shot)."""
+    def __init__(self, sample_fps: float=1.0, frame_size: tuple=(160, 90),
+                 min_brightness: float=25.0, max_brightness: float=235.0,
+                 transition_threshold: float=0.3, min_distance: float=0.15):
+        """Initialize selector with sampling and filtering thresholds"""
+        self.sample_fps = sample_fps
+        self.frame_size = frame_size
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.transition_threshold = transition_threshold
+        self.min_distance = min_distance
+
+    def sample_frames(self, video_path: str, fps: float, http_headers: dict=None):
+        """Downscaled frames of the video at sample fps, (N, H, W, 3) bgr array.
+        Video path can be a url, ffmpeg then decodes while the video is being downloaded"""
+        width, height = self.frame_size
+        if ffmpeg_available():
+            # Scaling and frame dropping happen in ffmpeg, only small raw frames are read
+            result = subprocess.run(["ffmpeg", "-v", "error",
+                                     *ffmpeg_input_args(video_path, http_headers),
+                                     "-vf", f"fps={self.sample_fps},scale={width}:{height}",
+                                     "-f", "rawvideo", "-pix_fmt", "bgr24", "-"],
+                                    check=True, capture_output=True)
+            frames = np.frombuffer(result.stdout, dtype=np.uint8)
+            return frames.reshape((-1, height, width, 3))
+
+        frames = []
+        cap = cv2.VideoCapture(video_path)
+        step = max(1, round(fps / self.sample_fps))
+        frame_id = 0
+        while cap.grab():
+            if frame_id % step == 0:
+                ret, frame = cap.retrieve()
+                if ret:
+                    frames.append(cv2.resize(frame, self.frame_size,
+                                             interpolation=cv2.INTER_AREA))
+            frame_id += 1
+        cap.release()
+
+        return np.array(frames, dtype=np.uint8).reshape((-1, height, width, 3))
+
+    def get_candidates(self, features: dict):
+        """Mask of frames that are not too dark, too bright or part of a transition"""
+        brightness = features["brightness"]
+        well_exposed = (brightness >= self.min_brightness) & (brightness <= self.max_brightness)
+        # A frame very different from both neighbours is a fade, dissolve or flash
+        scene_change = features["scene_change"]
+        next_change = np.append(scene_change[1:], 0.0)
+        in_transition = (scene_change > self.transition_threshold) & \
+                        (next_change > self.transition_threshold)
+
+        return well_exposed & ~in_transition
+
+    def pick_frames(self, features: dict, candidates: np.ndarray, num_snapshots: int):
+        """Greedily pick sharp frames that are most distinct from picked ones"""
+        candidate_ids = np.flatnonzero(candidates)
+        if len(candidate_ids) == 0:
+            return []
+        sharpness = features["sharpness"][candidate_ids]
+        quality = sharpness / sharpness.max() if sharpness.max() > 0 else np.ones(len(sharpness))
+        histograms = features["histograms"][candidate_ids]
+
+        picked = [int(np.argmax(quality))]
+        min_distance = histogram_distance(histograms, histograms[picked[0]])
+        while len(picked) < num_snapshots:
+            distinct = min_distance >= self.min_distance
+            if not distinct.any():
+                break
+            next_pick = int(np.argmax(np.where(distinct, min_distance * quality, -1.0)))
+            picked.append(next_pick)
+            min_distance = np.minimum(min_distance,
+                                      histogram_distance(histograms, histograms[next_pick]))
+
+        return sorted(int(candidate_ids[pick]) for pick in picked)
+
+    def select(self, video_path: str, num_snapshots: int, fps: float=30.0,
+               http_headers: dict=None):
+        """Frame ids of the best snapshots in the video, at most num snapshots"""
+        frames = self.sample_frames(video_path, fps, http_headers)
+        if len(frames) == 0:
+            return []
+        features = frame_features(frames)
+        candidates = self.get_candidates(features)
+        picked = self.pick_frames(features, candidates, num_snapshots)
+        logger.info(f"Selected {len(picked)} snapshots from {len(frames)} sampled frames, "
+                    f"{len(frames) - int(candidates.sum())} dark, bright or transition frames "
+                    "dropped")
+
+        return [int(round(sample_id * fps / self.sample_fps)) for sample_id in picked]
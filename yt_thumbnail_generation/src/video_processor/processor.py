@@ -1,14 +1,29 @@
 """Video processor functions using yt_dlp"""
-# pylint: disable=too-many-branches
+# pylint: disable=too-many-branches,too-many-positional-arguments
 import os
+import copy
+import queue
+import hashlib
 import tempfile
 import logging
-import cv2
+import threading
+import contextlib
 import yt_dlp
-import numpy as np
+from yt_dlp.extractor.youtube import YoutubeIE
 import streamlit as st
 
-from utils.utility import clean_title, strip_escape_seqs
+from utils.utility import clean_title, strip_escape_seqs, ffmpeg_available
+from video_processor.snapshots import SnapshotExtractor
+
+# Low quality video only format used for snapshots
+SNAPSHOT_FORMAT = 'bestvideo[ext=mp4][height<=480]/best[height<=480]'
+# Video with audio used directly for short videos
+VIDEO_FORMAT = 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best'
+
+# Idle YoutubeDL instances kept per format for reuse
+YDL_POOL_SIZE = 8
+_ydl_pool = {}
+_ydl_pool_lock = threading.Lock()
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(
@@ -19,17 +34,71 @@ logging.basicConfig(
 
 def update_download_progress(d):
     """Callback hook for updating download progress"""
-    if d['status'] == 'downloading':
+    if d['status'] == 'downloading' and 'video_processor_progress' in st.session_state:
         download_percent = strip_escape_seqs(d['_percent_str'])
         download_progress = float(download_percent.replace('%', '')) / 100
         st.session_state.video_processor_progress.progress(download_progress,
                                                            text="Downloading video...")
 
-def generate_snapshots(video_path: str, num_snapshots: int=5, output_dir: str="snapshots"):
-    """Generate snapshots for the video"""
-    logger.info(f"\n--- Taking Snapshots for: {video_path} ---")
-    snapshots_filepath = []
+def create_ydl(format_spec: str = None):
+    """Create YoutubeDL instance of the format, format selectors are compiled here"""
+    ydl_opts = {
+        'progress_hooks': [update_download_progress],
+        'quiet': False,
+        'no_warnings': True,
+        'noplaylist': True,
+    }
+    if format_spec:
+        ydl_opts['format'] = format_spec
+    if format_spec == SNAPSHOT_FORMAT:
+        ydl_opts['postprocessors'] = [] # no post processing like audio merging
+
+    return yt_dlp.YoutubeDL(ydl_opts)
+
+@contextlib.contextmanager
+def get_pooled_ydl(format_spec: str = None):
+    """Check out a YoutubeDL instance of the format for one request. Idle instances are
+    reused, a new one is created when all are in use so requests never wait on each other"""
+    with _ydl_pool_lock:
+        ydl_queue = _ydl_pool.setdefault(format_spec, queue.Queue(maxsize=YDL_POOL_SIZE))
+    try:
+        ydl = ydl_queue.get_nowait()
+    except queue.Empty:
+        ydl = create_ydl(format_spec)
+    try:
+        yield ydl
+    finally:
+        try:
+            ydl_queue.put_nowait(ydl)
+        except queue.Full:
+            ydl.close()
+
+def download_with_info(info_dict: dict, file_path: str, format_spec: str):
+    """Download the format of already extracted metadata, the video page, player and formats
+    are not resolved again like with download([url])"""
+    with get_pooled_ydl(format_spec) as ydl:
+        # Instance is only used by this request, output file is set per download
+        ydl.params['outtmpl']['default'] = file_path
+        ydl.process_ie_result(copy.deepcopy(info_dict), download=True)
+
+    return file_path
+
+def get_video_id(url: str):
+    """Youtube video id of the url without any network calls, hash of the url otherwise"""
+    if YoutubeIE.suitable(url):
+        return YoutubeIE.get_temp_id(url)
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+
+def clear_download_progress():
+    """Remove download progress bar once video processing is done"""
+    if 'video_processor_progress' in st.session_state:
+        st.session_state.video_processor_progress.empty()
+        del st.session_state.video_processor_progress
 
+def generate_snapshots(video_path: str, num_snapshots: int=5, output_dir: str="snapshots",
+                       strategy: str="auto", image_format: str="png"):
+    """Generate snapshots for the video, see snapshots.STRATEGIES for strategies"""
+    logger.info(f"\n--- Taking Snapshots for: {video_path} ---")
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
         logger.info(f"Created parent directory for snapshots: {output_dir}")
@@ -41,10 +110,9 @@ def generate_snapshots(video_path: str, num_snapshots: int=5, output_dir: str="s
         os.makedirs(video_snapshot_dir)
         logger.info(f"Created directory for video snapshots: {video_snapshot_dir}")
 
-    cap = cv2.VideoCapture(video_path)
-
-    if not cap.isOpened():
-        logger.error(f"Error: Could not open video file {video_path} with OpenCV.")
+    snapshot_extractor = SnapshotExtractor(strategy=strategy, image_format=image_format)
+    snapshots_filepath = snapshot_extractor.extract(video_path, num_snapshots, video_snapshot_dir)
+    if snapshots_filepath is None:
         if os.path.exists(video_path): # Clean up downloaded file
             try:
                 os.remove(video_path)
@@ -53,23 +121,6 @@ def generate_snapshots(video_path: str, num_snapshots: int=5, output_dir: str="s
                 logger.error(f"Error deleting temporary file {video_path}: {e}")
         return None
 
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    logger.debug(f"Total frames in video: {total_frames}")
-
-    frame_indices = np.linspace(0, total_frames - 1, num=num_snapshots, dtype=int)
-
-    for i, frame_id in enumerate(frame_indices):
-        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_id)
-        ret, frame = cap.read()
-        if ret:
-            snapshot_filename = os.path.join(video_snapshot_dir, f"snapshot_{i+1}.png")
-            cv2.imwrite(snapshot_filename, frame)
-            logger.debug(f"Saved snapshot: {snapshot_filename} (from frame {frame_id})")
-            snapshots_filepath.append(snapshot_filename)
-        else:
-            logger.error(f"Error reading frame {frame_id} for snapshot {i+1}.")
-
-    cap.release()
     logger.info("\nSnapshot process complete.")
 
     # Clean up the downloaded video file from the temp directory
@@ -82,82 +133,128 @@ def generate_snapshots(video_path: str, num_snapshots: int=5, output_dir: str="s
 
     return snapshots_filepath
 
+def get_stream_format(info_dict: dict, format_spec: str = SNAPSHOT_FORMAT):
+    """Get url, request headers and frame info of the snapshot format from the metadata"""
+    with get_pooled_ydl(format_spec) as ydl:
+        selected_info = ydl.process_ie_result(copy.deepcopy(info_dict), download=False)
+    stream_format = selected_info.get('requested_formats', [selected_info])[0]
+    fps = stream_format.get('fps') or 30.0
+    duration = selected_info['duration']
+    video_info = {"total_frames": int(duration * fps), "fps": fps, "duration": duration}
+
+    return stream_format['url'], stream_format.get('http_headers'), video_info
+
+def generate_snapshots_from_stream(info_dict: dict, num_snapshots: int=5,
+                                   output_dir: str="snapshots", strategy: str="auto",
+                                   image_format: str="png"):
+    """Generate snapshots by reading the video url directly, without downloading the file.
+    ffmpeg and opencv seek with http range requests, so for keyframe and seek strategies only
+    the byte ranges around the snapshots are fetched, others decode while downloading"""
+    # Keyed on the video id, batches can process videos with the same title at once
+    video_snapshot_dir = os.path.join(output_dir, info_dict.get('id')
+                                      or clean_title(info_dict.get('title', 'video')))
+    os.makedirs(video_snapshot_dir, exist_ok=True)
+    if strategy == "auto" and ffmpeg_available():
+        strategy = "keyframe"
+
+    try:
+        stream_url, http_headers, video_info = get_stream_format(info_dict)
+        logger.info(f"\n--- Taking Snapshots from stream of: {info_dict.get('title')} ---")
+        snapshot_extractor = SnapshotExtractor(strategy=strategy, image_format=image_format,
+                                               http_headers=http_headers)
+        return snapshot_extractor.extract(stream_url, num_snapshots, video_snapshot_dir,
+                                          video_info=video_info)
+    except (yt_dlp.utils.YoutubeDLError, KeyError, ValueError, OSError) as e:
+        logger.error(f"Error taking snapshots from stream: {e}")
+        return None
+
+def extract_video_info(url: str):
+    """Extract metadata of the video without downloading it"""
+    with get_pooled_ydl() as ydl:
+        return ydl.extract_info(url, download=False)
+
+def expand_playlist(url: str):
+    """Video urls of a playlist or channel url, the url itself if it is a single video"""
+    with yt_dlp.YoutubeDL({'extract_flat': 'in_playlist', 'quiet': True}) as ydl:
+        info_dict = ydl.extract_info(url, download=False)
+    if info_dict.get('_type') != 'playlist':
+        return [url]
+
+    return [entry.get('url') or entry.get('webpage_url') for entry in info_dict['entries']
+            if entry]
+
 def get_video_data(url: str, num_snaps: int = 5,
-                   min_duration: int = 120, download_dir: str = "downloads"):
+                   min_duration: int = 120, download_dir: str = "downloads",
+                   snapshot_strategy: str = "auto", stream_snapshots: bool = True):
     """Process youtube video and get required data"""
-    with yt_dlp.YoutubeDL() as ydl:
-        info_dict = ydl.extract_info(url, download=False)
-        if 'title' in info_dict and isinstance(info_dict['title'], str):
-            title = clean_title(info_dict['title'])
-
-        if 'duration' in info_dict and isinstance(info_dict['duration'], int):
-            video_duration = info_dict['duration']
-
-            if video_duration < min_duration:
-                logger.info("Shorter video, using mp4 file directly")
-
-                if not os.path.exists(download_dir):
-                    os.makedirs(download_dir)
-                    logger.info(f"Created downloads directory: {download_dir}")
-
-                file_path = os.path.abspath(f"downloads/{title}.mp4")
-                ydl_opts = {
-                    'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
-                    'outtmpl': file_path,
-                    'progress_hooks': [update_download_progress],
-                    'quiet': False,
-                    'no_warnings': True,
-                    'noplaylist': True,
-                }
-
-                try:
-                    with yt_dlp.YoutubeDL(ydl_opts) as ydl_download:
-                        ydl_download.download([url])
-                    if 'video_processor_progress' in st.session_state:
-                        st.session_state.video_processor_progress.empty()
-                        del st.session_state.video_processor_progress
-                    return info_dict, file_path
-                except yt_dlp.utils.DownloadError as e:
-                    logger.error(f"Error during download or info extraction: {e}")
-                    raise ValueError(e) from e
-                except Exception as e:
-                    logger.error(f"An unexpected error occurred: {e}")
-                    raise ValueError(e) from e
-            elif min_duration < video_duration < 1800: # 30mins
-                logger.info("Longer video, downloading mp4 file and generating snapshots")
-
-                file_path = os.path.join(tempfile.gettempdir(), f"{title}.mp4")
-                ydl_opts = {
-                    # 'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
-                    'format': 'bestvideo[ext=mp4][height<=480]/best[height<=480]', # Low quality
-                    'outtmpl': file_path,
-                    'progress_hooks': [update_download_progress],
-                    'quiet': False,
-                    'no_warnings': True,
-                    'noplaylist': True,
-                    'postprocessors': [],  # no post processing like audio merging
-                }
-
-                try:
-                    with yt_dlp.YoutubeDL(ydl_opts) as ydl_download:
-                        ydl_download.download([url])
-
-                    if 'video_processor_progress' in st.session_state:
-                        st.session_state.video_processor_progress.empty()
-                        del st.session_state.video_processor_progress
-
-                    media_path = generate_snapshots(file_path, num_snapshots=num_snaps)
+    info_dict = extract_video_info(url)
+    return get_video_media(info_dict, num_snaps, min_duration, download_dir, snapshot_strategy,
+                           stream_snapshots)
+
+def get_video_media(info_dict: dict, num_snaps: int = 5,
+                    min_duration: int = 120, download_dir: str = "downloads",
+                    snapshot_strategy: str = "auto", stream_snapshots: bool = True):
+    """Download short video or take snapshots of longer video using extracted metadata"""
+    title = "video"
+    if 'title' in info_dict and isinstance(info_dict['title'], str):
+        title = clean_title(info_dict['title'])
+    # File and snapshot folder names are unique per video, titles can repeat
+    video_id = info_dict.get('id') or title
+
+    if 'duration' in info_dict and isinstance(info_dict['duration'], int):
+        video_duration = info_dict['duration']
+
+        if video_duration < min_duration:
+            logger.info("Shorter video, using mp4 file directly")
+
+            if not os.path.exists(download_dir):
+                os.makedirs(download_dir)
+                logger.info(f"Created downloads directory: {download_dir}")
 
+            file_path = os.path.abspath(f"downloads/{title}_{video_id}.mp4")
+
+            try:
+                download_with_info(info_dict, file_path, VIDEO_FORMAT)
+                clear_download_progress()
+                return info_dict, file_path
+            except yt_dlp.utils.DownloadError as e:
+                logger.error(f"Error during download or info extraction: {e}")
+                raise ValueError(e) from e
+            except Exception as e:
+                logger.error(f"An unexpected error occurred: {e}")
+                raise ValueError(e) from e
+        elif min_duration < video_duration < 1800: # 30mins
+            if stream_snapshots:
+                media_path = generate_snapshots_from_stream(info_dict,
+                                                            num_snapshots=num_snaps,
+                                                            strategy=snapshot_strategy)
+                if media_path:
+                    clear_download_progress()
                     return info_dict, media_path
-                except yt_dlp.utils.DownloadError as e:
-                    logger.error(f"Error during download or info extraction: {e}")
-                    raise ValueError(e) from e
-                except Exception as e:
-                    logger.error(f"An unexpected error occurred: {e}")
-                    raise ValueError(e) from e
-            else:
-                logger.warning("Video is longer than 1/2 hour, skipping video processing.")
-                return None, None
+                logger.warning("Unable to take snapshots from stream, downloading video")
+
+            logger.info("Longer video, downloading mp4 file and generating snapshots")
+
+            file_path = os.path.join(tempfile.gettempdir(), f"{video_id}.mp4")
+
+            try:
+                download_with_info(info_dict, file_path, SNAPSHOT_FORMAT)
+
+                clear_download_progress()
+
+                media_path = generate_snapshots(file_path, num_snapshots=num_snaps,
+                                                strategy=snapshot_strategy)
+
+                return info_dict, media_path
+            except yt_dlp.utils.DownloadError as e:
+                logger.error(f"Error during download or info extraction: {e}")
+                raise ValueError(e) from e
+            except Exception as e:
+                logger.error(f"An unexpected error occurred: {e}")
+                raise ValueError(e) from e
         else:
-            logger.error("Video duration not found, skipping video processing")
+            logger.warning("Video is longer than 1/2 hour, skipping video processing.")
             return None, None
+    else:
+        logger.error("Video duration not found, skipping video processing")
+        return None, None
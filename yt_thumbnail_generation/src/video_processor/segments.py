@@ -0,0 +1,30 @@
+"""Snapshot decoding of a time range of the video, run in worker processes.
+Kept separate from snapshots, so spawned workers only import opencv"""
+import logging
+import cv2
+
+logger = logging.getLogger(__name__)
+
+def save_segment(video_path: str, targets: list, max_sequential_gap: int, image_params: list):
+    """Save (frame id, snapshot path) targets of one time range with its own capture.
+    Seeks to the first frame and to far away frames, grabs frames in between otherwise.
+    Runs in worker processes, returns saved snapshot paths"""
+    saved_paths = []
+    cap = cv2.VideoCapture(video_path)
+    position = None # Frame id the next read returns
+    for frame_id, snapshot_path in sorted(targets):
+        if position is None or frame_id < position or frame_id - position > max_sequential_gap:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_id)
+            position = frame_id
+        while position < frame_id and cap.grab():
+            position += 1
+        ret, frame = cap.read() if position == frame_id else (False, None)
+        if ret:
+            position += 1
+            cv2.imwrite(snapshot_path, frame, image_params)
+            saved_paths.append(snapshot_path)
+        else:
+            logger.error(f"Error reading frame {frame_id} for {snapshot_path}.")
+    cap.release()
+
+    return saved_paths
@@ -0,0 +1,274 @@
+"""Snapshot extraction strategies for downloaded videos"""
+# pylint: disable=too-many-positional-arguments
+import os
+import math
+import logging
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import cv2
+import numpy as np
+
+from utils.utility import ffmpeg_available, ffmpeg_input_args
+from video_processor.frame_selector import ContentFrameSelector
+from video_processor.segments import save_segment
+
+logger = logging.getLogger(__name__)
+
+# seek: opencv seek per snapshot, each seek decodes again from the previous keyframe
+# sequential: single opencv pass, frames are grabbed (decoded) and only targets are converted,
+# faster than seek when snapshots are close together, seek is faster for few far apart snapshots
+# keyframe: ffmpeg fast seek per snapshot, only the keyframe before the timestamp is decoded
+# thumbnail: ffmpeg thumbnail filter, most representative frame of each segment of the video
+# segmented: target frames are split in time ranges, decoded and encoded in worker processes
+# content: most distinct and sharp frames, skipping dark and transition frames (frame_selector)
+STRATEGIES = ["seek", "sequential", "keyframe", "thumbnail", "segmented", "content"]
+
+# Encoding params of snapshot images, jpeg is faster to encode and smaller to upload
+IMAGE_PARAMS = {
+    "png": [cv2.IMWRITE_PNG_COMPRESSION, 3],
+    "jpeg": [cv2.IMWRITE_JPEG_QUALITY, 90],
+}
+
+def get_video_info(video_path: str):
+    """Get frame count, fps and duration of the video using opencv"""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return None
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    cap.release()
+
+    return {"total_frames": total_frames, "fps": fps, "duration": total_frames / fps}
+
+def get_frame_indices(total_frames: int, num_snapshots: int):
+    """Equally spaced frame indices from start to end of the video"""
+    return np.linspace(0, total_frames - 1, num=num_snapshots, dtype=int)
+
+class SnapshotExtractor:
+    """Extracts snapshots from a video with the selected strategy.
+    `auto` uses segmented decoding when there are at least `min_snapshots_per_worker`
+    snapshots for two or more of the `workers` processes, else a sequential opencv pass when
+    snapshots are at most `max_sequential_gap` frames apart, else keyframe grabbing when
+    ffmpeg is installed and opencv seeks otherwise"""
+    def __init__(self, strategy: str="auto", max_sequential_gap: int=300,
+                 thumbnail_batch: int=100, frame_selector=None, workers: int=None,
+                 min_snapshots_per_worker: int=12, image_format: str="png",
+                 http_headers: dict=None):
+        """Initialize extractor with the strategy to use"""
+        if strategy != "auto" and strategy not in STRATEGIES:
+            raise ValueError(f"Unknown snapshot strategy {strategy}, use one of {STRATEGIES}")
+        if image_format not in IMAGE_PARAMS:
+            raise ValueError(f"Unknown image format {image_format}, "
+                             f"use one of {list(IMAGE_PARAMS)}")
+        self.strategy = strategy
+        # A seek decodes from the previous keyframe, around one keyframe interval of frames
+        self.max_sequential_gap = max_sequential_gap
+        # Frames compared by the thumbnail filter at a time, the filter holds them in memory
+        self.thumbnail_batch = thumbnail_batch
+        self.frame_selector = frame_selector or ContentFrameSelector()
+        # Worker processes of segmented decoding, one per core by default
+        self.workers = workers or os.cpu_count() or 1
+        # Starting a worker takes about as long as seeking 10 snapshots, each worker needs more
+        # snapshots than that to make up for it (python -m video_processor.benchmark)
+        self.min_snapshots_per_worker = min_snapshots_per_worker
+        self.image_format = image_format
+        # Request headers of stream urls, used by ffmpeg based strategies
+        self.http_headers = http_headers
+
+    def resolve_strategy(self, total_frames: int, num_snapshots: int):
+        """Strategy to use, falls back to opencv if ffmpeg is not installed"""
+        if self.strategy in STRATEGIES and (self.strategy not in ("keyframe", "thumbnail")
+                                            or ffmpeg_available()):
+            return self.strategy
+        if self.strategy != "auto":
+            logger.warning(f"ffmpeg not found, using opencv instead of {self.strategy} snapshots")
+        if self.get_segment_workers(num_snapshots) > 1:
+            return "segmented"
+        if total_frames / max(num_snapshots, 1) <= self.max_sequential_gap:
+            return "sequential"
+        return "keyframe" if ffmpeg_available() else "seek"
+
+    def get_segment_workers(self, num_snapshots: int):
+        """Worker processes of segmented decoding, every worker gets enough snapshots"""
+        return max(1, min(self.workers, num_snapshots // self.min_snapshots_per_worker))
+
+    def extract(self, video_path: str, num_snapshots: int, snapshot_dir: str,
+                video_info: dict=None):
+        """Save snapshots of the video to the snapshot dir and return their paths.
+        Video path can be a stream url, with video info from the metadata to skip probing"""
+        video_info = video_info or get_video_info(video_path)
+        if video_info is None or video_info["total_frames"] <= 0:
+            logger.error(f"Error: Could not open video file {video_path} with OpenCV.")
+            return None
+        strategy = self.resolve_strategy(video_info["total_frames"], num_snapshots)
+        self._remove_old_snapshots(snapshot_dir)
+        logger.info(f"Taking {num_snapshots} snapshots with {strategy} strategy")
+
+        extract_method = getattr(self, f"_extract_{strategy}")
+        try:
+            return extract_method(video_path, video_info, num_snapshots, snapshot_dir)
+        except (subprocess.CalledProcessError, OSError, BrokenProcessPool) as e:
+            logger.error(f"Error taking snapshots with {strategy}: {e}, using seek instead")
+            return self._extract_seek(video_path, video_info, num_snapshots, snapshot_dir)
+
+    @staticmethod
+    def _remove_old_snapshots(snapshot_dir: str):
+        """Remove snapshots of an earlier run, so they are not mistaken for new ones"""
+        for file_name in os.listdir(snapshot_dir):
+            if file_name.startswith("snapshot_") and file_name.endswith((".png", ".jpeg")):
+                os.remove(os.path.join(snapshot_dir, file_name))
+
+    def _snapshot_path(self, snapshot_dir: str, index: int):
+        """Path of the nth snapshot"""
+        return os.path.join(snapshot_dir, f"snapshot_{index + 1}.{self.image_format}")
+
+    def _extract_seek(self, video_path: str, video_info: dict, num_snapshots: int,
+                      snapshot_dir: str):
+        """Seek to every snapshot frame and read it"""
+        frame_indices = get_frame_indices(video_info["total_frames"], num_snapshots)
+        return self._save_frames_seek(video_path, frame_indices, snapshot_dir)
+
+    def _extract_sequential(self, video_path: str, video_info: dict, num_snapshots: int,
+                            snapshot_dir: str):
+        """Read the video once, grab every frame and retrieve only the snapshot frames"""
+        frame_indices = get_frame_indices(video_info["total_frames"], num_snapshots)
+        return self._save_frames_sequential(video_path, frame_indices, snapshot_dir)
+
+    def _save_frames_seek(self, video_path: str, frame_indices: list, snapshot_dir: str):
+        """Seek to every frame and save it as a snapshot"""
+        snapshots_filepath = []
+        cap = cv2.VideoCapture(video_path)
+        for i, frame_id in enumerate(frame_indices):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_id)
+            ret, frame = cap.read()
+            if ret:
+                snapshot_filename = self._snapshot_path(snapshot_dir, i)
+                cv2.imwrite(snapshot_filename, frame, IMAGE_PARAMS[self.image_format])
+                logger.debug(f"Saved snapshot: {snapshot_filename} (from frame {frame_id})")
+                snapshots_filepath.append(snapshot_filename)
+            else:
+                logger.error(f"Error reading frame {frame_id} for snapshot {i+1}.")
+        cap.release()
+
+        return snapshots_filepath
+
+    def _save_frames_sequential(self, video_path: str, frame_indices: list, snapshot_dir: str):
+        """Grab frames in order and save only the given frames as snapshots"""
+        snapshots_filepath = []
+        cap = cv2.VideoCapture(video_path)
+        targets = {}
+        for i, frame_id in enumerate(frame_indices):
+            targets.setdefault(int(frame_id), []).append(i)
+
+        last_frame_id = max(targets)
+        frame_id = 0
+        while frame_id <= last_frame_id and cap.grab():
+            if frame_id in targets:
+                ret, frame = cap.retrieve()
+                for i in targets[frame_id] if ret else []:
+                    snapshot_filename = self._snapshot_path(snapshot_dir, i)
+                    cv2.imwrite(snapshot_filename, frame, IMAGE_PARAMS[self.image_format])
+                    logger.debug(f"Saved snapshot: {snapshot_filename} (from frame {frame_id})")
+                    snapshots_filepath.append(snapshot_filename)
+            frame_id += 1
+        cap.release()
+        # Frame count in the container can be more than the frames that can be decoded
+        if len(snapshots_filepath) < len(frame_indices):
+            logger.error(f"Read {len(snapshots_filepath)} of {len(frame_indices)} snapshots.")
+
+        return snapshots_filepath
+
+    def _extract_keyframe(self, video_path: str, video_info: dict, num_snapshots: int,
+                          snapshot_dir: str):
+        """Fast seek with ffmpeg and save the keyframe before every snapshot timestamp"""
+        frame_indices = get_frame_indices(video_info["total_frames"], num_snapshots)
+        return self._save_frames_ffmpeg(video_path, [frame_id / video_info["fps"]
+                                                     for frame_id in frame_indices],
+                                        snapshot_dir)
+
+    def _save_frames_ffmpeg(self, video_path: str, timestamps: list, snapshot_dir: str,
+                            accurate_seek: bool=False):
+        """Save the frame at every timestamp with an ffmpeg input seek. Without accurate seek
+        the keyframe before the timestamp is saved, with it frames are decoded from that
+        keyframe up to the timestamp. Stream urls are read with the request headers"""
+        snapshots_filepath = []
+        seek_args = [] if accurate_seek else ["-noaccurate_seek"]
+        for i, timestamp in enumerate(timestamps):
+            snapshot_filename = self._snapshot_path(snapshot_dir, i)
+            subprocess.run(["ffmpeg", "-v", "error", "-y", "-ss", f"{timestamp:.3f}",
+                            *seek_args, *ffmpeg_input_args(video_path, self.http_headers),
+                            "-frames:v", "1", snapshot_filename],
+                           check=True, capture_output=True)
+            if os.path.exists(snapshot_filename):
+                logger.debug(f"Saved snapshot: {snapshot_filename} (near {timestamp:.1f}s)")
+                snapshots_filepath.append(snapshot_filename)
+            else:
+                logger.error(f"Error reading frame at {timestamp:.1f}s for snapshot {i+1}.")
+
+        return snapshots_filepath
+
+    def _extract_thumbnail(self, video_path: str, video_info: dict, num_snapshots: int,
+                           snapshot_dir: str):
+        """Split the video in segments and save the most representative frame of each segment"""
+        segment_seconds = video_info["duration"] / num_snapshots
+        # Frames are sampled at a lower rate for long segments to keep the batch in memory small
+        sample_fps = min(video_info["fps"], self.thumbnail_batch / segment_seconds)
+        batch_size = max(1, math.floor(segment_seconds * sample_fps))
+        subprocess.run(["ffmpeg", "-v", "error", "-y",
+                        *ffmpeg_input_args(video_path, self.http_headers),
+                        "-vf", f"fps={sample_fps:.4f},thumbnail=n={batch_size}",
+                        "-vsync", "vfr", "-frames:v", str(num_snapshots),
+                        os.path.join(snapshot_dir, f"snapshot_%d.{self.image_format}")],
+                       check=True, capture_output=True)
+
+        snapshots_filepath = [self._snapshot_path(snapshot_dir, i) for i in range(num_snapshots)]
+        return [snapshot_path for snapshot_path in snapshots_filepath
+                if os.path.exists(snapshot_path)]
+
+    def _extract_segmented(self, video_path: str, video_info: dict, num_snapshots: int,
+                           snapshot_dir: str):
+        """Decode time ranges of the snapshot frames in parallel worker processes"""
+        frame_indices = get_frame_indices(video_info["total_frames"], num_snapshots)
+        return self._save_frames_segmented(video_path, frame_indices, snapshot_dir)
+
+    def _save_frames_segmented(self, video_path: str, frame_indices: list, snapshot_dir: str):
+        """Split frames in contiguous time ranges and save every range in a worker process"""
+        targets = sorted((int(frame_id), self._snapshot_path(snapshot_dir, i))
+                         for i, frame_id in enumerate(frame_indices))
+        num_workers = self.get_segment_workers(len(targets))
+        segments = [list(segment) for segment in np.array_split(np.arange(len(targets)),
+                                                                num_workers)]
+        # Spawned workers, forking a process with running threads (streamlit) is not safe
+        with ProcessPoolExecutor(max_workers=num_workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            results = executor.map(save_segment, [video_path] * num_workers,
+                                   [[targets[i] for i in segment] for segment in segments],
+                                   [self.max_sequential_gap] * num_workers,
+                                   [IMAGE_PARAMS[self.image_format]] * num_workers)
+            saved_paths = {path for segment_paths in results for path in segment_paths}
+
+        return [self._snapshot_path(snapshot_dir, i) for i in range(len(frame_indices))
+                if self._snapshot_path(snapshot_dir, i) in saved_paths]
+
+    def _extract_content(self, video_path: str, video_info: dict, num_snapshots: int,
+                         snapshot_dir: str):
+        """Save the most distinct and sharp frames picked by the content frame selector"""
+        frame_indices = self.frame_selector.select(video_path, num_snapshots, video_info["fps"],
+                                                   self.http_headers)
+        if not frame_indices:
+            logger.warning("No frames passed content selection, using equally spaced frames")
+            frame_indices = get_frame_indices(video_info["total_frames"], num_snapshots)
+        frame_indices = [min(frame_id, video_info["total_frames"] - 1)
+                         for frame_id in frame_indices]
+        if "://" in video_path and ffmpeg_available():
+            # Stream was already read once for sampling, only the byte ranges from the keyframe
+            # before every picked frame are fetched again, with the stream request headers
+            return self._save_frames_ffmpeg(video_path, [frame_id / video_info["fps"]
+                                                         for frame_id in frame_indices],
+                                            snapshot_dir, accurate_seek=True)
+        if video_info["total_frames"] / len(frame_indices) <= self.max_sequential_gap:
+            return self._save_frames_sequential(video_path, frame_indices, snapshot_dir)
+
+        return self._save_frames_seek(video_path, frame_indices, snapshot_dir)